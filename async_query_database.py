@@ -0,0 +1,100 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import query_database
+
+# psycopg2 is blocking, so coroutines run the query functions on a thread pool
+# no larger than the connection pool; extra calls wait for a free worker.
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=query_database.POOL_MAX_CONNECTIONS,
+                                       thread_name_prefix='query_database')
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def _run(function, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(function, *args))
+
+
+async def gather_calls(function, arguments):
+    """
+    Runs an async query function once per argument tuple in `arguments`
+    concurrently and returns the results in the same order.
+    """
+    return await asyncio.gather(*(function(*args) for args in arguments))
+
+# --- SELECT Queries ---
+
+async def get_top_rated_movies(min_ratings=1000):
+    return await _run(query_database.get_top_rated_movies, min_ratings)
+
+async def get_most_active_users():
+    return await _run(query_database.get_most_active_users)
+
+async def get_cast_of_movie(movie):
+    return await _run(query_database.get_cast_of_movie, movie)
+
+async def get_director_of_movie(movie):
+    return await _run(query_database.get_director_of_movie, movie)
+
+async def search_movies_by_actor(actor):
+    return await _run(query_database.search_movies_by_actor, actor)
+
+async def find_movies_directed_by_actor(actor):
+    return await _run(query_database.find_movies_directed_by_actor, actor)
+
+async def get_similar_movies(movie, k=10):
+    return await _run(query_database.get_similar_movies, movie, k)
+
+async def search_titles(prefix, limit=10):
+    return await _run(query_database.search_titles, prefix, limit)
+
+async def search_people(prefix, limit=10):
+    return await _run(query_database.search_people, prefix, limit)
+
+async def get_user_by_id(user_id):
+    return await _run(query_database.get_user_by_id, user_id)
+
+async def get_specific_rating(user_id, movie_id):
+    return await _run(query_database.get_specific_rating, user_id, movie_id)
+
+# --- Batch Lookups ---
+
+async def get_cast_of_movies(movie_titles):
+    return await _run(query_database.get_cast_of_movies, movie_titles)
+
+async def get_directors_of_movies(movie_titles):
+    return await _run(query_database.get_directors_of_movies, movie_titles)
+
+async def search_movies_by_actors(actor_names):
+    return await _run(query_database.search_movies_by_actors, actor_names)
+
+async def get_users_by_ids(user_ids):
+    return await _run(query_database.get_users_by_ids, user_ids)
+
+# --- UPDATE, DELETE, and INSERT Queries ---
+
+async def update_user_email(user_id, new_email):
+    return await _run(query_database.update_user_email, user_id, new_email)
+
+async def delete_rating(user_id, movie_id):
+    return await _run(query_database.delete_rating, user_id, movie_id)
+
+async def insert_specific_rating(user_id, movie_id, rating, timestamp):
+    return await _run(query_database.insert_specific_rating, user_id, movie_id, rating, timestamp)
+
+async def upsert_ratings(rows):
+    return await _run(query_database.upsert_ratings, rows)
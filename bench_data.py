@@ -0,0 +1,124 @@
+import os
+import numpy as np
+import pandas as pd
+
+from synthetic_users import FIRST_NAMES, LAST_NAMES
+
+# Row counts of the full Kaggle "The Movies Dataset" files (scale factor 1).
+BASE_MOVIES = 45466
+BASE_USERS = 270896
+BASE_RATINGS = 26024289
+MEAN_CAST_PER_MOVIE = 12
+MEAN_CREW_PER_MOVIE = 10
+
+# A well-known movie and people so benchmark lookups always have something to find.
+TOY_STORY_ID = 862
+ANCHOR_CAST = [('Tom Hanks', 'Woody (voice)'), ('Tim Allen', 'Buzz Lightyear (voice)'),
+               ('Don Rickles', 'Mr. Potato Head (voice)')]
+ANCHOR_DIRECTOR = 'John Lasseter'
+
+CHARACTERS = ('Himself', 'Herself', 'Narrator', "O'Brien", 'The "Kid"', 'Detective', 'Doctor', 'Mother', 'Father',
+              'Sheriff', 'Captain', 'Soldier', 'Waitress', 'Reporter', 'Bartender')
+JOBS = (('Directing', 'Director'), ('Writing', 'Screenplay'), ('Writing', 'Writer'), ('Production', 'Producer'),
+        ('Sound', 'Original Music Composer'), ('Camera', 'Director of Photography'), ('Editing', 'Editor'))
+
+
+def _zipf_weights(count, exponent, rng):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _people(count, rng):
+    first = np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), count)]
+    last = np.array(LAST_NAMES)[rng.integers(0, len(LAST_NAMES), count)]
+    initials = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))[rng.integers(0, 26, count)]
+    return [f"{f} {i}. {l}" for f, i, l in zip(first.tolist(), initials.tolist(), last.tolist())]
+
+
+def _credits_row(movie_id, people, weights, rng):
+    cast_size = rng.poisson(MEAN_CAST_PER_MOVIE)
+    crew_size = rng.poisson(MEAN_CREW_PER_MOVIE)
+    cast_people = rng.choice(len(people), size=cast_size, p=weights)
+    crew_people = rng.choice(len(people), size=crew_size, p=weights)
+
+    cast = [{'cast_id': order + 1, 'character': CHARACTERS[rng.integers(len(CHARACTERS))],
+             'credit_id': f"{movie_id:08x}{order:04x}c", 'gender': int(rng.integers(0, 3)), 'id': int(person),
+             'name': people[person], 'order': order,
+             'profile_path': None if rng.random() < 0.3 else f"/{person:x}.jpg"}
+            for order, person in enumerate(cast_people.tolist())]
+    crew = []
+    for number, person in enumerate(crew_people.tolist()):
+        department, job = JOBS[0] if number == 0 else JOBS[rng.integers(len(JOBS))]
+        crew.append({'credit_id': f"{movie_id:08x}{number:04x}r", 'department': department,
+                     'gender': int(rng.integers(0, 3)), 'id': int(person), 'job': job, 'name': people[person],
+                     'profile_path': None if rng.random() < 0.5 else f"/{person:x}.jpg"})
+
+    if movie_id == TOY_STORY_ID:
+        cast = [{'cast_id': order + 1, 'character': character, 'credit_id': f"anchor{order}", 'gender': 2,
+                 'id': order, 'name': name, 'order': order, 'profile_path': None}
+                for order, (name, character) in enumerate(ANCHOR_CAST)] + cast
+        crew = [{'credit_id': 'anchor-director', 'department': 'Directing', 'gender': 2, 'id': 7879,
+                 'job': 'Director', 'name': ANCHOR_DIRECTOR, 'profile_path': None}] + crew[1:]
+    elif rng.random() < 0.001:
+        crew.append({'credit_id': f"{movie_id:08x}hanks", 'department': 'Directing', 'gender': 2, 'id': 31,
+                     'job': 'Director', 'name': 'Tom Hanks', 'profile_path': None})
+    return repr(cast), repr(crew)
+
+
+def generate_dataset(directory, scale, seed=42):
+    """
+    Writes credits.csv, ratings.csv and movies_metadata.csv shaped like the
+    Kaggle files, at `scale` times the full dataset's row counts, into
+    `directory`. The same scale and seed always produce the same files.
+    Returns the paths and row counts.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    movie_count = max(20, int(BASE_MOVIES * scale))
+    user_count = max(20, int(BASE_USERS * scale))
+    rating_count = max(100, int(BASE_RATINGS * scale))
+
+    movie_ids = rng.choice(np.arange(1, movie_count * 10), size=movie_count, replace=False)
+    movie_ids[0] = TOY_STORY_ID
+    movie_ids = np.unique(movie_ids)
+
+    metadata_path = os.path.join(directory, 'movies_metadata.csv')
+    titles = [('Toy Story' if movie_id == TOY_STORY_ID else f"Movie {movie_id}") for movie_id in movie_ids.tolist()]
+    metadata = pd.DataFrame({'adult': 'False', 'id': movie_ids.astype(str), 'title': titles})
+    metadata.loc[len(metadata)] = ['False', '1997-08-20', 'Malformed id row']
+    metadata.to_csv(metadata_path, index=False)
+
+    people = _people(max(50, movie_count * 4), rng)
+    people_weights = _zipf_weights(len(people), 1.1, rng)
+    credits_path = os.path.join(directory, 'credits.csv')
+    credits = [_credits_row(movie_id, people, people_weights, rng) for movie_id in movie_ids.tolist()]
+    pd.DataFrame({'cast': [cast for cast, _ in credits], 'crew': [crew for _, crew in credits],
+                  'id': movie_ids}).to_csv(credits_path, index=False)
+
+    # Ratings hit the credits movies plus some ids only known to ratings.csv,
+    # with skewed popularity for both movies and users. rated_movies is sorted.
+    rated_movies = np.concatenate([movie_ids, movie_ids.max() + 1 + np.arange(max(1, movie_count // 10))])
+    user_ids = rng.choice(user_count, size=rating_count, p=_zipf_weights(user_count, 0.8, rng)) + 1
+    movie_choice = rng.choice(len(rated_movies), size=rating_count, p=_zipf_weights(len(rated_movies), 0.9, rng))
+    pairs = np.unique(user_ids.astype(np.int64) * (1 << 32) + rated_movies[movie_choice])
+    bias = rng.normal(0, 0.6, size=len(rated_movies))
+    pair_movies = (pairs & 0xFFFFFFFF).astype(np.int64)
+    movie_bias = bias[np.searchsorted(rated_movies, pair_movies)]
+    stars = np.clip(np.rint((3.5 + movie_bias + rng.normal(0, 1, len(pairs))) * 2) / 2, 0.5, 5.0)
+    ratings = pd.DataFrame({
+        'userId': pairs >> 32,
+        'movieId': pair_movies,
+        'rating': stars,
+        'timestamp': rng.integers(789652009, 1501829870, size=len(pairs)),
+    })
+    ratings_path = os.path.join(directory, 'ratings.csv')
+    ratings.to_csv(ratings_path, index=False, float_format='%.1f')
+
+    return {
+        'credits': (credits_path, len(movie_ids)),
+        'ratings': (ratings_path, len(ratings)),
+        'metadata': (metadata_path, len(movie_ids)),
+        'users': user_count,
+        'rated_users': len(np.unique(ratings['userId'])),
+    }
@@ -0,0 +1,342 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import psycopg2
+from psycopg2 import sql
+
+import credits
+import query_database
+import ratings
+import schema_migrations
+import similar_movies
+import update_movie_titles
+from bench_data import generate_dataset
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILE = os.path.join(REPO_DIR, 'schema.sql')
+DEFAULT_SCALES = (0.01, 0.1, 1.0)
+QUERY_RUNS = 50
+WARMUP_RUNS = 3
+# Seconds a load stage may run before it is killed and the benchmark fails.
+STAGE_TIMEOUT = 4 * 3600
+# Characters of a failed stage's output shown in the error.
+OUTPUT_TAIL = 2000
+
+# Every public query function with the arguments it is timed with. Write
+# functions are paired with their inverse so the database is left unchanged.
+# All of them return None on error, which fails the benchmark.
+QUERY_BENCHMARKS = {
+    'get_top_rated_movies': lambda: query_database.get_top_rated_movies(),
+    'get_most_active_users': lambda: query_database.get_most_active_users(),
+    'get_cast_of_movie': lambda: query_database.get_cast_of_movie('Toy Story'),
+    'get_director_of_movie': lambda: query_database.get_director_of_movie('Toy Story'),
+    'search_movies_by_actor': lambda: query_database.search_movies_by_actor('Tom Hanks'),
+    'find_movies_directed_by_actor': lambda: query_database.find_movies_directed_by_actor('Tom Hanks'),
+    'get_similar_movies': lambda: query_database.get_similar_movies('Toy Story'),
+    'search_titles': lambda: query_database.search_titles('toy stroy'),
+    'get_user_by_id': lambda: query_database.get_user_by_id(1),
+    'get_specific_rating': lambda: query_database.get_specific_rating(1, 862),
+    'get_cast_of_movies': lambda: query_database.get_cast_of_movies(['Toy Story', 'Movie 2', 'Movie 3']),
+    'get_directors_of_movies': lambda: query_database.get_directors_of_movies(['Toy Story', 'Movie 2', 'Movie 3']),
+    'search_movies_by_actors': lambda: query_database.search_movies_by_actors(['Tom Hanks', 'Tim Allen']),
+    'get_users_by_ids': lambda: query_database.get_users_by_ids(list(range(1, 101))),
+    'update_user_email': lambda: query_database.update_user_email(1, 'bench.user1@example.com'),
+    'insert_and_delete_rating': lambda: (query_database.insert_specific_rating(1, 862, 4.5, 1425941529),
+                                         query_database.delete_rating(1, 862)),
+}
+
+
+# Counts the managed indexes the index rebuild stage creates.
+MANAGED_INDEXES_SQL = "SELECT COUNT(*) FROM pg_indexes WHERE indexname IN ({})".format(
+    ', '.join(f"'{name}'" for name in schema_migrations.MANAGED_INDEXES))
+
+
+def _load_schema_creation():
+    spec = importlib.util.spec_from_file_location('schema_creation', os.path.join(REPO_DIR, 'schema-creation.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+schema_creation = _load_schema_creation()
+MODULE_CONFIGS = [credits.DB_CONFIG, ratings.DB_CONFIG, update_movie_titles.DB_CONFIG, query_database.DB_CONFIG,
+                  schema_migrations.DB_CONFIG, similar_movies.DB_CONFIG, schema_creation.DB_CONFIG]
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@contextlib.contextmanager
+def throwaway_postgres(pg_bin=None, database='movie_db_bench'):
+    """
+    Yields a DB_CONFIG for a disposable database. With `pg_bin` (a directory
+    containing initdb and pg_ctl) a temporary cluster is created, started on a
+    free port and deleted afterwards. Otherwise a throwaway database is
+    created on the server in query_database.DB_CONFIG and dropped afterwards.
+    """
+    if pg_bin:
+        workdir = tempfile.mkdtemp(prefix='movie_bench_')
+        data_dir = os.path.join(workdir, 'data')
+        port = _free_port()
+        subprocess.run([os.path.join(pg_bin, 'initdb'), '-D', data_dir, '-U', 'bench', '--auth=trust'],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([os.path.join(pg_bin, 'pg_ctl'), '-D', data_dir, '-w', '-l', os.path.join(workdir, 'log'),
+                        '-o', f"-p {port} -k {workdir} -c listen_addresses=''", 'start'],
+                       check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield {'user': 'bench', 'host': workdir, 'port': str(port), 'database': database}
+        finally:
+            subprocess.run([os.path.join(pg_bin, 'pg_ctl'), '-D', data_dir, '-m', 'immediate', 'stop'],
+                           stdout=subprocess.DEVNULL)
+            shutil.rmtree(workdir, ignore_errors=True)
+        return
+
+    config = dict(query_database.DB_CONFIG, database=f"{database}_{os.getpid()}")
+    try:
+        yield config
+    finally:
+        query_database.close_pool()
+        admin = psycopg2.connect(**dict(config, database='postgres'))
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(config['database'])))
+        admin.close()
+
+
+def _use_database(config):
+    for module_config in MODULE_CONFIGS:
+        module_config.clear()
+        module_config.update(config)
+    query_database.close_pool()
+
+
+def _stage_worker(function, results):
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            function()
+    except Exception as e:
+        results.put({'error': repr(e), 'output': output.getvalue()[-OUTPUT_TAIL:]})
+        return
+    results.put({'seconds': time.perf_counter() - start,
+                 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                 'output': output.getvalue()[-OUTPUT_TAIL:]})
+
+
+def check_counts(checks):
+    """
+    Runs each (label, count query, expected count) of `checks` on the
+    benchmark database; an expected count of None means at least one row.
+    Returns {label: actual count} for the checks that failed.
+    """
+    conn = psycopg2.connect(**query_database.DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            failed = {}
+            for label, query, expected in checks:
+                cursor.execute(query)
+                count = cursor.fetchone()[0]
+                if (count == 0) if expected is None else (count != expected):
+                    failed[label] = count
+    finally:
+        conn.close()
+    return failed
+
+
+def run_stage(function, rows=None, checks=(), timeout=STAGE_TIMEOUT):
+    """
+    Runs one load stage in a child process and returns its wall time,
+    throughput and peak RSS. The loaders report errors by printing them, so
+    the stage only counts as done once every count in `checks` (see
+    check_counts()) holds; raises RuntimeError, with the tail of the stage's
+    output, when it does not, or when the child dies or runs past `timeout`.
+    """
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=_stage_worker, args=(function, results))
+    process.start()
+    deadline = time.monotonic() + timeout
+    measured = None
+    while measured is None:
+        # A child that is dead before the wait has put all it ever will.
+        alive = process.is_alive()
+        try:
+            measured = results.get(timeout=1)
+        except queue.Empty:
+            if not alive or time.monotonic() > deadline:
+                process.kill()
+                process.join()
+                reason = 'timed out' if alive else f"exited with code {process.exitcode}"
+                raise RuntimeError(f"Stage {reason} without reporting a result.")
+    process.join()
+    output = measured.pop('output')
+    if 'error' in measured:
+        raise RuntimeError(f"Stage raised {measured['error']}. Output:\n{output}")
+    if process.exitcode != 0:
+        raise RuntimeError(f"Stage exited with code {process.exitcode}. Output:\n{output}")
+    failed = check_counts(checks)
+    if failed:
+        expected = {label: 'at least 1' if count is None else count for label, _, count in checks if label in failed}
+        raise RuntimeError(f"Stage left {failed} rows, expected {expected}. Output:\n{output}")
+    if rows is not None:
+        measured['rows'] = rows
+        measured['rows_per_sec'] = rows / measured['seconds'] if measured['seconds'] else 0.0
+    return measured
+
+
+def time_queries(runs=QUERY_RUNS, warmup=WARMUP_RUNS):
+    """
+    Times every function in QUERY_BENCHMARKS and returns p50/p95/p99/mean
+    latencies in milliseconds. Raises RuntimeError when a call fails.
+    """
+    timings = {}
+    for name, call in QUERY_BENCHMARKS.items():
+        latencies = []
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for number in range(warmup + runs):
+                start = time.perf_counter()
+                result = call()
+                if any(part is None for part in (result if isinstance(result, tuple) else (result,))):
+                    raise RuntimeError(f"{name} failed on run {number + 1}. Output:\n{output.getvalue()[-OUTPUT_TAIL:]}")
+                if number >= warmup:
+                    latencies.append((time.perf_counter() - start) * 1000)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        timings[name] = {'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+                         'mean_ms': round(float(np.mean(latencies)), 3), 'runs': runs}
+    return timings
+
+
+def benchmark_scale(scale, data_dir, pg_bin=None, runs=QUERY_RUNS):
+    print(f"\n=== Scale factor {scale} ===")
+    print("Generating synthetic dataset...")
+    dataset = generate_dataset(os.path.join(data_dir, f"sf{scale}"), scale)
+    credits.CREDITS_FILE, movie_count = dataset['credits']
+    ratings.RATINGS_FILE, rating_count = dataset['ratings']
+    update_movie_titles.METADATA_FILE, title_count = dataset['metadata']
+
+    with throwaway_postgres(pg_bin) as config:
+        _use_database(config)
+        stages = {}
+        print("Creating schema (indexes deferred)...")
+        stages['schema'] = run_stage(lambda: schema_creation.run_migrations(SCHEMA_FILE, defer_indexes=True),
+                                     checks=[('schema_migrations', "SELECT COUNT(*) FROM schema_migrations", None)])
+        print("Loading credits...")
+        stages['credits'] = run_stage(lambda: credits.populate_data_copy(use_cache=False), movie_count,
+                                      [('movies', "SELECT COUNT(*) FROM movies", movie_count),
+                                       ('cast', 'SELECT COUNT(*) FROM "cast"', None),
+                                       ('crew', "SELECT COUNT(*) FROM crew", None)])
+        print("Loading ratings...")
+        stages['ratings'] = run_stage(lambda: ratings.populate_users_and_ratings_streaming(), rating_count,
+                                      [('ratings', "SELECT COUNT(*) FROM ratings", rating_count),
+                                       ('user_rating_stats', "SELECT COUNT(*) FROM user_rating_stats",
+                                        dataset['rated_users'])])
+        print("Updating titles...")
+        stages['titles'] = run_stage(update_movie_titles.sync_movie_titles, title_count,
+                                     [('titled movies', "SELECT COUNT(*) FROM movies WHERE title NOT LIKE 'Title for movie %'",
+                                       title_count)])
+        print("Rebuilding indexes...")
+        stages['indexes'] = run_stage(lambda: schema_creation.run_migrations(SCHEMA_FILE, rebuild_indexes=True),
+                                      checks=[('managed indexes', MANAGED_INDEXES_SQL, len(schema_migrations.MANAGED_INDEXES))])
+        print("Computing similar movies...")
+        stages['neighbors'] = run_stage(similar_movies.build_neighbors,
+                                        checks=[('movie_neighbors', "SELECT COUNT(*) FROM movie_neighbors", None)])
+
+        print(f"Timing query functions ({runs} runs each)...")
+        queries = time_queries(runs)
+        conn = psycopg2.connect(**config)
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW server_version")
+            server_version = cursor.fetchone()[0]
+        conn.close()
+        query_database.close_pool()
+
+    return {'rows': {'movies': movie_count, 'ratings': rating_count, 'users': dataset['users']},
+            'load': stages, 'queries': queries, 'server_version': server_version}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, output=None, pg_bin=None, runs=QUERY_RUNS, data_dir=None):
+    """
+    Benchmarks every scale factor and writes a JSON report; returns the
+    report. The CSVs are generated into `data_dir`, or into a temporary
+    directory that is deleted afterwards.
+    """
+    commit = _git_commit()
+    report = {'commit': commit, 'python': platform.python_version(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'scales': {}}
+    with contextlib.ExitStack() as stack:
+        if data_dir is None:
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='movie_bench_data_'))
+        for scale in scales:
+            report['scales'][str(scale)] = benchmark_scale(scale, data_dir, pg_bin, runs)
+
+    output = output or os.path.join(REPO_DIR, 'bench_results', f"report-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+    print(f"\nReport written to '{output}'.")
+    return report
+
+
+def compare_reports(old_path, new_path):
+    """Prints the relative change of every load time and query p50/p95 between two reports."""
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print(f"{old['commit']} -> {new['commit']}")
+    for scale, new_scale in new['scales'].items():
+        old_scale = old['scales'].get(scale)
+        if old_scale is None:
+            continue
+        print(f"\nScale factor {scale}:")
+        metrics = [(f"load {stage} seconds", old_scale['load'][stage]['seconds'], values['seconds'])
+                   for stage, values in new_scale['load'].items() if stage in old_scale['load']]
+        metrics += [(f"{name} {percentile}", old_scale['queries'][name][percentile], values[percentile])
+                    for name, values in new_scale['queries'].items() if name in old_scale['queries']
+                    for percentile in ('p50_ms', 'p95_ms')]
+        for label, before, after in metrics:
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"  {label:<45} {before:>10.3f} -> {after:>10.3f} ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the loaders and query functions on synthetic data.")
+    parser.add_argument('--scale', type=float, nargs='+', default=list(DEFAULT_SCALES),
+                        help="Scale factors relative to the full dataset, e.g. 0.01 0.1 1.")
+    parser.add_argument('--runs', type=int, default=QUERY_RUNS, help="Timed runs per query function.")
+    parser.add_argument('--output', help="Report path (default: bench_results/report-<commit>.json).")
+    parser.add_argument('--pg-bin', help="Directory with initdb/pg_ctl to run a temporary PostgreSQL cluster; "
+                                         "without it a throwaway database is created on the configured server.")
+    parser.add_argument('--data-dir', help="Where to write the generated CSVs (default: a temporary directory, "
+                                           "deleted afterwards).")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two reports and exit.")
+    args = parser.parse_args()
+    if args.compare:
+        compare_reports(*args.compare)
+        sys.exit(0)
+    run_benchmarks(args.scale, args.output, args.pg_bin, args.runs, args.data_dir)
@@ -0,0 +1,31 @@
+import os
+
+
+def source_name(path):
+    return os.path.basename(path)
+
+
+def completed_ranges(cursor, path, sha256, unit):
+    """The (range_start, range_end) chunks of `path` (with content `sha256`) already committed."""
+    cursor.execute("""
+        SELECT range_start, range_end FROM ingest_progress
+        WHERE source = %s AND sha256 = %s AND unit = %s
+    """, (source_name(path), sha256, unit))
+    return {(start, end) for start, end in cursor.fetchall()}
+
+
+def mark_completed(cursor, path, sha256, unit, range_start, range_end, row_count):
+    """
+    Records a chunk as loaded. Call it in the transaction that loads the
+    chunk, so the progress row commits (or rolls back) together with the data.
+    """
+    cursor.execute("""
+        INSERT INTO ingest_progress (source, sha256, unit, range_start, range_end, row_count)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT DO NOTHING
+    """, (source_name(path), sha256, unit, range_start, range_end, row_count))
+
+
+def clear_progress(cursor, path):
+    """Forgets every checkpoint of `path`, so the next run loads it from the start."""
+    cursor.execute("DELETE FROM ingest_progress WHERE source = %s", (source_name(path),))
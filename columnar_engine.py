@@ -0,0 +1,512 @@
+import numbers
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from snapshot import MANIFEST_FILE, Snapshot
+
+# Tables (and their columns) held by the engine.
+TABLE_COLUMNS = {
+    'movies': ('id', 'title'),
+    'people': ('id', 'name', 'profile_path'),
+    'jobs': ('id', 'name'),
+    'departments': ('id', 'name'),
+    'cast': ('movie_id', 'cast_id', 'character_name', 'credit_id', 'gender', 'person_id', 'cast_order'),
+    'crew': ('movie_id', 'credit_id', 'department_id', 'gender', 'job_id', 'person_id'),
+    'users': ('id', 'name', 'email'),
+    'ratings': ('user_id', 'movie_id', 'rating', 'timestamp'),
+}
+STRING_COLUMNS = {'title', 'character_name', 'credit_id', 'name', 'profile_path', 'email'}
+# Nullable references to the people/jobs/departments dimensions, held as
+# int64 with NULL_ID for NULL so they can be indexed.
+ID_COLUMNS = {'person_id', 'job_id', 'department_id'}
+NULL_ID = -1
+# Compact dtypes for the big ratings columns; everything else keeps what pandas infers.
+RATINGS_DTYPES = {'user_id': np.int32, 'movie_id': np.int32, 'rating': np.float64, 'timestamp': np.int64}
+
+# NULL marker in the table CSVs, so NULL and the empty string stay distinct.
+NULL_MARKER = '\\N'
+CAST_LIMIT = 15
+
+
+def _quoted(table):
+    return f'"{table}"' if table == 'cast' else table
+
+
+def export_tables(directory, db_config):
+    """
+    Dumps every table in TABLE_COLUMNS from PostgreSQL into `directory` as
+    <table>.csv (with a header, NULL written as \\N) using COPY TO. The
+    directory can then be loaded with ColumnarEngine.from_csv_dir() on a
+    machine without a database.
+    """
+    os.makedirs(directory, exist_ok=True)
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cursor:
+            for table, columns in TABLE_COLUMNS.items():
+                print(f"  - Exporting {table}...")
+                with open(os.path.join(directory, f"{table}.csv"), 'w') as table_file:
+                    cursor.copy_expert(f"COPY (SELECT {', '.join(columns)} FROM {_quoted(table)}) TO STDOUT "
+                                       f"WITH (FORMAT csv, HEADER, NULL '{NULL_MARKER}')", table_file)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def _read_table(path, table):
+    columns = TABLE_COLUMNS[table]
+    dtypes = {column: object for column in columns if column in STRING_COLUMNS}
+    if table == 'ratings':
+        dtypes.update(RATINGS_DTYPES)
+    frame = pd.read_csv(path, usecols=list(columns), dtype=dtypes, na_values=[NULL_MARKER], keep_default_na=False)
+    return _frame_arrays(frame, table)
+
+
+def _frame_arrays(frame, table):
+    arrays = {}
+    for column in TABLE_COLUMNS[table]:
+        values = frame[column]
+        if column in STRING_COLUMNS:
+            values = np.where(values.isna().to_numpy(), None, values.to_numpy(dtype=object)).astype(object)
+        elif column in ID_COLUMNS:
+            values = values.fillna(NULL_ID).to_numpy(dtype=np.int64, copy=True)
+        else:
+            values = values.to_numpy(copy=True)
+        arrays[column] = values
+    return arrays
+
+
+class _SortedIndex:
+    """Sorted index over one column: equality lookups by binary search."""
+
+    def __init__(self, values):
+        self.order = np.argsort(values, kind='stable')
+        self.keys = values[self.order]
+
+    def positions(self, value):
+        low = np.searchsorted(self.keys, value, side='left')
+        high = np.searchsorted(self.keys, value, side='right')
+        return self.order[low:high]
+
+    def positions_many(self, values):
+        values = np.asarray(values)
+        if not len(values):
+            return np.empty(0, dtype=np.intp)
+        low = np.searchsorted(self.keys, values, side='left')
+        high = np.searchsorted(self.keys, values, side='right')
+        return np.concatenate([self.order[start:stop] for start, stop in zip(low.tolist(), high.tolist())])
+
+    def unique_rows(self, values):
+        """Row of each value in a unique column, or -1 where it is missing."""
+        values = np.asarray(values)
+        if not len(self.keys):
+            return np.full(len(values), -1, dtype=np.intp)
+        found = np.minimum(np.searchsorted(self.keys, values), len(self.keys) - 1)
+        return np.where(self.keys[found] == values, self.order[found], -1)
+
+
+def _hash_index(keys):
+    """Hash index: key -> array of row positions. None keys are left out."""
+    return pd.Series(np.arange(len(keys))).groupby(pd.Series(keys), sort=False, dropna=True).indices
+
+
+def _lower(values):
+    return np.array([value.lower() if value is not None else None for value in values], dtype=object)
+
+
+def _rating_keys(user_ids, movie_ids):
+    return (np.asarray(user_ids, dtype=np.int64) << 32) | np.asarray(movie_ids, dtype=np.int64)
+
+
+class ColumnarEngine:
+    """
+    In-process, read-mostly copy of the movie database that answers the same
+    functions as query_database from NumPy column arrays: hash indexes on
+    lower-cased titles and on people's names, sorted indexes on ids, and
+    per-movie / per-user rating totals kept current by the write functions
+    (mirroring the rollup tables). Results have the columns and values of
+    the SQL path; rows tied under an ORDER BY may come back in a different
+    order, and text sorts by code point rather than the database collation.
+    """
+
+    def __init__(self, tables):
+        self.movies = tables['movies']
+        self.people = tables['people']
+        self.jobs = tables['jobs']
+        self.departments = tables['departments']
+        self.cast = tables['cast']
+        self.crew = tables['crew']
+        self.users = tables['users']
+        self.ratings = {column: np.asarray(tables['ratings'][column], dtype=dtype)
+                        for column, dtype in RATINGS_DTYPES.items()}
+        self._build_indexes()
+
+    @classmethod
+    def from_csv_dir(cls, directory):
+        """Loads the <table>.csv files written by export_tables()."""
+        print(f"Loading tables from '{directory}' into the columnar engine...")
+        return cls({table: _read_table(os.path.join(directory, f"{table}.csv"), table) for table in TABLE_COLUMNS})
+
+    @classmethod
+    def from_snapshot(cls, directory):
+        """
+        Loads a snapshot.py snapshot. The ratings columns stay memory-mapped
+        instead of being read into memory; the other tables are decoded.
+        """
+        print(f"Loading snapshot '{directory}' into the columnar engine...")
+        data = Snapshot(directory)
+        tables = {'ratings': data.table('ratings', TABLE_COLUMNS['ratings'])}
+        for table, columns in TABLE_COLUMNS.items():
+            if table != 'ratings':
+                frame = pd.DataFrame(data.table(table, columns))
+                # Integers come back as int64, as from the table CSVs.
+                for column in columns:
+                    if frame[column].dtype.kind in 'iu':
+                        frame[column] = frame[column].astype(np.int64)
+                tables[table] = _frame_arrays(frame, table)
+        return cls(tables)
+
+    @classmethod
+    def from_directory(cls, directory):
+        """from_snapshot() if `directory` holds a snapshot, else from_csv_dir()."""
+        if os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            return cls.from_snapshot(directory)
+        return cls.from_csv_dir(directory)
+
+    @classmethod
+    def from_database(cls, db_config):
+        """Copies every table out of PostgreSQL (through a temporary export) into a new engine."""
+        with tempfile.TemporaryDirectory(prefix='columnar_engine_') as directory:
+            print(f"Exporting database '{db_config['database']}' for the columnar engine...")
+            export_tables(directory, db_config)
+            return cls.from_csv_dir(directory)
+
+    @classmethod
+    def from_frames(cls, movies, people, jobs, departments, cast, crew, users, ratings):
+        """Builds an engine from one DataFrame per table (e.g. fixtures in tests)."""
+        frames = {'movies': movies, 'people': people, 'jobs': jobs, 'departments': departments, 'cast': cast,
+                  'crew': crew, 'users': users, 'ratings': ratings}
+        return cls({table: _frame_arrays(frame, table) for table, frame in frames.items()})
+
+    def _build_indexes(self):
+        self._movie_ids = _SortedIndex(self.movies['id'])
+        self._movies_by_title = _hash_index(_lower(self.movies['title']))
+        self._user_ids = _SortedIndex(self.users['id'])
+        self._person_ids = _SortedIndex(self.people['id'])
+        self._people_by_name = _hash_index(self.people['name'])
+        self._job_ids = _SortedIndex(self.jobs['id'])
+        directors = self.jobs['id'][self.jobs['name'] == 'Director']
+        self._director_job_id = directors[0] if len(directors) else NULL_ID - 1
+        self._cast_by_movie = _SortedIndex(self.cast['movie_id'])
+        self._cast_by_person = _SortedIndex(self.cast['person_id'])
+        self._crew_by_movie = _SortedIndex(self.crew['movie_id'])
+        self._crew_by_person = _SortedIndex(self.crew['person_id'])
+
+        ratings = self.ratings
+        self._rating_keys = _SortedIndex(_rating_keys(ratings['user_id'], ratings['movie_id']))
+        self._deleted = np.zeros(len(ratings['user_id']), dtype=bool)
+        self._added = []
+        # (rating matrix, its transpose, movie id of each row) for get_similar_movies(), built on first use.
+        self._neighbor_matrix = None
+
+        # Rollups: COUNT(rating) and SUM(rating) per movie row, COUNT(*) per user row.
+        movie_rows = self._movie_ids.unique_rows(ratings['movie_id'])
+        rated = (movie_rows >= 0) & ~np.isnan(ratings['rating'])
+        self.movie_num_ratings = np.bincount(movie_rows[rated], minlength=len(self.movies['id'])).astype(np.int64)
+        self.movie_rating_sum = np.bincount(movie_rows[rated], weights=ratings['rating'][rated],
+                                            minlength=len(self.movies['id']))
+        user_rows = self._user_ids.unique_rows(ratings['user_id'])
+        self.user_num_ratings = np.bincount(user_rows[user_rows >= 0], minlength=len(self.users['id'])).astype(np.int64)
+
+    # --- Helpers ---
+
+    @staticmethod
+    def _lookup(index, values, ids):
+        """values[row of id] for each id (a LEFT JOIN on a dimension's primary key); None where there is no row."""
+        rows = index.unique_rows(ids)
+        found = rows >= 0
+        result = np.full(len(rows), None, dtype=object)
+        result[found] = values[rows[found]]
+        return result
+
+    def _person_names(self, person_ids):
+        return self._lookup(self._person_ids, self.people['name'], person_ids)
+
+    def _person_credits(self, by_person, actor):
+        """Rows of cast or crew crediting person id `actor`, or anyone named `actor` (resolved to ids once)."""
+        if isinstance(actor, numbers.Integral):
+            person_ids = [actor]
+        else:
+            person_ids = self.people['id'][self._people_by_name.get(actor, np.empty(0, dtype=np.intp))]
+        return np.sort(by_person.positions_many(person_ids))
+
+    def _title_rows(self, movie):
+        """Rows of movie id `movie`, or of every movie titled `movie` (ignoring case)."""
+        if isinstance(movie, numbers.Integral):
+            return self._movie_ids.positions(movie)
+        return self._movies_by_title.get(movie.lower(), np.empty(0, dtype=np.intp))
+
+    def _live_ratings(self):
+        alive = ~self._deleted
+        columns = {column: values[alive] for column, values in self.ratings.items()}
+        if self._added:
+            added = np.array(self._added, dtype=np.float64).T
+            for position, (column, dtype) in enumerate(RATINGS_DTYPES.items()):
+                columns[column] = np.concatenate([columns[column], added[position].astype(dtype)])
+        return columns
+
+    def _cast_for_movies(self, movie_rows):
+        rows = self._cast_by_movie.positions_many(self.movies['id'][movie_rows])
+        rows = rows[np.argsort(self.cast['cast_order'][rows].astype(np.float64), kind='stable')]
+        return rows[:CAST_LIMIT]
+
+    def _directors_for_movies(self, movie_rows):
+        rows = self._crew_by_movie.positions_many(self.movies['id'][movie_rows])
+        return rows[self.crew['job_id'][rows] == self._director_job_id]
+
+    def _titles_of(self, movie_ids):
+        """Title of each movie id, and a mask of the ids that exist in movies (an inner join)."""
+        rows = self._movie_ids.unique_rows(movie_ids)
+        found = rows >= 0
+        return self.movies['title'][rows[found]], found
+
+    # --- SELECT Queries ---
+
+    def get_top_rated_movies(self, min_ratings=1000):
+        rated = self.movie_num_ratings > 0
+        totals = pd.DataFrame({'title': self.movies['title'][rated], 'num_ratings': self.movie_num_ratings[rated],
+                               'rating_sum': self.movie_rating_sum[rated]})
+        totals = totals.groupby('title', dropna=False, sort=False).sum()
+        totals = totals[totals['num_ratings'] > min_ratings]
+        result = pd.DataFrame({'title': totals.index.to_numpy(), 'num_ratings': totals['num_ratings'].to_numpy(),
+                               'avg_rating': (totals['rating_sum'] / totals['num_ratings']).to_numpy()})
+        return result.sort_values('avg_rating', ascending=False, kind='stable').head(10).reset_index(drop=True)
+
+    def get_most_active_users(self):
+        active = np.flatnonzero(self.user_num_ratings > 0)
+        top = active[np.argsort(-self.user_num_ratings[active], kind='stable')[:10]]
+        return pd.DataFrame({'name': self.users['name'][top], 'email': self.users['email'][top],
+                             'ratings_count': self.user_num_ratings[top]})
+
+    def get_cast_of_movie(self, movie):
+        rows = self._cast_for_movies(self._title_rows(movie))
+        return pd.DataFrame({'name': self._person_names(self.cast['person_id'][rows]),
+                             'character_name': self.cast['character_name'][rows],
+                             'cast_order': self.cast['cast_order'][rows]})
+
+    def get_director_of_movie(self, movie):
+        rows = self._directors_for_movies(self._title_rows(movie))
+        return pd.DataFrame({'name': self._person_names(self.crew['person_id'][rows]),
+                             'job': self._lookup(self._job_ids, self.jobs['name'], self.crew['job_id'][rows])})
+
+    def search_movies_by_actor(self, actor):
+        rows = self._person_credits(self._cast_by_person, actor)
+        titles, found = self._titles_of(self.cast['movie_id'][rows])
+        result = pd.DataFrame({'title': titles, 'character_name': self.cast['character_name'][rows[found]]})
+        return result.sort_values('title', kind='stable', na_position='last').reset_index(drop=True)
+
+    def find_movies_directed_by_actor(self, actor):
+        rows = self._person_credits(self._crew_by_person, actor)
+        rows = rows[self.crew['job_id'][rows] == self._director_job_id]
+        titles, _ = self._titles_of(self.crew['movie_id'][rows])
+        return pd.DataFrame({'title': titles})
+
+    def get_similar_movies(self, movie, k=10):
+        """
+        Scores `movie` against every movie from the live ratings, as
+        similar_movies.build_neighbors() does, instead of reading stored lists.
+        """
+        import similar_movies
+        if self._neighbor_matrix is None:
+            live = self._live_ratings()
+            rated = ~np.isnan(live['rating'])
+            matrix, movie_ids = similar_movies.rating_matrix(live['user_id'][rated], live['movie_id'][rated],
+                                                             live['rating'][rated])
+            self._neighbor_matrix = (matrix, matrix.T.tocsr(), movie_ids)
+        matrix, transposed, movie_ids = self._neighbor_matrix
+        query_ids = self.movies['id'][self._title_rows(movie)]
+        rows = np.searchsorted(movie_ids, query_ids)
+        rows = rows[(rows < len(movie_ids)) & (movie_ids[np.minimum(rows, len(movie_ids) - 1)] == query_ids)]
+        if not len(rows):
+            return pd.DataFrame({'movie_id': np.empty(0, dtype=np.int64), 'title': np.empty(0, dtype=object),
+                                 'similarity': np.empty(0)})
+        scores = similar_movies.similarities(matrix, transposed, rows).max(axis=0)
+        scores[rows] = 0
+        top, values = similar_movies.top_k(scores[None, :], k)
+        found = top[0] >= 0
+        neighbor_ids = movie_ids[top[0][found]]
+        titles, present = self._titles_of(neighbor_ids)
+        return pd.DataFrame({'movie_id': neighbor_ids[present].astype(np.int64), 'title': titles,
+                             'similarity': values[0][found][present].astype(np.float64)})
+
+    def get_user_by_id(self, user_id):
+        rows = self._user_ids.positions(user_id)
+        return pd.DataFrame({column: self.users[column][rows] for column in TABLE_COLUMNS['users']})
+
+    def get_specific_rating(self, user_id, movie_id):
+        rows = self._rating_keys.positions(_rating_keys(user_id, movie_id))
+        rows = np.sort(rows[~self._deleted[rows]])
+        result = pd.DataFrame({column: self.ratings[column][rows] for column in RATINGS_DTYPES})
+        added = [row for row in self._added if row[0] == user_id and row[1] == movie_id]
+        if added:
+            result = pd.concat([result, pd.DataFrame(added, columns=list(RATINGS_DTYPES))], ignore_index=True)
+        return result
+
+    # --- Streaming Exports ---
+
+    def stream_ratings(self, chunk_size=10000, as_numpy=False):
+        return self._stream(self._live_ratings(), chunk_size, as_numpy)
+
+    def stream_ratings_for_movie(self, movie_id, chunk_size=10000, as_numpy=False):
+        live = self._live_ratings()
+        matches = live['movie_id'] == movie_id
+        return self._stream({column: values[matches] for column, values in live.items()}, chunk_size, as_numpy)
+
+    def stream_cast_credits(self, chunk_size=10000, as_numpy=False):
+        titles, found = self._titles_of(self.cast['movie_id'])
+        columns = {'movie_id': self.cast['movie_id'][found], 'title': titles,
+                   'name': self._person_names(self.cast['person_id'][found]),
+                   'character_name': self.cast['character_name'][found],
+                   'cast_order': self.cast['cast_order'][found]}
+        return self._stream(columns, chunk_size, as_numpy)
+
+    @staticmethod
+    def _stream(columns, chunk_size, as_numpy):
+        total = len(next(iter(columns.values())))
+        for start in range(0, total, chunk_size):
+            chunk = {column: values[start:start + chunk_size] for column, values in columns.items()}
+            yield chunk if as_numpy else pd.DataFrame(chunk)
+
+    # --- Batch Lookups ---
+
+    def get_cast_of_movies(self, movie_titles):
+        frames = [self.get_cast_of_movie(title).assign(movie_title=title) for title in movie_titles]
+        return self._concat(frames, ['movie_title', 'name', 'character_name', 'cast_order'])
+
+    def get_directors_of_movies(self, movie_titles):
+        frames = [self.get_director_of_movie(title).assign(movie_title=title) for title in movie_titles]
+        return self._concat(frames, ['movie_title', 'name', 'job'])
+
+    def search_movies_by_actors(self, actor_names):
+        frames = [self.search_movies_by_actor(name).assign(actor_name=name) for name in sorted(set(actor_names))]
+        return self._concat(frames, ['actor_name', 'title', 'character_name'])
+
+    def get_users_by_ids(self, user_ids):
+        rows = self._user_ids.unique_rows(np.unique(np.asarray(list(user_ids), dtype=np.int64)))
+        rows = rows[rows >= 0]
+        return pd.DataFrame({column: self.users[column][rows] for column in TABLE_COLUMNS['users']})
+
+    @staticmethod
+    def _concat(frames, columns):
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)[columns]
+
+    def verify_rating_rollups(self):
+        """Recomputes the rating totals from the live ratings and returns the rows that disagree."""
+        live = self._live_ratings()
+        movie_rows = self._movie_ids.unique_rows(live['movie_id'])
+        rated = (movie_rows >= 0) & ~np.isnan(live['rating'])
+        counts = np.bincount(movie_rows[rated], minlength=len(self.movie_num_ratings))
+        sums = np.bincount(movie_rows[rated], weights=live['rating'][rated], minlength=len(self.movie_rating_sum))
+        user_rows = self._user_ids.unique_rows(live['user_id'])
+        user_counts = np.bincount(user_rows[user_rows >= 0], minlength=len(self.user_num_ratings))
+        bad_movies = np.flatnonzero((counts != self.movie_num_ratings) | ~np.isclose(sums, self.movie_rating_sum))
+        bad_users = np.flatnonzero(user_counts != self.user_num_ratings)
+        return pd.DataFrame({
+            'rollup': ['movie'] * len(bad_movies) + ['user'] * len(bad_users),
+            'id': np.concatenate([self.movies['id'][bad_movies], self.users['id'][bad_users]]),
+            'stored_count': np.concatenate([self.movie_num_ratings[bad_movies], self.user_num_ratings[bad_users]]),
+            'actual_count': np.concatenate([counts[bad_movies], user_counts[bad_users]]),
+            'stored_sum': np.concatenate([self.movie_rating_sum[bad_movies], np.full(len(bad_users), np.nan)]),
+            'actual_sum': np.concatenate([sums[bad_movies], np.full(len(bad_users), np.nan)]),
+        })
+
+    # --- UPDATE, DELETE, and INSERT Queries ---
+
+    def checkpoint(self):
+        """Copy of everything the write functions change, for restore()."""
+        return {'email': self.users['email'].copy(), 'deleted': self._deleted.copy(), 'added': list(self._added),
+                'movie_num_ratings': self.movie_num_ratings.copy(), 'movie_rating_sum': self.movie_rating_sum.copy(),
+                'user_num_ratings': self.user_num_ratings.copy()}
+
+    def restore(self, state):
+        """Undoes every write made since checkpoint() returned `state`."""
+        self.users['email'] = state['email'].copy()
+        self._deleted = state['deleted'].copy()
+        self._added = list(state['added'])
+        self.movie_num_ratings = state['movie_num_ratings'].copy()
+        self.movie_rating_sum = state['movie_rating_sum'].copy()
+        self.user_num_ratings = state['user_num_ratings'].copy()
+        self._neighbor_matrix = None
+
+    def update_user_email(self, user_id, new_email):
+        rows = self._user_ids.positions(user_id)
+        self.users['email'][rows] = new_email
+        return len(rows)
+
+    def delete_rating(self, user_id, movie_id):
+        rows = self._rating_keys.positions(_rating_keys(user_id, movie_id))
+        rows = rows[~self._deleted[rows]]
+        self._deleted[rows] = True
+        self._neighbor_matrix = None
+        removed = [row[2] for row in self._added if row[0] == user_id and row[1] == movie_id]
+        self._added = [row for row in self._added if not (row[0] == user_id and row[1] == movie_id)]
+        self._adjust_rollups(user_id, movie_id, list(self.ratings['rating'][rows]) + removed, -1)
+        return len(rows) + len(removed)
+
+    def insert_specific_rating(self, user_id, movie_id, rating, timestamp):
+        if self._movie_ids.unique_rows([movie_id])[0] < 0 or self._user_ids.unique_rows([user_id])[0] < 0:
+            print(f"An error occurred during commit query: rating ({user_id}, {movie_id}) refers to a user "
+                  f"or movie that does not exist")
+            return
+        self._upsert_rating(user_id, movie_id, rating, timestamp)
+        return 1
+
+    def upsert_ratings(self, frame):
+        """Like query_database.upsert_ratings(), for a DataFrame with ratings.csv's columns."""
+        missing = ((self._movie_ids.unique_rows(frame['movieId'].to_numpy()) < 0) |
+                   (self._user_ids.unique_rows(frame['userId'].to_numpy()) < 0))
+        if missing.any():
+            print(f"An error occurred during upsert: {int(missing.sum())} ratings refer to a user or movie "
+                  f"that does not exist")
+            return None
+        latest = frame.drop_duplicates(['userId', 'movieId'], keep='last')
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicates': len(frame) - len(latest)}
+        for user_id, movie_id, rating, timestamp in latest.itertuples(index=False, name=None):
+            counts[self._upsert_rating(int(user_id), int(movie_id), rating, int(timestamp))] += 1
+        return counts
+
+    def _upsert_rating(self, user_id, movie_id, rating, timestamp):
+        """Writes one rating over any existing rating of the key; returns 'inserted', 'updated' or 'unchanged'."""
+        rating = float(rating) if rating is not None else np.nan
+        rows = self._rating_keys.positions(_rating_keys(user_id, movie_id))
+        rows = rows[~self._deleted[rows]]
+        previous = [(self.ratings['rating'][row], self.ratings['timestamp'][row]) for row in rows]
+        previous += [(row[2], row[3]) for row in self._added if row[0] == user_id and row[1] == movie_id]
+        if previous:
+            old_rating, old_timestamp = previous[-1]
+            if old_timestamp == timestamp and (old_rating == rating or (np.isnan(old_rating) and np.isnan(rating))):
+                return 'unchanged'
+            self._deleted[rows] = True
+            self._added = [row for row in self._added if not (row[0] == user_id and row[1] == movie_id)]
+            self._adjust_rollups(user_id, movie_id, [old for old, _ in previous], -1)
+        self._added.append((user_id, movie_id, rating, timestamp))
+        self._neighbor_matrix = None
+        self._adjust_rollups(user_id, movie_id, [rating], 1)
+        return 'updated' if previous else 'inserted'
+
+    def _adjust_rollups(self, user_id, movie_id, ratings, sign):
+        if not ratings:
+            return
+        movie_row = self._movie_ids.unique_rows([movie_id])[0]
+        user_row = self._user_ids.unique_rows([user_id])[0]
+        counted = [rating for rating in ratings if not np.isnan(rating)]
+        if movie_row >= 0:
+            self.movie_num_ratings[movie_row] += sign * len(counted)
+            self.movie_rating_sum[movie_row] += sign * sum(counted)
+        if user_row >= 0:
+            self.user_num_ratings[user_row] += sign * len(ratings)
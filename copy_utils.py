@@ -0,0 +1,153 @@
+import io
+import struct
+import time
+import numpy as np
+
+COPY_NULL = '\\N'
+
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def format_copy_value(value):
+    """Formats a single Python value for PostgreSQL's COPY text format."""
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value)
+
+
+def rows_to_copy_buffer(rows):
+    """Serializes an iterable of row tuples into an in-memory COPY text buffer."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join([format_copy_value(value) for value in row]))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Streams rows into `table` with COPY ... FROM STDIN and returns the number
+    of rows sent. `table` must already be quoted if it is a reserved word.
+    """
+    if not rows:
+        return 0
+    buffer = rows_to_copy_buffer(rows)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    return len(rows)
+
+
+def copy_columns(cursor, table, column_names, columns):
+    """
+    Like copy_rows, but takes NumPy/list columns and assembles the COPY text
+    with vectorized string operations instead of formatting row by row.
+    Columns containing characters that need COPY escaping are formatted the
+    slow way. NULLs are not supported.
+    """
+    columns = [np.asarray(column).astype(str) for column in columns]
+    if not columns or not len(columns[0]):
+        return 0
+    for position, column in enumerate(columns):
+        if any(np.char.find(column, special).max() >= 0 for special in ('\\', '\t', '\n', '\r')):
+            columns[position] = np.array([format_copy_value(value) for value in column.tolist()])
+    lines = columns[0]
+    for column in columns[1:]:
+        lines = np.char.add(np.char.add(lines, '\t'), column)
+    buffer = io.StringIO('\n'.join(lines.tolist()) + '\n')
+    cursor.copy_expert(f"COPY {table} ({', '.join(column_names)}) FROM STDIN", buffer)
+    return len(lines)
+
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('!h', -1)
+
+# Big-endian field layouts for the binary COPY types we ship from NumPy.
+# 'numeric1' is a NUMERIC with one decimal place (e.g. DECIMAL(2, 1)), sent as
+# two base-10000 digits: the integer part and the tenths scaled by 1000.
+_BINARY_FIELDS = {
+    'int4': [('value', '>i4')],
+    'int8': [('value', '>i8')],
+    'float8': [('value', '>f8')],
+    'numeric1': [('ndigits', '>i2'), ('weight', '>i2'), ('sign', '>i2'), ('dscale', '>i2'),
+                 ('integer', '>i2'), ('fraction', '>i2')],
+}
+_NUMERIC_NEGATIVE = 0x4000
+
+
+def binary_copy_payload(columns):
+    """
+    Encodes NumPy column arrays as a PostgreSQL binary COPY payload without
+    building per-row Python objects. `columns` is a list of (pg_type, array)
+    pairs in table column order; pg_type is one of 'int4', 'int8', 'float8'
+    or 'numeric1'. NULLs are not supported.
+    """
+    row_count = len(columns[0][1]) if columns else 0
+    fields = [('field_count', '>i2')]
+    for position, (pg_type, _) in enumerate(columns):
+        fields.append((f'length{position}', '>i4'))
+        fields.extend((f'{name}{position}', dtype) for name, dtype in _BINARY_FIELDS[pg_type])
+
+    rows = np.empty(row_count, dtype=np.dtype(fields))
+    rows['field_count'] = len(columns)
+    for position, (pg_type, values) in enumerate(columns):
+        rows[f'length{position}'] = sum(np.dtype(dtype).itemsize for _, dtype in _BINARY_FIELDS[pg_type])
+        if pg_type != 'numeric1':
+            rows[f'value{position}'] = values
+            continue
+        tenths = np.rint(np.abs(np.asarray(values, dtype=np.float64)) * 10).astype(np.int64)
+        if tenths.size and tenths.max() >= 100000:
+            raise ValueError("numeric1 values must be below 10000")
+        rows[f'ndigits{position}'] = 2
+        rows[f'weight{position}'] = 0
+        rows[f'sign{position}'] = np.where(np.asarray(values) < 0, _NUMERIC_NEGATIVE, 0)
+        rows[f'dscale{position}'] = 1
+        rows[f'integer{position}'] = tenths // 10
+        rows[f'fraction{position}'] = (tenths % 10) * 1000
+
+    return PGCOPY_HEADER + rows.tobytes() + PGCOPY_TRAILER
+
+
+def copy_binary(cursor, table, column_names, columns):
+    """Ships NumPy columns to `table` with COPY ... FROM STDIN (FORMAT binary) and returns the row count."""
+    row_count = len(columns[0][1]) if columns else 0
+    if not row_count:
+        return 0
+    payload = io.BytesIO(binary_copy_payload(columns))
+    cursor.copy_expert(f"COPY {table} ({', '.join(column_names)}) FROM STDIN WITH (FORMAT binary)", payload)
+    return row_count
+
+
+class CopyStats:
+    """Accumulates rows loaded and time spent per table to report rows/sec."""
+
+    def __init__(self):
+        self.rows = {}
+        self.seconds = {}
+
+    def record(self, table, rows, seconds):
+        self.rows[table] = self.rows.get(table, 0) + rows
+        self.seconds[table] = self.seconds.get(table, 0.0) + seconds
+
+    def timed_copy(self, cursor, table, columns, rows):
+        start = time.perf_counter()
+        count = copy_rows(cursor, table, columns, rows)
+        self.record(table, count, time.perf_counter() - start)
+        return count
+
+    def rows_per_second(self, table):
+        seconds = self.seconds.get(table, 0.0)
+        return self.rows.get(table, 0) / seconds if seconds > 0 else 0.0
+
+    def report(self):
+        for table in self.rows:
+            print(f"  - {table}: {self.rows[table]} rows in {self.seconds[table]:.2f}s "
+                  f"({self.rows_per_second(table):,.0f} rows/sec)")
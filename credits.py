@@ -1,7 +1,19 @@
+import argparse
+import hashlib
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import psycopg2
 import ast
 
+import resolver
+from checkpoints import completed_ranges, mark_completed
+from copy_utils import CopyStats, copy_rows
+from literal_parser import parse_literal
+
 DB_CONFIG = {
     'user': 'qaim.ali',
     'host': 'localhost',
@@ -11,6 +23,113 @@ DB_CONFIG = {
 
 CREDITS_FILE = 'Users/qaim.ali/Downloads/movies/credits.csv' 
 
+# Number of credits.csv rows (movies) parsed and shipped per COPY batch.
+BATCH_SIZE = 500
+VARCHAR_LIMIT = 255
+
+MOVIE_COLUMNS = ('id', 'title')
+PEOPLE_COLUMNS = ('id', 'name', 'profile_path')
+# Parsed cast/crew rows carry the people, job and department strings ...
+CAST_PARSED_COLUMNS = ('movie_id', 'cast_id', 'character_name', 'credit_id', 'gender', 'name', 'cast_order',
+                       'profile_path')
+CREW_PARSED_COLUMNS = ('movie_id', 'credit_id', 'department', 'gender', 'job', 'name', 'profile_path')
+# ... which PeopleEncoder swaps for ids before they are COPYed.
+CAST_COLUMNS = ('movie_id', 'cast_id', 'character_name', 'credit_id', 'gender', 'person_id', 'cast_order')
+CREW_COLUMNS = ('movie_id', 'credit_id', 'department_id', 'gender', 'job_id', 'person_id')
+
+CAST_FIELDS = ('cast_id', 'character', 'credit_id', 'gender', 'name', 'order', 'profile_path')
+CREW_FIELDS = ('credit_id', 'department', 'gender', 'job', 'name', 'profile_path')
+INT_FIELDS = {'cast_id', 'gender', 'order'}
+
+# Parsed cast/crew batches are cached here, keyed by the hash of credits.csv,
+# so a reload after a schema reset can skip parsing altogether.
+CACHE_DIR = '.parsed_cache'
+PARSE_WORKERS = os.cpu_count() or 1
+
+PARSED_TABLES = (
+    ('movies', MOVIE_COLUMNS, {'id'}),
+    ('cast', CAST_PARSED_COLUMNS, {'movie_id', 'cast_id', 'gender', 'cast_order'}),
+    ('crew', CREW_PARSED_COLUMNS, {'movie_id', 'gender'}),
+)
+
+
+class PeopleEncoder:
+    """
+    In-memory dictionary encoder for the people, jobs and departments tables.
+    Every unseen (name, profile_path), job or department gets the next id;
+    the new entries are kept until flush() COPYs them, which must happen
+    before the credits that reference them. The resolver only hears of the
+    flushed people from publish(), once they are committed. Credits without
+    a name get a NULL person_id.
+    """
+
+    def __init__(self):
+        self.people = {}
+        self.jobs = {}
+        self.departments = {}
+        self._last_ids = {'people': 0, 'jobs': 0, 'departments': 0}
+        self._pending = {'people': [], 'jobs': [], 'departments': []}
+        self._unpublished = []
+
+    @classmethod
+    def from_database(cls, cursor):
+        """An encoder that already knows every entry stored in the database, so ids are never reused."""
+        encoder = cls()
+        cursor.execute("SELECT id, name, profile_path FROM people")
+        encoder.people = {(name, profile_path): person_id for person_id, name, profile_path in cursor.fetchall()}
+        cursor.execute("SELECT id, name FROM jobs")
+        encoder.jobs = {name: job_id for job_id, name in cursor.fetchall()}
+        cursor.execute("SELECT id, name FROM departments")
+        encoder.departments = {name: department_id for department_id, name in cursor.fetchall()}
+        for table, mapping in (('people', encoder.people), ('jobs', encoder.jobs),
+                               ('departments', encoder.departments)):
+            encoder._last_ids[table] = max(mapping.values(), default=0)
+        return encoder
+
+    def _id(self, table, mapping, key, row):
+        entry_id = mapping.get(key)
+        if entry_id is None:
+            entry_id = mapping[key] = self._last_ids[table] = self._last_ids[table] + 1
+            self._pending[table].append((entry_id,) + row)
+        return entry_id
+
+    def person_id(self, name, profile_path):
+        if name is None:
+            return None
+        return self._id('people', self.people, (name, profile_path), (name, profile_path))
+
+    def job_id(self, job):
+        return None if job is None else self._id('jobs', self.jobs, job, (job,))
+
+    def department_id(self, department):
+        return None if department is None else self._id('departments', self.departments, department, (department,))
+
+    def encode_cast(self, cast_rows):
+        """CAST_PARSED_COLUMNS rows -> CAST_COLUMNS rows."""
+        return [(movie_id, cast_id, character, credit_id, gender, self.person_id(name, profile_path), order)
+                for movie_id, cast_id, character, credit_id, gender, name, order, profile_path in cast_rows]
+
+    def encode_crew(self, crew_rows):
+        """CREW_PARSED_COLUMNS rows -> CREW_COLUMNS rows."""
+        return [(movie_id, credit_id, self.department_id(department), gender, self.job_id(job),
+                 self.person_id(name, profile_path))
+                for movie_id, credit_id, department, gender, job, name, profile_path in crew_rows]
+
+    def flush(self, cursor, stats):
+        """COPYs the entries added since the last flush."""
+        for table, columns in (('people', PEOPLE_COLUMNS), ('jobs', ('id', 'name')), ('departments', ('id', 'name'))):
+            if self._pending[table]:
+                stats.timed_copy(cursor, table, columns, self._pending[table])
+                if table == 'people':
+                    self._unpublished.extend((person_id, name) for person_id, name, _ in self._pending[table])
+                self._pending[table] = []
+
+    def publish(self):
+        """Tells the resolver about the people flushed since the last publish(); call it after committing them."""
+        if self._unpublished:
+            resolver.people_added(self._unpublished)
+            self._unpublished = []
+
 def populate_data():
     conn = None
     try:
@@ -21,6 +140,8 @@ def populate_data():
         print(f"Connecting to database '{DB_CONFIG['database']}'...")
         conn = psycopg2.connect(**DB_CONFIG)
         cursor = conn.cursor()
+        encoder = PeopleEncoder.from_database(cursor)
+        stats = CopyStats()
 
         for index, row in df.iterrows():
             movie_id = row['id']
@@ -32,59 +153,398 @@ def populate_data():
             movie_id = int(movie_id)
             print(f"Processing movie ID: {movie_id}")
 
-            movie_title = f"Title for movie {movie_id}"
+            cast_rows = []
+            try:
+                cast_rows = [(movie_id, member.get('cast_id'), member.get('character'), member.get('credit_id'),
+                              member.get('gender'), encoder.person_id(member.get('name'), member.get('profile_path')),
+                              member.get('order'))
+                             for member in ast.literal_eval(row['cast'])]
+            except (ValueError, SyntaxError, AttributeError) as e:
+                print(f"  - Could not parse cast data for movie ID {movie_id}. Error: {e}")
+
+            crew_rows = []
+            try:
+                crew_rows = [(movie_id, member.get('credit_id'), encoder.department_id(member.get('department')),
+                              member.get('gender'), encoder.job_id(member.get('job')),
+                              encoder.person_id(member.get('name'), member.get('profile_path')))
+                             for member in ast.literal_eval(row['crew'])]
+            except (ValueError, SyntaxError, AttributeError) as e:
+                print(f"  - Could not parse crew data for movie ID {movie_id}. Error: {e}")
+
+            # New people, jobs and departments go in with one COPY per movie,
+            # outside the movie's savepoint: they stay valid if it is rolled back.
+            encoder.flush(cursor, stats)
+            cursor.execute("SAVEPOINT credit_movie")
             try:
                 cursor.execute(
                     "INSERT INTO movies (id, title) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING",
-                    (movie_id, movie_title)
+                    (movie_id, f"Title for movie {movie_id}")
                 )
-            except Exception as e:
-                print(f"  - Error inserting into movies table for ID {movie_id}: {e}")
-                conn.rollback()
-                continue
+                cursor.executemany(
+                    """INSERT INTO "cast" (movie_id, cast_id, character_name, credit_id, gender, person_id, cast_order)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                    cast_rows
+                )
+                cursor.executemany(
+                    """INSERT INTO crew (movie_id, credit_id, department_id, gender, job_id, person_id)
+                       VALUES (%s, %s, %s, %s, %s, %s)""",
+                    crew_rows
+                )
+                cursor.execute("RELEASE SAVEPOINT credit_movie")
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT credit_movie")
+                print(f"  - Error inserting movie ID {movie_id}, skipping it: {e}")
 
-            try:
-                cast_data = ast.literal_eval(row['cast'])
-                for member in cast_data:
-                    cursor.execute(
-                        """INSERT INTO "cast" (movie_id, cast_id, character_name, credit_id, gender, name, cast_order, profile_path)
-                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-                        (movie_id, member.get('cast_id'), member.get('character'), member.get('credit_id'), 
-                         member.get('gender'), member.get('name'), member.get('order'), member.get('profile_path'))
-                    )
-            except (ValueError, SyntaxError) as e:
-                print(f"  - Could not parse cast data for movie ID {movie_id}. Error: {e}")
-            except Exception as e:
-                print(f"  - Error inserting into cast table for movie ID {movie_id}: {e}")
-                conn.rollback()
+        conn.commit()
+        encoder.publish()
+        print("\nData population for movies, cast, and crew completed successfully!")
+
+    except FileNotFoundError:
+        print(f"Error: The file '{CREDITS_FILE}' was not found.")
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+    finally:
+        if conn is not None:
+            cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+
+
+def _clean_member_value(field, value):
+    """Validates one cast/crew field against its column type, raising ValueError if it cannot be loaded."""
+    if value is None:
+        return None
+    if field in INT_FIELDS:
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+            raise ValueError(f"'{field}' is not an integer: {value!r}")
+        return int(value)
+    if not isinstance(value, str):
+        raise ValueError(f"'{field}' is not a string: {value!r}")
+    if len(value) > VARCHAR_LIMIT or '\x00' in value:
+        raise ValueError(f"'{field}' does not fit VARCHAR({VARCHAR_LIMIT})")
+    return value
+
+
+def _member_rows(movie_id, members, fields, label):
+    rows = []
+    rejected = 0
+    for member in members:
+        try:
+            if not isinstance(member, dict):
+                raise ValueError(f"expected a dict, got {type(member).__name__}")
+            rows.append((movie_id,) + tuple(_clean_member_value(field, member.get(field)) for field in fields))
+        except ValueError as e:
+            print(f"  - Rejected {label} row for movie ID {movie_id}: {e}")
+            rejected += 1
+    return rows, rejected
+
+
+def parse_credit_rows(df):
+    """
+    Turns a chunk of credits.csv into row tuples for the movies, "cast" and crew
+    tables. Rows that cannot be parsed or would violate a column type are
+    reported and left out instead of failing the whole load.
+    """
+    movies, cast_rows, crew_rows = [], [], []
+    rejected = 0
+    movie_ids = pd.to_numeric(df['id'], errors='coerce')
 
+    for index, movie_id, cast_text, crew_text in zip(df.index, movie_ids, df['cast'], df['crew']):
+        if pd.isna(movie_id) or movie_id != int(movie_id):
+            print(f"Skipping row {index} due to invalid movie ID: {df.at[index, 'id']}")
+            rejected += 1
+            continue
+
+        movie_id = int(movie_id)
+        movies.append((movie_id, f"Title for movie {movie_id}"))
+
+        for text, fields, label, target in ((cast_text, CAST_FIELDS, 'cast', cast_rows),
+                                            (crew_text, CREW_FIELDS, 'crew', crew_rows)):
             try:
-                crew_data = ast.literal_eval(row['crew'])
-                for member in crew_data:
-                    cursor.execute(
-                        """INSERT INTO crew (movie_id, credit_id, department, gender, job, name, profile_path)
-                           VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                        (movie_id, member.get('credit_id'), member.get('department'), member.get('gender'),
-                         member.get('job'), member.get('name'), member.get('profile_path'))
-                    )
+                members = parse_literal(text)
             except (ValueError, SyntaxError) as e:
-                print(f"  - Could not parse crew data for movie ID {movie_id}. Error: {e}")
-            except Exception as e:
-                print(f"  - Error inserting into crew table for movie ID {movie_id}: {e}")
-                conn.rollback()
+                print(f"  - Could not parse {label} data for movie ID {movie_id}. Error: {e}")
+                rejected += 1
+                continue
+            rows, bad = _member_rows(movie_id, members, fields, label)
+            target.extend(rows)
+            rejected += bad
+
+    return movies, cast_rows, crew_rows, rejected
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _encode_columns(table, columns, int_columns, rows):
+    """Stores row tuples column by column: ints as int64, strings as one UTF-8 buffer plus offsets."""
+    arrays = {}
+    values_by_column = list(zip(*rows)) if rows else [()] * len(columns)
+    for column, values in zip(columns, values_by_column):
+        key = f"{table}.{column}"
+        arrays[key + '.nulls'] = np.array([value is None for value in values], dtype=bool)
+        if column in int_columns:
+            arrays[key] = np.array([0 if value is None else value for value in values], dtype=np.int64)
+        else:
+            encoded = [b'' if value is None else value.encode('utf-8') for value in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            arrays[key] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            arrays[key + '.offsets'] = offsets
+    return arrays
+
+
+def _decode_columns(table, columns, int_columns, arrays):
+    decoded = []
+    for column in columns:
+        key = f"{table}.{column}"
+        nulls = arrays[key + '.nulls'].tolist()
+        if column in int_columns:
+            values = arrays[key].tolist()
+            decoded.append([None if null else value for value, null in zip(values, nulls)])
+        else:
+            blob = arrays[key].tobytes()
+            offsets = arrays[key + '.offsets'].tolist()
+            decoded.append([None if null else blob[start:end].decode('utf-8')
+                            for start, end, null in zip(offsets[:-1], offsets[1:], nulls)])
+    return list(zip(*decoded))
+
+
+def _parse_chunk(chunk):
+    """Process-pool worker: parses one credits.csv chunk into columnar arrays."""
+    movies, cast_rows, crew_rows, rejected = parse_credit_rows(chunk)
+    arrays = {'rejected': np.array(rejected, dtype=np.int64)}
+    for (table, columns, int_columns), rows in zip(PARSED_TABLES, (movies, cast_rows, crew_rows)):
+        arrays.update(_encode_columns(table, columns, int_columns, rows))
+    return arrays
+
+
+def _decode_batch(arrays):
+    movies, cast_rows, crew_rows = (_decode_columns(table, columns, int_columns, arrays)
+                                    for table, columns, int_columns in PARSED_TABLES)
+    return movies, cast_rows, crew_rows, int(arrays['rejected'])
+
+
+def _parse_chunks_in_pool(chunks, workers):
+    """Yields parsed chunks in file order, keeping at most 2 * workers chunks in flight to bound memory."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield _parse_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_parse_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def iter_numbered_credit_batches(batch_size=BATCH_SIZE, workers=PARSE_WORKERS, use_cache=True, skip=frozenset()):
+    """
+    Yields (number, (movies, cast_rows, crew_rows, rejected)) for each batch
+    of credits.csv; batch `number` holds data rows [number * batch_size,
+    (number + 1) * batch_size). Batches are parsed across a process pool and
+    written to a columnar cache keyed by the file's SHA-256; when a complete
+    cache exists for the file the batches are read from it and nothing is
+    parsed. Batch numbers in `skip` are neither parsed nor yielded.
+    """
+    cache_path = None
+    if use_cache:
+        print(f"Hashing '{CREDITS_FILE}'...")
+        cache_path = os.path.join(CACHE_DIR, f"credits-{file_sha256(CREDITS_FILE)[:16]}-b{batch_size}")
+        if os.path.isdir(cache_path):
+            print(f"Reading parsed batches from cache '{cache_path}'...")
+            for name in sorted(os.listdir(cache_path)):
+                number = int(name[len('chunk-'):-len('.npz')])
+                if number not in skip:
+                    with np.load(os.path.join(cache_path, name)) as arrays:
+                        yield number, _decode_batch(arrays)
+            return
+        if skip:
+            # A cache built from only part of the file would be wrong.
+            cache_path = None
+        else:
+            partial_path = cache_path + '.partial'
+            shutil.rmtree(partial_path, ignore_errors=True)
+            os.makedirs(partial_path)
+
+    numbers = []
+
+    def wanted_chunks():
+        for number, chunk in enumerate(pd.read_csv(CREDITS_FILE, on_bad_lines='warn', chunksize=batch_size)):
+            if number not in skip:
+                numbers.append(number)
+                yield chunk
+
+    for position, arrays in enumerate(_parse_chunks_in_pool(wanted_chunks(), workers)):
+        number = numbers[position]
+        if cache_path:
+            np.savez(os.path.join(partial_path, f"chunk-{number:06d}.npz"), **arrays)
+        yield number, _decode_batch(arrays)
+
+    if cache_path:
+        os.rename(partial_path, cache_path)
+
+
+def iter_credit_batches(batch_size=BATCH_SIZE, workers=PARSE_WORKERS, use_cache=True):
+    """Yields (movies, cast_rows, crew_rows, rejected) for each batch of credits.csv, in file order."""
+    for _, batch in iter_numbered_credit_batches(batch_size, workers, use_cache):
+        yield batch
+
+
+def completed_credit_batches(cursor, sha256, batch_size):
+    """
+    Batch numbers of credits.csv already committed under checkpointing.
+    Raises ValueError if the file was checkpointed with another batch size,
+    since its batches would not line up and rows could be loaded twice.
+    """
+    done = completed_ranges(cursor, CREDITS_FILE, sha256, 'rows')
+    mismatched = [start for start, end in done if end - start != batch_size or start % batch_size]
+    if mismatched:
+        raise ValueError(f"'{CREDITS_FILE}' was partly loaded with a different batch size; "
+                         f"rerun with --batch-size {max(end - start for start, end in done)}")
+    return {start // batch_size for start, _ in done}
+
+
+def _copy_movies(cursor, movies, stats):
+    """Placeholder movies go through a staging table so COPY can keep ON CONFLICT DO NOTHING semantics."""
+    start = time.perf_counter()
+    copy_rows(cursor, 'stage_movies', MOVIE_COLUMNS, movies)
+    cursor.execute("INSERT INTO movies (id, title) SELECT id, title FROM stage_movies ON CONFLICT (id) DO NOTHING")
+    cursor.execute("TRUNCATE stage_movies")
+    stats.record('movies', len(movies), time.perf_counter() - start)
+
+
+def _copy_rows_individually(cursor, table, columns, rows, stats):
+    """Fallback for a failed batch: loads one row per savepoint so only the offending rows are rejected."""
+    loaded = 0
+    rejected = 0
+    start = time.perf_counter()
+    for row in rows:
+        cursor.execute("SAVEPOINT credit_row")
+        try:
+            if table == 'movies':
+                _copy_movies(cursor, [row], CopyStats())
+            else:
+                copy_rows(cursor, table, columns, [row])
+            cursor.execute("RELEASE SAVEPOINT credit_row")
+            loaded += 1
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT credit_row")
+            print(f"  - Rejected {table} row {row[:2]}: {str(e).strip()}")
+            rejected += 1
+    stats.record(table, loaded, time.perf_counter() - start)
+    return rejected
+
+
+def copy_credit_batch(cursor, movies, cast_rows, crew_rows, stats):
+    """
+    Loads one batch (cast/crew already encoded, see PeopleEncoder) with COPY. If the server rejects the batch, only this
+    batch is rolled back (to a savepoint) and retried row by row, so earlier
+    batches in the transaction are never thrown away. Returns the number of
+    rows rejected by the server.
+    """
+    cursor.execute("SAVEPOINT credit_batch")
+    try:
+        _copy_movies(cursor, movies, stats)
+        stats.timed_copy(cursor, '"cast"', CAST_COLUMNS, cast_rows)
+        stats.timed_copy(cursor, 'crew', CREW_COLUMNS, crew_rows)
+        rejected = 0
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT credit_batch")
+        print(f"  - Batch COPY failed, retrying row by row: {str(e).strip()}")
+        rejected = _copy_rows_individually(cursor, 'movies', MOVIE_COLUMNS, movies, stats)
+        rejected += _copy_rows_individually(cursor, '"cast"', CAST_COLUMNS, cast_rows, stats)
+        rejected += _copy_rows_individually(cursor, 'crew', CREW_COLUMNS, crew_rows, stats)
+    cursor.execute("RELEASE SAVEPOINT credit_batch")
+    return rejected
+
+
+def create_staging_tables(cursor):
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS stage_movies (id INT, title VARCHAR(255))")
+
+
+def populate_data_copy(batch_size=BATCH_SIZE, workers=PARSE_WORKERS, use_cache=True, checkpointed=False):
+    """
+    Streams credits.csv in batches of `batch_size` movies and loads movies,
+    people, jobs, departments, "cast" and crew with COPY ... FROM STDIN. Only a bounded number of batches
+    is held in memory at a time, regardless of the file size. With
+    `checkpointed`, every batch commits together with its ingest_progress row
+    and a rerun skips the batches that are already in.
+    """
+    conn = None
+    cursor = None
+    stats = CopyStats()
+    try:
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        create_staging_tables(cursor)
+        encoder = PeopleEncoder.from_database(cursor)
+
+        sha256 = None
+        done = frozenset()
+        if checkpointed:
+            sha256 = file_sha256(CREDITS_FILE)
+            done = completed_credit_batches(cursor, sha256, batch_size)
+            if done:
+                print(f"Resuming: skipping {len(done)} batches that were already loaded.")
+
+        print(f"Streaming data from '{CREDITS_FILE}' in batches of {batch_size} movies...")
+        processed = 0
+        rejected = 0
+        start = time.perf_counter()
+        for number, (movies, cast_rows, crew_rows, bad) in iter_numbered_credit_batches(batch_size, workers,
+                                                                                     use_cache, skip=done):
+            cast_rows, crew_rows = encoder.encode_cast(cast_rows), encoder.encode_crew(crew_rows)
+            encoder.flush(cursor, stats)
+            rejected += bad + copy_credit_batch(cursor, movies, cast_rows, crew_rows, stats)
+            processed += len(movies)
+            if checkpointed:
+                mark_completed(cursor, CREDITS_FILE, sha256, 'rows', number * batch_size, (number + 1) * batch_size,
+                               len(movies))
+                conn.commit()
+                encoder.publish()
+            print(f"Processed {processed} movies...")
 
         conn.commit()
-        print("\nData population for movies, cast, and crew completed successfully!")
+        encoder.publish()
+        print(f"\nData population for movies, cast, and crew completed in {time.perf_counter() - start:.2f}s "
+              f"({rejected} rows rejected).")
+        stats.report()
 
     except FileNotFoundError:
         print(f"Error: The file '{CREDITS_FILE}' was not found.")
     except Exception as e:
         print(f"A critical error occurred: {e}")
+        if conn:
+            conn.rollback()
     finally:
         if conn is not None:
-            cursor.close()
+            if cursor is not None:
+                cursor.close()
             conn.close()
             print("PostgreSQL connection is closed.")
 
 if __name__ == "__main__":
-    populate_data()
+    parser = argparse.ArgumentParser(description="Load movies, cast and crew from credits.csv.")
+    parser.add_argument('--mode', choices=('copy', 'insert'), default='copy',
+                        help="'copy' streams batches with COPY; 'insert' is the original per-row loader.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=PARSE_WORKERS, help="Processes used to parse cast/crew.")
+    parser.add_argument('--no-cache', action='store_true', help="Always re-parse instead of using the parsed cache.")
+    parser.add_argument('--checkpointed', action='store_true',
+                        help="Commit each batch with a checkpoint and resume from the last one on a rerun.")
+    args = parser.parse_args()
+    if args.mode == 'copy':
+        populate_data_copy(batch_size=args.batch_size, workers=args.workers, use_cache=not args.no_cache,
+                           checkpointed=args.checkpointed)
+    else:
+        populate_data()
@@ -0,0 +1,396 @@
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+import pandas as pd
+import psycopg2
+
+import credits
+import ratings
+import schema_migrations
+import similar_movies
+import update_movie_titles
+from checkpoints import completed_ranges, mark_completed
+from copy_utils import CopyStats, copy_columns
+
+DB_CONFIG = {
+    'user': 'qaim.ali',
+    'host': 'localhost',
+    'port': '5432',
+    'database': 'movie_db'
+}
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILE = os.path.join(REPO_DIR, 'schema.sql')
+
+# Parallelism: processes for CPU-bound parsing and ratings ranges, and
+# connections COPYing cast/crew batches. Stages run at most MAX_PARALLEL_STAGES at a time.
+WORKERS = os.cpu_count() or 4
+COPY_CONNECTIONS = 4
+MAX_PARALLEL_STAGES = 4
+
+_print_lock = threading.Lock()
+
+
+def _log(stage, message):
+    with _print_lock:
+        print(f"[{stage}] {message}", flush=True)
+
+
+def _load_schema_creation():
+    spec = importlib.util.spec_from_file_location('schema_creation', os.path.join(REPO_DIR, 'schema-creation.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _connect():
+    return psycopg2.connect(**DB_CONFIG)
+
+
+# --- Stages ---
+# Each stage takes the shared context dict, may add outputs to it for later
+# stages, and returns the number of rows it loaded (or None).
+
+def stage_schema(context):
+    """
+    Creates the database if needed and applies migrations. A fresh load (no
+    ingest_progress rows yet) also drops the managed indexes and foreign
+    keys; a resumed one keeps them unless context['rebuild'] is set.
+    """
+    schema_creation = _load_schema_creation()
+    schema_creation.DB_CONFIG.update(DB_CONFIG)
+    schema_creation.create_database()
+    conn = _connect()
+    try:
+        applied = schema_migrations.migrate(conn, SCHEMA_FILE)
+        _log('schema', f"applied {len(applied)} migration(s)")
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM ingest_progress)")
+            if cursor.fetchone()[0] and not context.get('rebuild'):
+                _log('schema', "resuming an earlier ingest; keeping the managed indexes and foreign keys")
+            else:
+                schema_migrations.drop_deferred_objects(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def stage_scan(context):
+    """Reads just the id columns of credits.csv and ratings.csv, both files at once."""
+    def credit_ids():
+        ids = pd.to_numeric(pd.read_csv(credits.CREDITS_FILE, usecols=['id'], on_bad_lines='warn')['id'],
+                            errors='coerce').dropna()
+        return ids[ids == ids.round()].astype(np.int64).to_numpy()
+
+    def rating_ids():
+        columns = pd.read_csv(ratings.RATINGS_FILE, usecols=['userId', 'movieId'],
+                              dtype={'userId': np.int32, 'movieId': np.int32})
+        return np.unique(columns['userId'].to_numpy()), np.unique(columns['movieId'].to_numpy())
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        credit_future, rating_future = executor.submit(credit_ids), executor.submit(rating_ids)
+        context['credit_movie_ids'] = credit_future.result()
+        context['user_ids'], context['rating_movie_ids'] = rating_future.result()
+    _log('scan', f"{len(context['credit_movie_ids'])} credited movies, {len(context['rating_movie_ids'])} rated "
+                 f"movies, {len(context['user_ids'])} users")
+
+
+def stage_movies(context):
+    """Placeholder rows for every movie id in credits.csv or ratings.csv, so later stages never race to add one."""
+    movie_ids = np.union1d(context['credit_movie_ids'], context['rating_movie_ids'])
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            credits.create_staging_tables(cursor)
+            titles = np.char.add('Title for movie ', movie_ids.astype(str))
+            copy_columns(cursor, 'stage_movies', credits.MOVIE_COLUMNS, [movie_ids, titles])
+            cursor.execute("INSERT INTO movies (id, title) SELECT id, title FROM stage_movies ON CONFLICT (id) DO NOTHING")
+        conn.commit()
+    finally:
+        conn.close()
+    return len(movie_ids)
+
+
+def stage_users(context):
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            count = ratings.insert_users(cursor, context['user_ids'])
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def stage_titles(context):
+    result = update_movie_titles.sync_movie_titles(force=True)
+    return result['inserted'] + result['changed'] + result['unchanged']
+
+
+def _copy_credit_batch(conn, number, batch, stats, sha256, batch_size):
+    movies, cast_rows, crew_rows, rejected = batch
+    with conn.cursor() as cursor:
+        rejected += credits.copy_credit_batch(cursor, movies, cast_rows, crew_rows, stats)
+        mark_completed(cursor, credits.CREDITS_FILE, sha256, 'rows', number * batch_size, (number + 1) * batch_size,
+                       len(movies))
+    conn.commit()
+    return rejected
+
+
+def stage_cast_crew(context):
+    """
+    Parses credits.csv across a process pool and COPYs the parsed batches over
+    COPY_CONNECTIONS connections, each fed by its own thread. Each batch
+    commits together with its checkpoint, so a rerun skips the batches that
+    are already in. People, jobs and departments are encoded here and their
+    new entries committed on a separate connection before the batch that
+    references them is handed to a COPY thread.
+    """
+    batch_size = credits.BATCH_SIZE
+    sha256 = credits.file_sha256(credits.CREDITS_FILE)
+    dictionary_conn = _connect()
+    conns = [_connect() for _ in range(COPY_CONNECTIONS)]
+    executors = [ThreadPoolExecutor(max_workers=1) for _ in conns]
+    stats = [CopyStats() for _ in conns]
+    dictionary_stats = CopyStats()
+    pending = [None] * len(conns)
+    rejected = 0
+    try:
+        for conn in conns:
+            with conn.cursor() as cursor:
+                credits.create_staging_tables(cursor)
+        dictionary_cursor = dictionary_conn.cursor()
+        encoder = credits.PeopleEncoder.from_database(dictionary_cursor)
+        done = credits.completed_credit_batches(dictionary_cursor, sha256, batch_size)
+        if done:
+            _log('cast_crew', f"resuming, {len(done)} batches already loaded")
+        batches = credits.iter_numbered_credit_batches(batch_size, WORKERS, context.get('use_cache', True), skip=done)
+        for position, (number, (movies, cast_rows, crew_rows, bad)) in enumerate(batches):
+            batch = (movies, encoder.encode_cast(cast_rows), encoder.encode_crew(crew_rows), bad)
+            encoder.flush(dictionary_cursor, dictionary_stats)
+            dictionary_conn.commit()
+            encoder.publish()
+            slot = position % len(conns)
+            if pending[slot] is not None:
+                rejected += pending[slot].result()
+            pending[slot] = executors[slot].submit(_copy_credit_batch, conns[slot], number, batch, stats[slot],
+                                                   sha256, batch_size)
+        for future in pending:
+            if future is not None:
+                rejected += future.result()
+    finally:
+        # Wait for the COPY threads before closing their connections: closing
+        # discards a batch that has not committed, but a rollback issued
+        # while a thread is between its COPY and its commit would let the
+        # checkpoint commit without the batch's rows.
+        for executor in executors:
+            executor.shutdown()
+        for conn in conns + [dictionary_conn]:
+            conn.close()
+    _log('cast_crew', f"{dictionary_stats.rows.get('people', 0)} new people")
+    if rejected:
+        _log('cast_crew', f"{rejected} rows rejected")
+    return sum(stat.rows.get('"cast"', 0) + stat.rows.get('crew', 0) for stat in stats)
+
+
+def stage_ratings(context):
+    """
+    COPYs ratings.csv in newline-aligned byte ranges, one process and
+    connection per range in flight. Each range commits with its checkpoint;
+    ranges already loaded from the same file are not read again.
+    """
+    sha256 = credits.file_sha256(ratings.RATINGS_FILE)
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            done = completed_ranges(cursor, ratings.RATINGS_FILE, sha256, 'bytes')
+    finally:
+        conn.close()
+    ranges = ratings.ratings_byte_ranges(ratings.RATINGS_FILE, completed=done)
+    _log('ratings', f"{len(ranges)} byte ranges over {WORKERS} processes ({len(done)} already loaded)")
+    total = 0
+    # Stages run on threads, so worker processes are not forked from this (threaded) process.
+    with ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('forkserver')) as executor:
+        futures = [executor.submit(ratings.load_ratings_range, DB_CONFIG, start, end, None, ratings.RATINGS_FILE,
+                                   sha256)
+                   for start, end in ranges]
+        for future in futures:
+            total += future.result()
+    return total
+
+
+def stage_rollups(context):
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            ratings.rebuild_rating_rollups(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def stage_neighbors(context):
+    result = similar_movies.build_neighbors(workers=WORKERS)
+    if result is None:
+        raise RuntimeError("computing similar movies failed")
+    return result['rows']
+
+
+def _create_index(name, definition):
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition}")
+        conn.commit()
+    finally:
+        conn.close()
+    return name
+
+
+def stage_indexes(context):
+    """
+    Builds the managed indexes concurrently, one connection each, then adds
+    the foreign keys and runs ANALYZE. The foreign keys are added one at a
+    time because each locks both of its tables.
+    """
+    with ThreadPoolExecutor(max_workers=min(WORKERS, len(schema_migrations.MANAGED_INDEXES))) as executor:
+        for name in executor.map(lambda item: _create_index(*item), schema_migrations.MANAGED_INDEXES.items()):
+            _log('indexes', f"built {name}")
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            schema_migrations.rebuild_deferred_objects(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# name -> (stage function, names of the stages it depends on)
+STAGES = {
+    'schema': (stage_schema, ()),
+    'scan': (stage_scan, ()),
+    'movies': (stage_movies, ('schema', 'scan')),
+    'users': (stage_users, ('schema', 'scan')),
+    'titles': (stage_titles, ('movies',)),
+    'cast_crew': (stage_cast_crew, ('movies',)),
+    'ratings': (stage_ratings, ('movies', 'users')),
+    'rollups': (stage_rollups, ('ratings',)),
+    'indexes': (stage_indexes, ('titles', 'cast_crew', 'ratings')),
+    'neighbors': (stage_neighbors, ('rollups', 'indexes')),
+}
+
+
+def run_dag(stages, context, max_parallel=MAX_PARALLEL_STAGES):
+    """
+    Runs `stages` ({name: (function, dependencies)}) as soon as all of their
+    dependencies have finished, up to `max_parallel` at a time. When a stage
+    fails no new stages start; the running ones are allowed to finish and the
+    first error is raised. Returns {name: {'start', 'seconds', 'rows'}} with
+    start times relative to the beginning of the run.
+    """
+    for name, (_, dependencies) in stages.items():
+        unknown = set(dependencies) - set(stages)
+        if unknown:
+            raise ValueError(f"stage '{name}' depends on unknown stage(s) {sorted(unknown)}")
+
+    timings = {}
+    done = set()
+    running = {}
+    failure = None
+    began = time.perf_counter()
+
+    def run(name, function):
+        start = time.perf_counter()
+        _log(name, "started")
+        rows = function(context)
+        seconds = time.perf_counter() - start
+        _log(name, f"finished in {seconds:.2f}s")
+        return {'start': start - began, 'seconds': seconds, 'rows': rows}
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while True:
+            if failure is None:
+                for name, (function, dependencies) in stages.items():
+                    if name not in done and name not in running.values() and set(dependencies) <= done \
+                            and len(running) < max_parallel:
+                        running[executor.submit(run, name, function)] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                    done.add(name)
+                except Exception as e:
+                    _log(name, f"FAILED: {e}")
+                    failure = failure or e
+
+    if failure is not None:
+        raise failure
+    not_run = set(stages) - done
+    if not_run:
+        raise RuntimeError(f"stages {sorted(not_run)} could not run; check for a dependency cycle")
+    return timings
+
+
+def report(timings, total_seconds):
+    print(f"\n{'stage':<12} {'start':>8} {'seconds':>9} {'rows':>12} {'rows/sec':>12}")
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]['start']):
+        rows = timing['rows']
+        rate = f"{rows / timing['seconds']:,.0f}" if rows and timing['seconds'] > 0 else ''
+        print(f"{name:<12} {timing['start']:>8.2f} {timing['seconds']:>9.2f} {rows if rows is not None else '':>12} "
+              f"{rate:>12}")
+    print(f"Total: {total_seconds:.2f}s")
+
+
+def run_ingest(use_cache=True, stages=None, rebuild=False):
+    """
+    Loads a database from scratch: schema, movies, users, titles, cast/crew,
+    ratings, rollups, indexes and finally similar movies, running independent stages
+    concurrently. `stages` limits the run to those stage names (their
+    dependencies must already be satisfied in the database). A rerun resumes
+    the earlier ingest; `rebuild` drops the managed indexes and foreign keys
+    again before loading.
+    """
+    for module in (credits, ratings, update_movie_titles, schema_migrations, similar_movies):
+        module.DB_CONFIG.update(DB_CONFIG)
+    selected = STAGES
+    if stages:
+        selected = {name: (function, tuple(dependency for dependency in dependencies if dependency in stages))
+                    for name, (function, dependencies) in STAGES.items() if name in stages}
+        if any(name in selected for name in ('movies', 'users')) and 'scan' not in selected:
+            selected['scan'] = STAGES['scan']
+    context = {'use_cache': use_cache, 'rebuild': rebuild}
+    start = time.perf_counter()
+    timings = run_dag(selected, context)
+    report(timings, time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the movie database from the CSV files in parallel stages.")
+    parser.add_argument('--credits-file', default=credits.CREDITS_FILE)
+    parser.add_argument('--ratings-file', default=ratings.RATINGS_FILE)
+    parser.add_argument('--metadata-file', default=update_movie_titles.METADATA_FILE)
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Processes for parsing and ratings ranges.")
+    parser.add_argument('--copy-connections', type=int, default=COPY_CONNECTIONS,
+                        help="Connections COPYing cast and crew batches.")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help="Run only these stages.")
+    parser.add_argument('--no-cache', action='store_true', help="Re-parse credits.csv instead of using the parsed cache.")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Drop the managed indexes and foreign keys before loading even when resuming.")
+    args = parser.parse_args()
+    # credits.py's parse pool uses the default start method; avoid forking a threaded process.
+    multiprocessing.set_start_method('forkserver')
+    credits.CREDITS_FILE = args.credits_file
+    ratings.RATINGS_FILE = args.ratings_file
+    update_movie_titles.METADATA_FILE = args.metadata_file
+    WORKERS = args.workers
+    COPY_CONNECTIONS = args.copy_connections
+    run_ingest(use_cache=not args.no_cache, stages=args.stages, rebuild=args.rebuild)
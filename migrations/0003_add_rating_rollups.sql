@@ -0,0 +1,23 @@
+-- Per-movie and per-user rating totals, rebuilt by ratings.py after a bulk
+-- load and kept current by insert_specific_rating / delete_rating. Databases
+-- created before this migration may already have the tables from an older
+-- schema.sql; either way the totals are recomputed from ratings.
+
+CREATE TABLE IF NOT EXISTS movie_rating_stats (
+    movie_id INT PRIMARY KEY,
+    num_ratings BIGINT NOT NULL,
+    rating_sum NUMERIC NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_rating_stats (
+    user_id INT PRIMARY KEY,
+    num_ratings BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS user_rating_stats_num_ratings_idx ON user_rating_stats (num_ratings DESC);
+
+TRUNCATE movie_rating_stats, user_rating_stats;
+INSERT INTO movie_rating_stats (movie_id, num_ratings, rating_sum)
+SELECT movie_id, COUNT(rating), COALESCE(SUM(rating), 0) FROM ratings GROUP BY movie_id;
+INSERT INTO user_rating_stats (user_id, num_ratings)
+SELECT user_id, COUNT(*) FROM ratings GROUP BY user_id;
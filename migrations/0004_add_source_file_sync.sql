@@ -0,0 +1,9 @@
+-- Content hash of each source file last synced into the database, so a
+-- loader can skip a file that has not changed since its previous run.
+
+CREATE TABLE source_file_sync (
+    source VARCHAR(255) PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    row_count BIGINT,
+    synced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,15 @@
+-- Chunks of a source file that have been loaded and committed. A loader
+-- inserts a chunk's row in the same transaction as the chunk's data, so a
+-- rerun can skip exactly the chunks that made it in. `unit` says whether
+-- [range_start, range_end) counts bytes or data rows of the file.
+
+CREATE TABLE ingest_progress (
+    source VARCHAR(255) NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    unit VARCHAR(10) NOT NULL,
+    range_start BIGINT NOT NULL,
+    range_end BIGINT NOT NULL,
+    row_count BIGINT,
+    committed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, sha256, unit, range_start, range_end)
+);
@@ -0,0 +1,58 @@
+-- People, jobs and departments become dimensions: "cast" and crew reference
+-- them by integer id instead of repeating name, profile_path, job and
+-- department on every credit. A person is one distinct (name, profile_path).
+-- Existing credits are moved over; credits.py assigns the ids of new ones.
+
+CREATE TABLE people (
+    id INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    profile_path VARCHAR(255)
+);
+
+CREATE INDEX people_name_idx ON people (name);
+
+CREATE TABLE jobs (
+    id SMALLINT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE
+);
+
+CREATE TABLE departments (
+    id SMALLINT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE
+);
+
+INSERT INTO people (id, name, profile_path)
+SELECT row_number() OVER (ORDER BY name, profile_path), name, profile_path
+FROM (SELECT name, profile_path FROM "cast" WHERE name IS NOT NULL
+      UNION
+      SELECT name, profile_path FROM crew WHERE name IS NOT NULL) p;
+
+INSERT INTO jobs (id, name)
+SELECT row_number() OVER (ORDER BY job), job FROM (SELECT DISTINCT job FROM crew WHERE job IS NOT NULL) j;
+
+INSERT INTO departments (id, name)
+SELECT row_number() OVER (ORDER BY department), department
+FROM (SELECT DISTINCT department FROM crew WHERE department IS NOT NULL) d;
+
+ALTER TABLE "cast" ADD COLUMN person_id INT;
+UPDATE "cast" c SET person_id = p.id
+FROM people p
+WHERE p.name = c.name AND p.profile_path IS NOT DISTINCT FROM c.profile_path;
+
+ALTER TABLE crew ADD COLUMN person_id INT, ADD COLUMN job_id SMALLINT, ADD COLUMN department_id SMALLINT;
+UPDATE crew cr SET
+    person_id = (SELECT p.id FROM people p WHERE p.name = cr.name AND p.profile_path IS NOT DISTINCT FROM cr.profile_path),
+    job_id = (SELECT j.id FROM jobs j WHERE j.name = cr.job),
+    department_id = (SELECT d.id FROM departments d WHERE d.name = cr.department);
+
+-- Dropping the columns also drops cast_name_idx and crew_job_name_idx.
+ALTER TABLE "cast" DROP COLUMN name, DROP COLUMN profile_path;
+ALTER TABLE crew DROP COLUMN name, DROP COLUMN profile_path, DROP COLUMN job, DROP COLUMN department;
+
+CREATE INDEX IF NOT EXISTS cast_person_id_idx ON "cast" (person_id);
+CREATE INDEX IF NOT EXISTS crew_job_person_idx ON crew (job_id, person_id);
+
+ALTER TABLE "cast" ADD CONSTRAINT cast_person_id_fkey FOREIGN KEY (person_id) REFERENCES people(id);
+ALTER TABLE crew ADD CONSTRAINT crew_person_id_fkey FOREIGN KEY (person_id) REFERENCES people(id);
+ALTER TABLE crew ADD CONSTRAINT crew_job_id_fkey FOREIGN KEY (job_id) REFERENCES jobs(id);
+ALTER TABLE crew ADD CONSTRAINT crew_department_id_fkey FOREIGN KEY (department_id) REFERENCES departments(id);
@@ -0,0 +1,24 @@
+-- Precomputed item-item neighbours, written by similar_movies.py: the top
+-- neighbours of every movie by cosine similarity of their rating vectors,
+-- so get_similar_movies() is a primary-key range scan.
+
+CREATE TABLE movie_neighbors (
+    movie_id INT NOT NULL,
+    rank SMALLINT NOT NULL,
+    neighbor_id INT NOT NULL,
+    similarity REAL NOT NULL,
+    PRIMARY KEY (movie_id, rank)
+);
+
+-- movie_rating_stats of each movie as of its last neighbour computation, and
+-- the list length and minimum rating count it was computed with. An
+-- incremental refresh recomputes the movies whose totals have changed since.
+
+CREATE TABLE movie_neighbors_state (
+    movie_id INT PRIMARY KEY,
+    num_ratings BIGINT NOT NULL,
+    rating_sum NUMERIC NOT NULL,
+    neighbors SMALLINT NOT NULL,
+    min_ratings INT NOT NULL,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
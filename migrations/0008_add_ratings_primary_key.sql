@@ -0,0 +1,30 @@
+-- A rating is identified by (user_id, movie_id). Without a key, reloading
+-- ratings.csv or inserting an existing rating added a second row. Existing
+-- duplicates are resolved to the latest rating (by timestamp) before the key
+-- is added, and the rollups are rebuilt to match. The key's index carries
+-- rating and timestamp, so a point lookup is an index-only scan, and it
+-- replaces ratings_user_movie_idx. A ratings table partitioned by timestamp
+-- range cannot carry this key; repartition it by hash of movie_id first.
+
+DELETE FROM ratings WHERE user_id IS NULL OR movie_id IS NULL;
+
+DELETE FROM ratings r
+USING (
+    SELECT tableoid, ctid FROM (
+        SELECT tableoid, ctid,
+               row_number() OVER (PARTITION BY user_id, movie_id ORDER BY timestamp DESC NULLS LAST, ctid DESC) AS position
+        FROM ratings
+    ) ranked
+    WHERE position > 1
+) d
+WHERE r.tableoid = d.tableoid AND r.ctid = d.ctid;
+
+ALTER TABLE ratings ADD CONSTRAINT ratings_pkey PRIMARY KEY (user_id, movie_id) INCLUDE (rating, timestamp);
+
+DROP INDEX IF EXISTS ratings_user_movie_idx;
+
+TRUNCATE movie_rating_stats, user_rating_stats;
+INSERT INTO movie_rating_stats (movie_id, num_ratings, rating_sum)
+SELECT movie_id, COUNT(rating), COALESCE(SUM(rating), 0) FROM ratings GROUP BY movie_id;
+INSERT INTO user_rating_stats (user_id, num_ratings)
+SELECT user_id, COUNT(*) FROM ratings GROUP BY user_id;
@@ -0,0 +1,14 @@
+-- A revision number per movie that every write to its ratings replaces with
+-- a new value from movie_rating_revision_seq. Rating totals alone miss
+-- changes that keep them equal (two users swapping ratings, say), so
+-- similar_movies.py compares revisions to find the movies to recompute.
+-- Rebuilding the rollups gives every movie a new revision.
+
+CREATE SEQUENCE movie_rating_revision_seq;
+
+ALTER TABLE movie_rating_stats
+    ADD COLUMN revision BIGINT NOT NULL DEFAULT nextval('movie_rating_revision_seq');
+
+-- The revision each stored neighbour list was computed from; NULL for lists
+-- from before this migration, which are recomputed on the next refresh.
+ALTER TABLE movie_neighbors_state ADD COLUMN revision BIGINT;
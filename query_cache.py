@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_READ_TABLES_RE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+_WRITE_TABLES_RE = re.compile(r'\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?)\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def tables_read(query):
+    """Returns the lower-cased names of the tables a SELECT reads from."""
+    return frozenset(name.lower() for name in _READ_TABLES_RE.findall(query))
+
+
+def tables_written(query):
+    """Returns the lower-cased names of the tables an INSERT/UPDATE/DELETE modifies."""
+    return frozenset(name.lower() for name in _WRITE_TABLES_RE.findall(query))
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def cache_key(query, params=None):
+    return (' '.join(query.split()), _freeze(params))
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query results with a time-to-live. Each entry
+    remembers the tables its query reads, so a write only drops the entries
+    that could have changed. Writes made outside this process are not seen;
+    `ttl` bounds how stale an entry can get.
+    """
+
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, tables, expires_at = entry
+            if self.ttl is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, tables):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, frozenset(tables), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_tables(self, tables):
+        """Drops every entry that reads any of `tables` and returns how many were dropped."""
+        tables = frozenset(table.lower() for table in tables)
+        with self._lock:
+            stale = [key for key, (_, read, _) in self._entries.items() if read & tables]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
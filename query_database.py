@@ -1,6 +1,20 @@
+import itertools
+import numbers
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool as pg_pool
 import pandas as pd
 
+import ratings
+import resolver
+from query_cache import QueryCache, cache_key, tables_read, tables_written
+from query_instrumentation import QueryInstrumentation, caller_name
+from resolver import Resolver
+
 # --- Database Connection Details for PostgreSQL ---
 DB_CONFIG = {
     'user': 'qaim.ali',
@@ -9,115 +23,901 @@ DB_CONFIG = {
     'database': 'movie_db'
 }
 
-def run_query(query, params=None):
+# --- Connection Pool Settings ---
+POOL_MIN_CONNECTIONS = 2
+POOL_MAX_CONNECTIONS = 10
+# Connections idle for longer than this are pinged before being handed out.
+HEALTH_CHECK_INTERVAL = 30.0
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_thread_state = threading.local()
+# Names of the statements already PREPAREd on each pooled connection.
+_prepared_statements = weakref.WeakKeyDictionary()
+_last_used = weakref.WeakKeyDictionary()
+# Whether ratings has its primary key, looked up once per pooled connection;
+# see _ratings_keyed().
+_ratings_keyed_state = weakref.WeakKeyDictionary()
+
+# Read per-movie / per-user totals from the rating rollup tables instead of
+# aggregating the whole ratings table on every call.
+USE_RATING_ROLLUPS = True
+
+# Rows fetched per round trip (and per yielded chunk) by stream_query().
+STREAM_CHUNK_SIZE = 10000
+_stream_names = itertools.count()
+
+# Opt-in result cache for run_query; see enable_query_cache().
+_query_cache = None
+
+# Opt-in per-query timings and slow-query log; see enable_instrumentation().
+_instrumentation = None
+
+# Backend answering the query functions: 'postgres', or 'memory' for the
+# in-process columnar engine (see set_backend()).
+QUERY_BACKEND = os.environ.get('QUERY_BACKEND', 'postgres')
+# Directory of table CSVs (columnar_engine.export_tables) or a snapshot
+# (snapshot.py) the memory backend loads; without it the tables are copied
+# out of the database.
+ENGINE_DATA_DIR = os.environ.get('QUERY_ENGINE_DATA')
+_engine = None
+
+# Test mode (see begin_test_mode()): the one connection every query runs
+# on, or the memory engine's checkpoint, that rollback_test_changes() restores.
+_test_conn = None
+_test_engine_state = None
+
+# Title and person-name resolver; see get_resolver(). Reloaded once older
+# than this many seconds (None: never), which picks up titles and people
+# changed by other processes.
+RESOLVER_TTL = 300.0
+_resolver_lock = threading.Lock()
+
+
+def configure_pool(minconn=None, maxconn=None, health_check_interval=None):
+    """
+    Sets the process-wide pool size and health check interval. An existing
+    pool is closed so the next query starts one with the new settings.
+    """
+    global POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, HEALTH_CHECK_INTERVAL
+    if minconn is not None:
+        POOL_MIN_CONNECTIONS = minconn
+    if maxconn is not None:
+        POOL_MAX_CONNECTIONS = maxconn
+    if health_check_interval is not None:
+        HEALTH_CHECK_INTERVAL = health_check_interval
+    close_pool()
+
+
+def close_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+        _pool_slots = None
+
+
+def _get_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            _pool = pg_pool.ThreadedConnectionPool(POOL_MIN_CONNECTIONS, POOL_MAX_CONNECTIONS, **DB_CONFIG)
+            _pool_slots = threading.BoundedSemaphore(POOL_MAX_CONNECTIONS)
+        return _pool, _pool_slots
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(conn, 0.0) < HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def get_connection(shared=True):
+    """
+    Checks a pooled connection out for the calling thread. Nested uses in the
+    same thread share that connection; it goes back to the pool when the
+    outermost block exits. Blocks while all POOL_MAX_CONNECTIONS are in use.
+    With `shared=False` the caller gets a connection of its own that other
+    calls in the thread will not reuse (e.g. to keep a cursor open).
+    In test mode every caller gets the test connection.
+    """
+    if _test_conn is not None:
+        yield _test_conn
+        return
+    conn = getattr(_thread_state, 'conn', None) if shared else None
+    if conn is not None:
+        _thread_state.depth += 1
+        try:
+            yield conn
+        finally:
+            _thread_state.depth -= 1
+        return
+
+    pool, slots = _get_pool()
+    slots.acquire()
+    try:
+        conn = pool.getconn()
+        while not _is_healthy(conn):
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        if shared:
+            _thread_state.conn, _thread_state.depth = conn, 0
+        try:
+            yield conn
+        finally:
+            if shared:
+                _thread_state.conn = None
+            _last_used[conn] = time.monotonic()
+            pool.putconn(conn, close=conn.closed != 0)
+    finally:
+        slots.release()
+
+
+def _begin(conn):
+    """In test mode, sets a savepoint before a statement so _end() can undo just that statement."""
+    if conn is _test_conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT query")
+
+
+def _end(conn, commit):
+    """
+    Ends a statement's transaction by committing or rolling back. In test
+    mode only the statement's savepoint is released or rolled back, and the
+    test transaction stays open.
+    """
+    if conn.closed:
+        return
+    if conn is not _test_conn:
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        return
+    with conn.cursor() as cursor:
+        if not commit:
+            cursor.execute("ROLLBACK TO SAVEPOINT query")
+        cursor.execute("RELEASE SAVEPOINT query")
+
+
+def begin_test_mode():
+    """
+    Runs every query function on one pooled connection, in a transaction
+    that is never committed. A commit only releases the statement's
+    savepoint, and rollback_test_changes() undoes every write. With the
+    memory backend the engine's state is checkpointed instead. Meant for a
+    test suite running in one thread; end it with end_test_mode().
+    """
+    global _test_conn, _test_engine_state
+    if _test_conn is not None or _test_engine_state is not None:
+        return
+    if QUERY_BACKEND == 'memory':
+        _test_engine_state = _memory_engine().checkpoint()
+    else:
+        pool, _ = _get_pool()
+        _test_conn = pool.getconn()
+        _test_conn.rollback()
+
+
+def rollback_test_changes():
+    """
+    Undoes every write since begin_test_mode() or the previous call, and
+    clears the query cache and what is known of the ratings primary key.
+    """
+    if _test_conn is not None and not _test_conn.closed:
+        _test_conn.rollback()
+    if _test_engine_state is not None:
+        _memory_engine().restore(_test_engine_state)
+    if _query_cache is not None:
+        _query_cache.clear()
+    forget_ratings_keyed()
+
+
+def end_test_mode():
+    """Rolls back the test changes and returns the test connection to the pool."""
+    global _test_conn, _test_engine_state
+    rollback_test_changes()
+    if _test_conn is not None:
+        pool, _ = _get_pool()
+        pool.putconn(_test_conn, close=_test_conn.closed != 0)
+    _test_conn = _test_engine_state = None
+
+
+@contextmanager
+def capture_plans(disable_seqscan=False):
+    """
+    Within this block, run_query and run_commit_query in the calling thread
+    do not execute or commit anything. They run EXPLAIN (FORMAT JSON) on
+    their statement instead and append (query, plan) to the yielded list.
+    With `disable_seqscan`, sequential scans are discouraged so the plan shows
+    whether an index *can* serve the query even on small tables.
+    """
+    plans = []
+    _thread_state.plans = plans
+    _thread_state.disable_seqscan = disable_seqscan
+    try:
+        yield plans
+    finally:
+        _thread_state.plans = None
+
+
+def _plan(query, params, name, options='FORMAT JSON', disable_seqscan=False):
+    """Runs EXPLAIN (`options`) on a statement and returns the top-level JSON plan object."""
+    with get_connection() as conn:
+        _begin(conn)
+        try:
+            with conn.cursor() as cursor:
+                if disable_seqscan:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                statement, values = _prepared_call(conn, name, query, params) if name else (query, params)
+                cursor.execute(f"EXPLAIN ({options}) {statement}", values)
+                return cursor.fetchone()[0][0]
+        finally:
+            _end(conn, commit=False)
+
+
+def _explain(query, params, name):
+    plan = _plan(query, params, name, disable_seqscan=getattr(_thread_state, 'disable_seqscan', False))
+    _thread_state.plans.append((query, plan['Plan']))
+    return pd.DataFrame()
+
+
+def enable_query_cache(maxsize=256, ttl=60.0):
+    """
+    Caches run_query results in-process, keyed by query and params. Writes made
+    through run_commit_query drop only the entries reading the tables they touch.
+    """
+    global _query_cache
+    _query_cache = QueryCache(maxsize=maxsize, ttl=ttl)
+    return _query_cache
+
+
+def disable_query_cache():
+    global _query_cache
+    _query_cache = None
+
+
+def query_cache_stats():
+    """Returns hit/miss/eviction counters for the query cache, or None when it is disabled."""
+    return _query_cache.stats() if _query_cache is not None else None
+
+
+def enable_instrumentation(slow_query_ms=100.0, slow_log_path=None, explain_slow=False):
+    """
+    Records wall time, connection checkout time, row count and calling
+    function of every run_query / run_commit_query call. Queries slower than
+    `slow_query_ms` go to the slow-query log (appended to `slow_log_path` as
+    JSON lines when given). With `explain_slow` each slow entry also gets the
+    statement's plan: EXPLAIN (ANALYZE, BUFFERS) for reads, and plain EXPLAIN
+    for writes so they are not executed a second time.
+    """
+    global _instrumentation
+    _instrumentation = QueryInstrumentation(slow_query_ms=slow_query_ms, slow_log_path=slow_log_path,
+                                            explain_slow=explain_slow)
+    return _instrumentation
+
+
+def disable_instrumentation():
+    global _instrumentation
+    _instrumentation = None
+
+
+def query_stats():
+    """Per (caller, statement) timings as a DataFrame, slowest total first, or None when disabled."""
+    return pd.DataFrame(_instrumentation.stats()) if _instrumentation is not None else None
+
+
+def slow_queries():
+    """The most recent slow-query log entries, or None when instrumentation is disabled."""
+    return _instrumentation.slow_queries() if _instrumentation is not None else None
+
+
+def write_query_metrics(path):
+    """Dumps the query stats to `path` in the Prometheus text format (e.g. for node_exporter's textfile collector)."""
+    if _instrumentation is not None:
+        _instrumentation.write_prometheus(path)
+
+
+def _record_query(instrumentation, query, params, name, started, connected, rows=0, error=None, cached=False,
+                  analyze=False):
+    finished = time.perf_counter()
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    instrumentation.record(caller_name(), query, name, finished - started,
+                           connect_seconds=(connected - started) if connected is not None else 0.0,
+                           rows=rows, error=error, cached=cached, params=params,
+                           explain=lambda: _plan(query, params, name, options))
+
+
+def set_backend(backend, engine=None):
+    """
+    Selects what answers the query functions: 'postgres' (the default) or
+    'memory', a columnar_engine.ColumnarEngine. For 'memory', `engine` is used
+    when given; otherwise one is loaded on first use from ENGINE_DATA_DIR or,
+    if that is unset, from the database.
+    """
+    global QUERY_BACKEND, _engine
+    if backend not in ('postgres', 'memory'):
+        raise ValueError("backend must be 'postgres' or 'memory'")
+    QUERY_BACKEND = backend
+    _engine = engine
+
+
+def _memory_engine():
+    global _engine
+    if _engine is None:
+        from columnar_engine import ColumnarEngine
+        if ENGINE_DATA_DIR:
+            _engine = ColumnarEngine.from_directory(ENGINE_DATA_DIR)
+        else:
+            _engine = ColumnarEngine.from_database(DB_CONFIG)
+    return _engine
+
+
+def get_resolver():
+    """
+    The process-wide resolver.Resolver, built on first use from the database
+    (or the memory backend's tables). It is installed as resolver.current(),
+    so update_movie_titles and the credits loader keep it current in-process.
+    """
+    with _resolver_lock:
+        current = resolver.current()
+        if current is None or (RESOLVER_TTL is not None and current.age() > RESOLVER_TTL):
+            if QUERY_BACKEND == 'memory':
+                engine = _memory_engine()
+                current = Resolver(zip(engine.movies['id'].tolist(), engine.movies['title']),
+                                   zip(engine.people['id'].tolist(), engine.people['name']))
+            else:
+                with get_connection() as conn:
+                    _begin(conn)
+                    try:
+                        with conn.cursor() as cursor:
+                            current = Resolver.from_cursor(cursor)
+                    finally:
+                        _end(conn, commit=False)
+            resolver.install(current)
+        return current
+
+
+def reset_resolver():
+    """Drops the resolver so the next lookup rebuilds it."""
+    resolver.install(None)
+
+
+def _movie_ids(movie):
+    """
+    Ids for `movie`: a movie id is used as is; a title resolves to every
+    movie with that title, ignoring case. Titles the resolver does not know
+    are looked up in the database (and added), so a stale resolver never
+    hides a new movie.
+    """
+    if isinstance(movie, numbers.Integral):
+        return [int(movie)]
+    current = get_resolver()
+    ids = current.movie_ids(movie)
+    if not ids:
+        found = run_query("SELECT id, title FROM movies WHERE LOWER(title) = LOWER(%s);", params=(movie,),
+                          name='resolve_movie_title')
+        if found is not None and not found.empty:
+            current.update_titles(found.itertuples(index=False))
+            ids = current.movie_ids(movie)
+    if len(ids) > 1:
+        print(f"Note: '{movie}' matches {len(ids)} movies (ids {ids}); pass a movie id to get only one.")
+    return ids
+
+
+def _person_ids(person):
+    """Ids for `person`: a person id as is, or every person with exactly that name (see _movie_ids())."""
+    if isinstance(person, numbers.Integral):
+        return [int(person)]
+    current = get_resolver()
+    ids = current.person_ids(person)
+    if not ids:
+        found = run_query("SELECT id, name FROM people WHERE name = %s;", params=(person,), name='resolve_person_name')
+        if found is not None and not found.empty:
+            current.update_people(found.itertuples(index=False))
+            ids = current.person_ids(person)
+    return ids
+
+
+def _server_placeholders(query):
+    """Rewrites psycopg2's %s placeholders into PREPARE's $1, $2, ..."""
+    pieces = query.split('%s')
+    return pieces[0] + ''.join(f"${number}{piece}" for number, piece in enumerate(pieces[1:], start=1))
+
+
+def _prepared_call(conn, name, query, params):
+    """
+    PREPAREs `query` under `name` the first time it runs on `conn` and returns
+    the EXECUTE statement to run instead, so later calls skip parse and plan.
+    """
+    prepared = _prepared_statements.setdefault(conn, set())
+    if name not in prepared:
+        with conn.cursor() as cursor:
+            cursor.execute(f"PREPARE {name} AS {_server_placeholders(query.strip().rstrip(';'))}")
+        prepared.add(name)
+    if not params:
+        return f"EXECUTE {name}", None
+    return f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params
+
+
+def run_query(query, params=None, name=None):
     """
-    Connects to the database, executes a given query, and returns the results
-    as a pandas DataFrame for easy viewing.
+    Executes a given query on a pooled connection and returns the results
+    as a pandas DataFrame for easy viewing. When `name` is given the query is
+    run as a server-side prepared statement of that name.
     """
-    conn = None
+    if getattr(_thread_state, 'plans', None) is not None:
+        return _explain(query, params, name)
+    instrumentation = _instrumentation
+    started = time.perf_counter()
+    connected = None
+    cache = _query_cache
+    if cache is not None:
+        key = cache_key(query, params)
+        cached = cache.get(key)
+        if cached is not None:
+            if instrumentation is not None:
+                _record_query(instrumentation, query, params, name, started, connected, rows=len(cached), cached=True)
+            return cached.copy()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        df = pd.read_sql_query(query, conn, params=params)
-        return df
+        with get_connection() as conn:
+            connected = time.perf_counter()
+            _begin(conn)
+            try:
+                if name:
+                    statement, values = _prepared_call(conn, name, query, params)
+                else:
+                    statement, values = query, params
+                df = pd.read_sql_query(statement, conn, params=values)
+            finally:
+                _end(conn, commit=False)
     except Exception as e:
         print(f"An error occurred: {e}")
+        if instrumentation is not None:
+            _record_query(instrumentation, query, params, name, started, connected, error=e)
         return None
-    finally:
-        if conn:
-            conn.close()
+    if instrumentation is not None:
+        _record_query(instrumentation, query, params, name, started, connected, rows=len(df), analyze=True)
+    if cache is not None:
+        cache.put(key, df.copy(), tables_read(query))
+    return df
 
-def run_commit_query(query, params=None):
+def run_commit_query(query, params=None, name=None):
     """
-    Connects to the database, executes a command that modifies data (UPDATE, DELETE),
-    and commits the change.
+    Executes a command that modifies data (UPDATE, DELETE) on a pooled
+    connection and commits the change. When `name` is given the command is
+    run as a server-side prepared statement of that name. Returns the number
+    of rows the command reported, or None on error.
     """
-    conn = None
+    if getattr(_thread_state, 'plans', None) is not None:
+        _explain(query, params, name)
+        return
+    instrumentation = _instrumentation
+    started = time.perf_counter()
+    connected = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        print("Commit successful.")
+        with get_connection() as conn:
+            connected = time.perf_counter()
+            _begin(conn)
+            try:
+                if name:
+                    statement, values = _prepared_call(conn, name, query, params)
+                else:
+                    statement, values = query, params
+                with conn.cursor() as cursor:
+                    cursor.execute(statement, values)
+                    rows = max(cursor.rowcount, 0)
+                _end(conn, commit=True)
+                print("Commit successful.")
+            except Exception:
+                _end(conn, commit=False)
+                raise
     except Exception as e:
         print(f"An error occurred during commit query: {e}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+        if instrumentation is not None:
+            _record_query(instrumentation, query, params, name, started, connected, error=e)
+        return
+    if instrumentation is not None:
+        _record_query(instrumentation, query, params, name, started, connected, rows=rows)
+    if _query_cache is not None:
+        _query_cache.invalidate_tables(tables_written(query))
+    return rows
+
+def stream_query(query, params=None, chunk_size=None, as_numpy=False):
+    """
+    Runs `query` through a named server-side cursor and yields the result in
+    chunks of `chunk_size` rows, as DataFrames or, with `as_numpy`, as dicts
+    of column name -> NumPy array. Only one chunk is held in memory, and the
+    first chunk is available before the query has produced every row. The
+    generator keeps its own pooled connection until it is exhausted or closed.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    if getattr(_thread_state, 'plans', None) is not None:
+        _explain(query, params, None)
+        return
+    with get_connection(shared=False) as conn:
+        _begin(conn)
+        try:
+            with conn.cursor(name=f"stream_query_{next(_stream_names)}") as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    columns = [column[0] for column in cursor.description]
+                    chunk = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+                    if as_numpy:
+                        yield {column: chunk[column].to_numpy() for column in columns}
+                    else:
+                        yield chunk
+        finally:
+            _end(conn, commit=False)
 
 # --- SELECT Queries ---
 
 def get_top_rated_movies(min_ratings=1000):
     print(f"\n--- 1. Finding Top 10 Highest-Rated Movies (with at least {min_ratings} ratings) ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_top_rated_movies(min_ratings)
+    if USE_RATING_ROLLUPS:
+        query = """
+            SELECT m.title, SUM(s.num_ratings)::BIGINT AS num_ratings,
+                   SUM(s.rating_sum) / NULLIF(SUM(s.num_ratings), 0) AS avg_rating
+            FROM movies m JOIN movie_rating_stats s ON m.id = s.movie_id
+            WHERE s.num_ratings > 0
+            GROUP BY m.title HAVING SUM(s.num_ratings) > %s
+            ORDER BY avg_rating DESC LIMIT 10;
+        """
+        return run_query(query, params=(min_ratings,), name='get_top_rated_movies_rollup')
     query = """
         SELECT m.title, COUNT(r.rating) AS num_ratings, AVG(r.rating) AS avg_rating
         FROM movies m JOIN ratings r ON m.id = r.movie_id
         GROUP BY m.title HAVING COUNT(r.rating) > %s
         ORDER BY avg_rating DESC LIMIT 10;
     """
-    return run_query(query, params=(min_ratings,))
+    return run_query(query, params=(min_ratings,), name='get_top_rated_movies')
 
 def get_most_active_users():
     print("\n--- 2. Finding Top 10 Most Active Users ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_most_active_users()
+    if USE_RATING_ROLLUPS:
+        query = """
+            SELECT u.name, u.email, s.num_ratings AS ratings_count
+            FROM user_rating_stats s JOIN "users" u ON u.id = s.user_id
+            WHERE s.num_ratings > 0
+            ORDER BY s.num_ratings DESC LIMIT 10;
+        """
+        return run_query(query, name='get_most_active_users_rollup')
     query = """
         SELECT u.name, u.email, COUNT(r.user_id) AS ratings_count
         FROM "users" u JOIN ratings r ON u.id = r.user_id
         GROUP BY u.id, u.name, u.email ORDER BY ratings_count DESC LIMIT 10;
     """
-    return run_query(query)
+    return run_query(query, name='get_most_active_users')
+
+# Functions taking a `movie` accept a movie id or a title, and those taking
+# an `actor` a person id or a name; names are resolved to ids with
+# get_resolver() and the query itself is a key lookup.
 
-def get_cast_of_movie(movie_title):
-    print(f"\n--- 3. Finding Cast of '{movie_title}' ---")
+def get_cast_of_movie(movie):
+    print(f"\n--- 3. Finding Cast of '{movie}' ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_cast_of_movie(movie)
     query = """
-        SELECT c.name, c.character_name, c.cast_order
-        FROM "cast" c JOIN movies m ON c.movie_id = m.id
-        WHERE LOWER(m.title) = LOWER(%s) ORDER BY c.cast_order LIMIT 15;
+        SELECT p.name, c.character_name, c.cast_order
+        FROM "cast" c LEFT JOIN people p ON p.id = c.person_id
+        WHERE c.movie_id = ANY(%s::int[]) ORDER BY c.cast_order LIMIT 15;
     """
-    return run_query(query, params=(movie_title,))
+    return run_query(query, params=(_movie_ids(movie),), name='get_cast_of_movie')
 
-def get_director_of_movie(movie_title):
-    print(f"\n--- 4. Finding Director(s) of '{movie_title}' ---")
+def get_director_of_movie(movie):
+    print(f"\n--- 4. Finding Director(s) of '{movie}' ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_director_of_movie(movie)
     query = """
-        SELECT cr.name, cr.job FROM crew cr JOIN movies m ON cr.movie_id = m.id
-        WHERE LOWER(m.title) = LOWER(%s) AND cr.job = 'Director';
+        SELECT p.name, j.name AS job
+        FROM crew cr JOIN jobs j ON j.id = cr.job_id LEFT JOIN people p ON p.id = cr.person_id
+        WHERE cr.movie_id = ANY(%s::int[]) AND j.name = 'Director';
     """
-    return run_query(query, params=(movie_title,))
+    return run_query(query, params=(_movie_ids(movie),), name='get_director_of_movie')
 
-def search_movies_by_actor(actor_name):
-    print(f"\n--- 5. Finding Movies Starring '{actor_name}' ---")
+def search_movies_by_actor(actor):
+    print(f"\n--- 5. Finding Movies Starring '{actor}' ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().search_movies_by_actor(actor)
     query = """
         SELECT m.title, c.character_name FROM movies m JOIN "cast" c ON m.id = c.movie_id
-        WHERE c.name = %s ORDER BY m.title;
+        WHERE c.person_id = ANY(%s::int[]) ORDER BY m.title;
     """
-    return run_query(query, params=(actor_name,))
+    return run_query(query, params=(_person_ids(actor),), name='search_movies_by_actor')
 
-def find_movies_directed_by_actor(actor_name):
-    print(f"\n--- 6. Finding Movies Directed by '{actor_name}' ---")
+def find_movies_directed_by_actor(actor):
+    print(f"\n--- 6. Finding Movies Directed by '{actor}' ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().find_movies_directed_by_actor(actor)
     query = """
         SELECT m.title FROM movies m JOIN crew cr ON m.id = cr.movie_id
-        WHERE cr.job = 'Director' AND cr.name = %s;
+        WHERE cr.job_id = (SELECT id FROM jobs WHERE name = 'Director') AND cr.person_id = ANY(%s::int[]);
+    """
+    return run_query(query, params=(_person_ids(actor),), name='find_movies_directed_by_actor')
+
+def get_similar_movies(movie, k=10):
     """
-    return run_query(query, params=(actor_name,))
+    The `k` movies rated most like `movie` (cosine similarity of the rating
+    vectors), from the lists similar_movies.py precomputes into
+    movie_neighbors, so `k` is at most similar_movies.NEIGHBORS. Columns:
+    movie_id, title, similarity.
+    """
+    print(f"\n--- Finding Movies Similar to '{movie}' ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_similar_movies(movie, k)
+    movie_ids = _movie_ids(movie)
+    query = """
+        SELECT n.neighbor_id AS movie_id, m.title, MAX(n.similarity)::FLOAT8 AS similarity
+        FROM movie_neighbors n JOIN movies m ON m.id = n.neighbor_id
+        WHERE n.movie_id = ANY(%s::int[]) AND n.neighbor_id <> ALL(%s::int[])
+        GROUP BY n.neighbor_id, m.title ORDER BY similarity DESC, movie_id LIMIT %s;
+    """
+    return run_query(query, params=(movie_ids, movie_ids, k), name='get_similar_movies')
+
+def search_titles(prefix, limit=10):
+    """
+    Typeahead search: movies whose title starts with `prefix` (ignoring case,
+    accents and punctuation), then the closest fuzzy (trigram) matches to fill
+    up to `limit` rows. Columns: movie_id, title, match ('prefix' or 'fuzzy'), score.
+    """
+    return pd.DataFrame(get_resolver().search_titles(prefix, limit), columns=['movie_id', 'title', 'match', 'score'])
+
+def search_people(prefix, limit=10):
+    """Like search_titles(), over people's names. Columns: person_id, name, match, score."""
+    return pd.DataFrame(get_resolver().search_people(prefix, limit), columns=['person_id', 'name', 'match', 'score'])
 
 def get_user_by_id(user_id):
-    return run_query('SELECT id, name, email FROM "users" WHERE id = %s;', params=(user_id,))
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_user_by_id(user_id)
+    return run_query('SELECT id, name, email FROM "users" WHERE id = %s;', params=(user_id,), name='get_user_by_id')
 
 def get_specific_rating(user_id, movie_id):
-    return run_query("SELECT * FROM ratings WHERE user_id = %s AND movie_id = %s;", params=(user_id, movie_id))
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_specific_rating(user_id, movie_id)
+    return run_query("SELECT * FROM ratings WHERE user_id = %s AND movie_id = %s;", params=(user_id, movie_id),
+                     name='get_specific_rating')
+
+# --- Streaming Exports ---
+
+def stream_ratings(chunk_size=None, as_numpy=False):
+    """Every rating, in chunks; see stream_query()."""
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().stream_ratings(chunk_size or STREAM_CHUNK_SIZE, as_numpy)
+    query = "SELECT user_id, movie_id, rating, timestamp FROM ratings;"
+    return stream_query(query, chunk_size=chunk_size, as_numpy=as_numpy)
+
+def stream_ratings_for_movie(movie_id, chunk_size=None, as_numpy=False):
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().stream_ratings_for_movie(movie_id, chunk_size or STREAM_CHUNK_SIZE, as_numpy)
+    query = "SELECT user_id, movie_id, rating, timestamp FROM ratings WHERE movie_id = %s;"
+    return stream_query(query, params=(movie_id,), chunk_size=chunk_size, as_numpy=as_numpy)
+
+def stream_cast_credits(chunk_size=None, as_numpy=False):
+    """Every cast credit with its movie title, in chunks; see stream_query()."""
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().stream_cast_credits(chunk_size or STREAM_CHUNK_SIZE, as_numpy)
+    query = """
+        SELECT m.id AS movie_id, m.title, p.name, c.character_name, c.cast_order
+        FROM "cast" c JOIN movies m ON c.movie_id = m.id LEFT JOIN people p ON p.id = c.person_id;
+    """
+    return stream_query(query, chunk_size=chunk_size, as_numpy=as_numpy)
+
+# --- Batch Lookups ---
+# Each resolves a whole list in one round trip by passing it as an array parameter;
+# titles are resolved to movie ids first, as in the single-movie lookups.
+
+def _titled_movie_ids(movie_titles):
+    """
+    (titles, positions, movie ids) lists pairing each of `movie_titles`
+    with every id _movie_ids() resolves it to, for the batch lookups.
+    """
+    titles, positions, movie_ids = [], [], []
+    for position, movie in enumerate(movie_titles, start=1):
+        for movie_id in _movie_ids(movie):
+            titles.append(str(movie))
+            positions.append(position)
+            movie_ids.append(movie_id)
+    return titles, positions, movie_ids
+
+def get_cast_of_movies(movie_titles):
+    """Cast (top 15 by cast order) of every title in `movie_titles`, with a movie_title column."""
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_cast_of_movies(movie_titles)
+    query = """
+        WITH t AS (
+            SELECT title, position, array_agg(movie_id) AS movie_ids
+            FROM unnest(%s::text[], %s::int[], %s::int[]) AS k(title, position, movie_id)
+            GROUP BY title, position
+        )
+        SELECT t.title AS movie_title, c.name, c.character_name, c.cast_order
+        FROM t CROSS JOIN LATERAL (
+            SELECT p.name, c.character_name, c.cast_order
+            FROM "cast" c LEFT JOIN people p ON p.id = c.person_id
+            WHERE c.movie_id = ANY(t.movie_ids) ORDER BY c.cast_order LIMIT 15
+        ) c
+        ORDER BY t.position, c.cast_order;
+    """
+    return run_query(query, params=_titled_movie_ids(movie_titles), name='get_cast_of_movies')
+
+def get_directors_of_movies(movie_titles):
+    """Director(s) of every title in `movie_titles`, with a movie_title column."""
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_directors_of_movies(movie_titles)
+    query = """
+        SELECT t.title AS movie_title, p.name, j.name AS job
+        FROM unnest(%s::text[], %s::int[], %s::int[]) AS t(title, position, movie_id)
+        JOIN crew cr ON cr.movie_id = t.movie_id
+        JOIN jobs j ON j.id = cr.job_id AND j.name = 'Director'
+        LEFT JOIN people p ON p.id = cr.person_id
+        ORDER BY t.position;
+    """
+    return run_query(query, params=_titled_movie_ids(movie_titles), name='get_directors_of_movies')
+
+def search_movies_by_actors(actor_names):
+    """Movies starring any of `actor_names`, with an actor_name column."""
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().search_movies_by_actors(actor_names)
+    query = """
+        SELECT p.name AS actor_name, m.title, c.character_name
+        FROM people p JOIN "cast" c ON c.person_id = p.id JOIN movies m ON m.id = c.movie_id
+        WHERE p.name = ANY(%s::text[]) ORDER BY p.name, m.title;
+    """
+    return run_query(query, params=(list(actor_names),), name='search_movies_by_actors')
+
+def get_users_by_ids(user_ids):
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().get_users_by_ids(user_ids)
+    query = 'SELECT id, name, email FROM "users" WHERE id = ANY(%s::int[]) ORDER BY id;'
+    return run_query(query, params=([int(user_id) for user_id in user_ids],), name='get_users_by_ids')
+
+def verify_rating_rollups():
+    """
+    Recomputes the rating rollups from the ratings table and returns the rows
+    where movie_rating_stats or user_rating_stats disagree. An empty DataFrame
+    means the rollups are consistent.
+    """
+    print("\n--- Verifying rating rollups against a full recompute ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().verify_rating_rollups()
+    query = """
+        SELECT 'movie' AS rollup, COALESCE(s.movie_id, f.movie_id) AS id,
+               s.num_ratings AS stored_count, f.num_ratings AS actual_count,
+               s.rating_sum AS stored_sum, f.rating_sum AS actual_sum
+        FROM (SELECT * FROM movie_rating_stats WHERE num_ratings > 0) s
+        FULL JOIN (SELECT movie_id, COUNT(rating) AS num_ratings, COALESCE(SUM(rating), 0) AS rating_sum
+                   FROM ratings GROUP BY movie_id) f ON s.movie_id = f.movie_id
+        WHERE s.num_ratings IS DISTINCT FROM f.num_ratings OR s.rating_sum IS DISTINCT FROM f.rating_sum
+        UNION ALL
+        SELECT 'user', COALESCE(s.user_id, f.user_id), s.num_ratings, f.num_ratings, NULL, NULL
+        FROM (SELECT * FROM user_rating_stats WHERE num_ratings > 0) s
+        FULL JOIN (SELECT user_id, COUNT(*) AS num_ratings FROM ratings GROUP BY user_id) f ON s.user_id = f.user_id
+        WHERE s.num_ratings IS DISTINCT FROM f.num_ratings;
+    """
+    mismatches = run_query(query)
+    if mismatches is not None:
+        print("Rollups are consistent." if mismatches.empty else f"Found {len(mismatches)} rollup mismatches.")
+    return mismatches
 
 # --- UPDATE, DELETE, and INSERT Queries ---
 
 def update_user_email(user_id, new_email):
     print(f"\n--- UPDATING email for user ID {user_id} ---")
-    run_commit_query('UPDATE "users" SET email = %s WHERE id = %s', (new_email, user_id))
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().update_user_email(user_id, new_email)
+    return run_commit_query('UPDATE "users" SET email = %s WHERE id = %s', (new_email, user_id), name='update_user_email')
 
 def delete_rating(user_id, movie_id):
     print(f"\n--- DELETING rating for user {user_id} on movie {movie_id} ---")
-    run_commit_query("DELETE FROM ratings WHERE user_id = %s AND movie_id = %s", (user_id, movie_id))
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().delete_rating(user_id, movie_id)
+    query = """
+        WITH deleted AS (
+            DELETE FROM ratings WHERE user_id = %s AND movie_id = %s
+            RETURNING user_id, movie_id, rating
+        ), movie_totals AS (
+            UPDATE movie_rating_stats s
+            SET num_ratings = s.num_ratings - d.num_ratings, rating_sum = s.rating_sum - d.rating_sum,
+                revision = nextval('movie_rating_revision_seq')
+            FROM (SELECT movie_id, COUNT(rating) AS num_ratings, COALESCE(SUM(rating), 0) AS rating_sum
+                  FROM deleted GROUP BY movie_id) d
+            WHERE s.movie_id = d.movie_id
+        )
+        UPDATE user_rating_stats s SET num_ratings = s.num_ratings - d.num_ratings
+        FROM (SELECT user_id, COUNT(*) AS num_ratings FROM deleted GROUP BY user_id) d
+        WHERE s.user_id = d.user_id;
+    """
+    return run_commit_query(query, (user_id, movie_id), name='delete_rating')
+
+def _ratings_keyed(conn):
+    """
+    Whether ratings has its primary key, which ratings partitioned by
+    timestamp range lacks. Looked up on a connection's first call and kept
+    until forget_ratings_keyed().
+    """
+    keyed = _ratings_keyed_state.get(conn)
+    if keyed is None:
+        _begin(conn)
+        try:
+            with conn.cursor() as cursor:
+                keyed = ratings.ratings_keyed(cursor)
+        finally:
+            _end(conn, commit=False)
+        _ratings_keyed_state[conn] = keyed
+    return keyed
+
+def forget_ratings_keyed():
+    """Makes every connection look up again whether ratings has its primary key, after it was added or dropped."""
+    _ratings_keyed_state.clear()
 
 def insert_specific_rating(user_id, movie_id, rating, timestamp):
-    """Inserts a specific rating into the database."""
+    """
+    Inserts a specific rating into the database, replacing the user's
+    existing rating of the movie (by deleting it first when ratings has no
+    primary key to upsert on).
+    """
     print(f"\n--- INSERTING rating for user {user_id} on movie {movie_id} ---")
-    query = "INSERT INTO ratings (user_id, movie_id, rating, timestamp) VALUES (%s, %s, %s, %s);"
-    run_commit_query(query, (user_id, movie_id, rating, timestamp))
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().insert_specific_rating(user_id, movie_id, rating, timestamp)
+    incoming = "SELECT %s::int AS user_id, %s::int AS movie_id, %s::numeric AS rating, %s::bigint AS timestamp"
+    try:
+        with get_connection() as conn:
+            if _ratings_keyed(conn):
+                return run_commit_query(ratings.MERGE_RATINGS_SQL.format(incoming=incoming),
+                                        (user_id, movie_id, rating, timestamp), name='insert_specific_rating')
+            return run_commit_query(ratings.REPLACE_RATINGS_SQL.format(incoming=incoming),
+                                    (user_id, movie_id, rating, timestamp), name='replace_specific_rating')
+    except psycopg2.Error as e:
+        print(f"An error occurred during commit query: {e}")
+        return None
+
+def upsert_ratings(rows):
+    """
+    Inserts or updates a batch of ratings, given as a DataFrame (ratings.csv
+    or table column names) or as (user_id, movie_id, rating, timestamp)
+    tuples; the last row of a repeated key wins. The batch is COPYed into a
+    staging table and merged in one statement (ratings.upsert_ratings_chunk),
+    so only new or changed ratings are written. Returns the counts of rows
+    inserted, updated and unchanged, or None on error.
+    """
+    frame = ratings.ratings_frame(rows)
+    print(f"\n--- UPSERTING {len(frame)} ratings ---")
+    if QUERY_BACKEND == 'memory':
+        return _memory_engine().upsert_ratings(frame)
+    try:
+        with get_connection() as conn:
+            _begin(conn)
+            try:
+                with conn.cursor() as cursor:
+                    counts = ratings.upsert_ratings_chunk(cursor, frame)
+                _end(conn, commit=True)
+            except Exception:
+                _end(conn, commit=False)
+                raise
+    except Exception as e:
+        print(f"An error occurred during upsert: {e}")
+        return None
+    print(f"Upserted ratings: {counts['inserted']} inserted, {counts['updated']} updated, "
+          f"{counts['unchanged']} unchanged.")
+    if _query_cache is not None:
+        _query_cache.invalidate_tables(tables_written(ratings.MERGE_RATINGS_SQL))
+    return counts
 
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Upper bounds (seconds) of the query duration histogram buckets.
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = 'movie_db_query'
+
+# Frames skipped when looking for the function that issued a query.
+_INTERNAL_FUNCTIONS = {'run_query', 'run_commit_query', '_record_query'}
+_INTERNAL_FILES = {'query_instrumentation.py', 'contextlib.py'}
+
+
+def caller_name(depth=2):
+    """Name of the first function up the stack that is not part of the query plumbing."""
+    frame = sys._getframe(depth)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name not in _INTERNAL_FUNCTIONS and os.path.basename(code.co_filename) not in _INTERNAL_FILES:
+            return code.co_name
+        frame = frame.f_back
+    return '<unknown>'
+
+
+def statement_label(query, name=None):
+    """A short, stable label for a statement: its prepared name, or a hash of its normalized text."""
+    if name:
+        return name
+    return 'q_' + hashlib.sha1(' '.join(query.split()).encode()).hexdigest()[:10]
+
+
+class _Series:
+    __slots__ = ('query', 'calls', 'errors', 'cache_hits', 'slow', 'rows', 'seconds', 'connect_seconds',
+                 'max_seconds', 'buckets')
+
+    def __init__(self, query):
+        self.query = ' '.join(query.split())
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.slow = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.connect_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class QueryInstrumentation:
+    """
+    Aggregates per-(caller, statement) timings of the queries run through
+    query_database: calls, wall time, time spent waiting for a connection,
+    rows returned or affected, errors and cache hits. Queries slower than
+    `slow_query_ms` are kept in memory (the last `slow_log_size`) and, with
+    `slow_log_path`, appended to that file as JSON lines. Thread-safe.
+    """
+
+    def __init__(self, slow_query_ms=100.0, slow_log_path=None, explain_slow=False, slow_log_size=100):
+        self.slow_query_ms = slow_query_ms
+        self.slow_log_path = slow_log_path
+        self.explain_slow = explain_slow
+        self._series = {}
+        self._slow_queries = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, caller, query, name, seconds, connect_seconds=0.0, rows=0, error=None, cached=False,
+               params=None, explain=None):
+        """
+        Adds one execution to the stats. When the query turns out to be slow
+        and `explain_slow` is set, `explain()` is called to attach its plan to
+        the slow-query log entry.
+        """
+        label = statement_label(query, name)
+        slow = error is None and not cached and seconds * 1000 >= self.slow_query_ms
+        with self._lock:
+            series = self._series.get((caller, label))
+            if series is None:
+                series = self._series[(caller, label)] = _Series(query)
+            series.calls += 1
+            series.seconds += seconds
+            series.connect_seconds += connect_seconds
+            series.rows += rows
+            series.max_seconds = max(series.max_seconds, seconds)
+            series.errors += error is not None
+            series.cache_hits += cached
+            series.slow += slow
+            for position, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    series.buckets[position] += 1
+                    break
+        if slow:
+            self._log_slow(caller, label, series.query, params, seconds, connect_seconds, rows, explain)
+
+    def _log_slow(self, caller, label, query, params, seconds, connect_seconds, rows, explain):
+        entry = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'caller': caller,
+            'statement': label,
+            'query': query,
+            'params': [str(value) for value in params] if params else [],
+            'ms': round(seconds * 1000, 3),
+            'connect_ms': round(connect_seconds * 1000, 3),
+            'rows': rows,
+        }
+        if self.explain_slow and explain is not None:
+            try:
+                entry['plan'] = explain()
+            except Exception as e:
+                entry['plan_error'] = str(e)
+        with self._lock:
+            self._slow_queries.append(entry)
+            if self.slow_log_path:
+                with open(self.slow_log_path, 'a') as slow_log:
+                    slow_log.write(json.dumps(entry, default=str) + '\n')
+
+    def slow_queries(self):
+        """The most recent slow queries, oldest first."""
+        with self._lock:
+            return list(self._slow_queries)
+
+    def stats(self):
+        """One dict per (caller, statement), slowest total time first."""
+        with self._lock:
+            rows = [{
+                'caller': caller,
+                'statement': label,
+                'query': series.query,
+                'calls': series.calls,
+                'errors': series.errors,
+                'cache_hits': series.cache_hits,
+                'slow': series.slow,
+                'rows': series.rows,
+                'total_ms': series.seconds * 1000,
+                'mean_ms': series.seconds * 1000 / series.calls,
+                'max_ms': series.max_seconds * 1000,
+                'connect_ms': series.connect_seconds * 1000,
+            } for (caller, label), series in self._series.items()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._slow_queries.clear()
+
+    def prometheus_text(self):
+        """The stats in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_duration_seconds Wall time of queries run through query_database.",
+            f"# TYPE {METRIC_PREFIX}_duration_seconds histogram",
+        ]
+        counters = {
+            'connect_seconds_total': ('Time spent checking a connection out of the pool.', 'connect_seconds'),
+            'rows_total': ('Rows returned (SELECT) or affected (writes).', 'rows'),
+            'errors_total': ('Queries that raised an error.', 'errors'),
+            'cache_hits_total': ('Queries answered from the query cache.', 'cache_hits'),
+            'slow_total': ('Queries slower than the slow-query threshold.', 'slow'),
+        }
+        counter_lines = {metric: [] for metric in counters}
+        with self._lock:
+            for (caller, label), series in sorted(self._series.items()):
+                labels = f'caller="{caller}",statement="{label}"'
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, series.buckets):
+                    cumulative += count
+                    lines.append(f'{METRIC_PREFIX}_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_duration_seconds_bucket{{{labels},le="+Inf"}} {series.calls}')
+                lines.append(f'{METRIC_PREFIX}_duration_seconds_sum{{{labels}}} {series.seconds:.6f}')
+                lines.append(f'{METRIC_PREFIX}_duration_seconds_count{{{labels}}} {series.calls}')
+                for metric, (_, attribute) in counters.items():
+                    counter_lines[metric].append(f'{METRIC_PREFIX}_{metric}{{{labels}}} {getattr(series, attribute)}')
+        for metric, (help_text, _) in counters.items():
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+            lines.extend(counter_lines[metric])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Writes prometheus_text() to `path` atomically (write then rename), so a
+        node_exporter textfile collector never reads a half-written file.
+        """
+        partial_path = f"{path}.{os.getpid()}.tmp"
+        with open(partial_path, 'w') as metrics_file:
+            metrics_file.write(self.prometheus_text())
+        os.replace(partial_path, path)
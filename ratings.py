@@ -1,10 +1,20 @@
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
 from psycopg2.extensions import register_adapter, AsIs
-from faker import Faker
 import numpy
 
+import schema_migrations
+from checkpoints import completed_ranges, mark_completed
+from copy_utils import CopyStats, copy_binary, copy_columns
+from credits import file_sha256
+from synthetic_users import generate_users
+
 DB_CONFIG = {
     'user': 'qaim.ali',
     'host': 'localhost',
@@ -14,6 +24,18 @@ DB_CONFIG = {
 
 RATINGS_FILE = 'Users/qaim.ali/Downloads/movies/ratings.csv' 
 
+RATINGS_DTYPES = {'userId': numpy.int32, 'movieId': numpy.int32, 'rating': numpy.float64, 'timestamp': numpy.int64}
+RATINGS_COLUMNS = ('user_id', 'movie_id', 'rating', 'timestamp')
+
+# Upper bound on memory used by the streaming loader. A ratings row costs about
+# 24 bytes parsed, 46 bytes as binary COPY and as much again while the payload
+# is assembled, so we budget BYTES_PER_ROW per row in a chunk.
+MAX_MEMORY_MB = 256
+BYTES_PER_ROW = 160
+
+# Size of the byte ranges ratings.csv is split into for parallel loading.
+RANGE_BYTES = 64 * 1024 * 1024
+
 def register_numpy_types():
     def addapt_numpy_float64(numpy_float64):
         return AsIs(numpy_float64) 
@@ -61,19 +83,8 @@ def populate_users_and_ratings():
 
         print("\nPreparing to populate 'users' table...")
         unique_user_ids = df['userId'].unique()
-        fake = Faker()
-        users_to_insert = []
-        for user_id in unique_user_ids:
-            name = fake.name()
-            email = f"{name.lower().replace(' ', '.')}{user_id}@example.com"
-            users_to_insert.append((user_id, name, email))
-        
-        print(f"Found {len(users_to_insert)} unique users. Inserting into database...")
-        execute_values(
-            cursor,
-            'INSERT INTO "users" (id, name, email) VALUES %s ON CONFLICT (id) DO NOTHING',
-            users_to_insert
-        )
+        print(f"Found {len(unique_user_ids)} unique users. Inserting into database...")
+        insert_users(cursor, unique_user_ids)
         print("'users' table populated successfully.")
 
         print("\nPreparing to populate 'ratings' table...")
@@ -86,6 +97,7 @@ def populate_users_and_ratings():
         )
         print("'ratings' table populated successfully.")
 
+        rebuild_rating_rollups(cursor)
         conn.commit()
         print("\nData population for users and ratings completed!")
 
@@ -101,5 +113,613 @@ def populate_users_and_ratings():
             conn.close()
             print("PostgreSQL connection is closed.")
 
+
+REBUILD_ROLLUPS_SQL = """
+    TRUNCATE movie_rating_stats, user_rating_stats;
+    INSERT INTO movie_rating_stats (movie_id, num_ratings, rating_sum)
+    SELECT movie_id, COUNT(rating), COALESCE(SUM(rating), 0) FROM ratings GROUP BY movie_id;
+    INSERT INTO user_rating_stats (user_id, num_ratings)
+    SELECT user_id, COUNT(*) FROM ratings GROUP BY user_id;
+"""
+
+
+def rebuild_rating_rollups(cursor):
+    """Recomputes movie_rating_stats and user_rating_stats from the full ratings table."""
+    print("Rebuilding rating rollups...")
+    cursor.execute(REBUILD_ROLLUPS_SQL)
+
+
+def chunk_rows_for_memory(max_memory_mb=MAX_MEMORY_MB):
+    return max(1, (max_memory_mb * 1024 * 1024) // BYTES_PER_ROW)
+
+
+def insert_missing_movies(cursor, movie_ids, known_movie_ids):
+    """
+    Adds placeholder movies for ids in `movie_ids` that are not yet in
+    `known_movie_ids` (a sorted array) and returns the updated sorted array.
+    """
+    missing = numpy.setdiff1d(movie_ids, known_movie_ids, assume_unique=True)
+    if len(missing):
+        execute_values(
+            cursor,
+            "INSERT INTO movies (id, title) VALUES %s ON CONFLICT (id) DO NOTHING",
+            [(movie_id, f"Title for movie {movie_id}") for movie_id in missing.tolist()]
+        )
+        known_movie_ids = numpy.union1d(known_movie_ids, missing)
+    return known_movie_ids, len(missing)
+
+
+def insert_users(cursor, user_ids):
+    """
+    Generates deterministic names and emails for `user_ids` in one vectorized
+    batch and loads them with COPY through a staging table, keeping the
+    ON CONFLICT DO NOTHING behaviour for users that already exist.
+    """
+    if not len(user_ids):
+        return 0
+    ids, names, emails = generate_users(user_ids)
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS stage_users (id INT, name VARCHAR(255), email VARCHAR(255))")
+    copy_columns(cursor, 'stage_users', ('id', 'name', 'email'), [ids, names, emails])
+    cursor.execute('INSERT INTO "users" (id, name, email) SELECT id, name, email FROM stage_users ON CONFLICT (id) DO NOTHING')
+    cursor.execute("TRUNCATE stage_users")
+    return len(ids)
+
+
+def copy_ratings_chunk(cursor, chunk, table='ratings'):
+    """Ships one parsed ratings chunk as binary COPY straight from its NumPy columns."""
+    return copy_binary(cursor, table, RATINGS_COLUMNS, [
+        ('int4', chunk['userId'].to_numpy()),
+        ('int4', chunk['movieId'].to_numpy()),
+        ('numeric1', chunk['rating'].to_numpy()),
+        ('int8', chunk['timestamp'].to_numpy()),
+    ])
+
+
+def ratings_frame(rows):
+    """
+    A DataFrame with ratings.csv's columns and dtypes from a DataFrame using
+    either ratings.csv's or the table's column names, or from (user_id,
+    movie_id, rating, timestamp) tuples.
+    """
+    if isinstance(rows, pd.DataFrame):
+        frame = rows.rename(columns=dict(zip(RATINGS_COLUMNS, RATINGS_DTYPES)))[list(RATINGS_DTYPES)]
+    else:
+        frame = pd.DataFrame(list(rows), columns=list(RATINGS_DTYPES))
+    return frame.astype(RATINGS_DTYPES)
+
+
+# Merges the rows of {incoming}, a query returning (user_id, movie_id,
+# rating, timestamp) with one row per key, into ratings. Rows that match the
+# stored rating and timestamp are left alone, and the rollups move by the
+# difference between the old and new ratings of the rows actually written.
+# Returns (inserted, updated, incoming rows).
+MERGE_RATINGS_SQL = """
+    WITH incoming AS (
+        {incoming}
+    ), previous AS (
+        SELECT r.user_id, r.movie_id, r.rating FROM ratings r JOIN incoming i USING (user_id, movie_id)
+    ), merged AS (
+        INSERT INTO ratings AS r (user_id, movie_id, rating, timestamp)
+        SELECT user_id, movie_id, rating, timestamp FROM incoming
+        ON CONFLICT (user_id, movie_id) DO UPDATE SET rating = EXCLUDED.rating, timestamp = EXCLUDED.timestamp
+        WHERE (r.rating, r.timestamp) IS DISTINCT FROM (EXCLUDED.rating, EXCLUDED.timestamp)
+        RETURNING r.user_id, r.movie_id, r.rating
+    ), changes AS (
+        SELECT m.user_id, m.movie_id, m.rating AS new_rating, p.rating AS old_rating, p.user_id IS NULL AS inserted
+        FROM merged m LEFT JOIN previous p USING (user_id, movie_id)
+    ), movie_totals AS (
+        INSERT INTO movie_rating_stats AS s (movie_id, num_ratings, rating_sum)
+        SELECT movie_id, COUNT(new_rating) - COUNT(old_rating), COALESCE(SUM(new_rating), 0) - COALESCE(SUM(old_rating), 0)
+        FROM changes GROUP BY movie_id
+        ON CONFLICT (movie_id) DO UPDATE
+        SET num_ratings = s.num_ratings + EXCLUDED.num_ratings, rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+            revision = EXCLUDED.revision
+    ), user_totals AS (
+        INSERT INTO user_rating_stats AS s (user_id, num_ratings)
+        SELECT user_id, COUNT(*) FROM changes WHERE inserted GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET num_ratings = s.num_ratings + EXCLUDED.num_ratings
+    )
+    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted), (SELECT COUNT(*) FROM incoming)
+    FROM changes;
+"""
+
+# MERGE_RATINGS_SQL for a ratings table without its primary key (ratings
+# partitioned by timestamp range, see schema_migrations.partition_ratings()):
+# every stored row of a key that differs from the incoming one is deleted and
+# the incoming row inserted, unless the key already holds it. Nothing stops
+# two concurrent writers of the same new key from both inserting it.
+REPLACE_RATINGS_SQL = """
+    WITH incoming AS (
+        {incoming}
+    ), replaced AS (
+        DELETE FROM ratings r USING incoming i
+        WHERE r.user_id = i.user_id AND r.movie_id = i.movie_id
+        AND (r.rating, r.timestamp) IS DISTINCT FROM (i.rating, i.timestamp)
+        RETURNING r.user_id, r.movie_id, r.rating
+    ), written AS (
+        INSERT INTO ratings (user_id, movie_id, rating, timestamp)
+        SELECT user_id, movie_id, rating, timestamp FROM incoming i
+        WHERE NOT EXISTS (SELECT 1 FROM ratings r WHERE r.user_id = i.user_id AND r.movie_id = i.movie_id
+                          AND (r.rating, r.timestamp) IS NOT DISTINCT FROM (i.rating, i.timestamp))
+        RETURNING user_id, movie_id, rating
+    ), changes AS (
+        SELECT user_id, movie_id, rating, 1 AS sign FROM written
+        UNION ALL
+        SELECT user_id, movie_id, rating, -1 FROM replaced
+    ), movie_totals AS (
+        INSERT INTO movie_rating_stats AS s (movie_id, num_ratings, rating_sum)
+        SELECT movie_id, COALESCE(SUM(sign) FILTER (WHERE rating IS NOT NULL), 0), COALESCE(SUM(sign * rating), 0)
+        FROM changes GROUP BY movie_id
+        ON CONFLICT (movie_id) DO UPDATE
+        SET num_ratings = s.num_ratings + EXCLUDED.num_ratings, rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+            revision = EXCLUDED.revision
+    ), user_totals AS (
+        INSERT INTO user_rating_stats AS s (user_id, num_ratings)
+        SELECT user_id, SUM(sign) FROM changes GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET num_ratings = s.num_ratings + EXCLUDED.num_ratings
+    )
+    SELECT COUNT(*) FILTER (WHERE p.user_id IS NULL), COUNT(*) FILTER (WHERE p.user_id IS NOT NULL),
+           (SELECT COUNT(*) FROM incoming)
+    FROM written w LEFT JOIN (SELECT DISTINCT user_id, movie_id FROM replaced) p USING (user_id, movie_id);
+"""
+
+
+def ratings_keyed(cursor):
+    """Whether ratings has its (user_id, movie_id) primary key; ratings partitioned by timestamp range has none."""
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'ratings'::regclass AND contype = 'p')")
+    return cursor.fetchone()[0]
+
+
+def merge_ratings_sql(cursor, incoming):
+    """MERGE_RATINGS_SQL for `incoming`, or REPLACE_RATINGS_SQL when ratings has no primary key."""
+    return (MERGE_RATINGS_SQL if ratings_keyed(cursor) else REPLACE_RATINGS_SQL).format(incoming=incoming)
+
+
+# The last staged row of each key, by COPY order.
+STAGED_RATINGS_SQL = ("SELECT DISTINCT ON (user_id, movie_id) user_id, movie_id, rating, timestamp "
+                      "FROM stage_ratings ORDER BY user_id, movie_id, position DESC")
+
+
+def upsert_ratings_chunk(cursor, chunk):
+    """
+    Upserts one parsed ratings chunk: the rows are binary-COPYed into a
+    staging table and merged into ratings with INSERT ... ON CONFLICT DO
+    UPDATE, which only rewrites ratings whose rating or timestamp changed.
+    The rating rollups are updated in the same statement. Without the
+    ratings primary key (migration 8) the changed ratings are deleted and
+    reinserted instead. The chunk's movies and users must exist.
+    Returns the counts of rows 'inserted', 'updated' and left 'unchanged',
+    and of 'duplicates' (earlier rows for a key repeated in the chunk).
+    """
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS stage_ratings (position BIGSERIAL, user_id INT, movie_id INT, "
+                   "rating DECIMAL(2, 1), timestamp BIGINT)")
+    staged = copy_ratings_chunk(cursor, chunk, table='stage_ratings')
+    cursor.execute(merge_ratings_sql(cursor, STAGED_RATINGS_SQL))
+    inserted, updated, distinct = cursor.fetchone()
+    cursor.execute("TRUNCATE stage_ratings")
+    return {'inserted': inserted, 'updated': updated, 'unchanged': distinct - inserted - updated,
+            'duplicates': staged - distinct}
+
+
+def upsert_users_and_ratings(max_memory_mb=MAX_MEMORY_MB, chunk_rows=None):
+    """
+    Streams ratings.csv like the streaming loader, but merges each chunk
+    with upsert_ratings_chunk() instead of appending it, and commits per
+    chunk. Loading the same file again changes nothing, and loading a newer
+    dump only writes the ratings that differ. The rollups are kept current
+    as it goes, so they are not rebuilt at the end.
+    """
+    chunk_rows = chunk_rows or chunk_rows_for_memory(max_memory_mb)
+    conn = None
+    cursor = None
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0}
+    try:
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id FROM movies")
+        known_movie_ids = numpy.sort(numpy.array([row[0] for row in cursor.fetchall()], dtype=numpy.int64))
+        cursor.execute('SELECT id FROM "users"')
+        seen_user_ids = numpy.sort(numpy.array([row[0] for row in cursor.fetchall()], dtype=numpy.int64))
+
+        print(f"Upserting '{RATINGS_FILE}' in chunks of {chunk_rows} rows...")
+        start = time.perf_counter()
+        for chunk in pd.read_csv(RATINGS_FILE, dtype=RATINGS_DTYPES, chunksize=chunk_rows):
+            known_movie_ids, _ = insert_missing_movies(cursor, numpy.unique(chunk['movieId'].to_numpy()), known_movie_ids)
+            new_user_ids = numpy.setdiff1d(numpy.unique(chunk['userId'].to_numpy()), seen_user_ids, assume_unique=True)
+            insert_users(cursor, new_user_ids)
+            seen_user_ids = numpy.union1d(seen_user_ids, new_user_ids)
+
+            for key, count in upsert_ratings_chunk(cursor, chunk).items():
+                counts[key] += count
+            conn.commit()
+            print(f"Merged {sum(counts.values())} ratings ({counts['inserted']} new, {counts['updated']} changed)...")
+
+        print(f"\nUpsert of users and ratings completed in {time.perf_counter() - start:.2f}s: "
+              f"{counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+              f"{counts['duplicates']} repeated in the file.")
+
+    except FileNotFoundError:
+        print(f"Error: The file '{RATINGS_FILE}' was not found.")
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            if cursor is not None:
+                cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+    return counts
+
+
+def populate_users_and_ratings_streaming(max_memory_mb=MAX_MEMORY_MB, chunk_rows=None, commit_per_chunk=False):
+    """
+    Loads ratings.csv in chunks sized to stay under `max_memory_mb` (or exactly
+    `chunk_rows` rows). For each chunk the new placeholder movies and users are
+    upserted first, then the ratings are sent as binary COPY. Only the sets of
+    seen movie and user ids grow with the file; they are bounded by the number
+    of distinct movies and users, not by the number of ratings.
+    """
+    chunk_rows = chunk_rows or chunk_rows_for_memory(max_memory_mb)
+    conn = None
+    cursor = None
+    stats = CopyStats()
+    try:
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id FROM movies")
+        known_movie_ids = numpy.sort(numpy.array([row[0] for row in cursor.fetchall()], dtype=numpy.int64))
+        print(f"Found {len(known_movie_ids)} movies already in the database.")
+        seen_user_ids = numpy.empty(0, dtype=numpy.int64)
+
+        print(f"Streaming '{RATINGS_FILE}' in chunks of {chunk_rows} rows...")
+        start = time.perf_counter()
+        total = 0
+        for chunk in pd.read_csv(RATINGS_FILE, dtype=RATINGS_DTYPES, chunksize=chunk_rows):
+            step = time.perf_counter()
+            known_movie_ids, added = insert_missing_movies(cursor, numpy.unique(chunk['movieId'].to_numpy()), known_movie_ids)
+            stats.record('movies', added, time.perf_counter() - step)
+
+            step = time.perf_counter()
+            new_user_ids = numpy.setdiff1d(numpy.unique(chunk['userId'].to_numpy()), seen_user_ids, assume_unique=True)
+            stats.record('users', insert_users(cursor, new_user_ids), time.perf_counter() - step)
+            seen_user_ids = numpy.union1d(seen_user_ids, new_user_ids)
+
+            step = time.perf_counter()
+            total += copy_ratings_chunk(cursor, chunk)
+            stats.record('ratings', len(chunk), time.perf_counter() - step)
+
+            if commit_per_chunk:
+                conn.commit()
+            print(f"Loaded {total} ratings...")
+
+        rebuild_rating_rollups(cursor)
+        conn.commit()
+        print(f"\nData population for users and ratings completed in {time.perf_counter() - start:.2f}s!")
+        stats.report()
+
+    except FileNotFoundError:
+        print(f"Error: The file '{RATINGS_FILE}' was not found.")
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            if cursor is not None:
+                cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+
+def ratings_byte_ranges(path=None, range_bytes=RANGE_BYTES, completed=()):
+    """
+    Splits ratings.csv (after its header line) into [start, end) byte ranges
+    of about `range_bytes` that each start and end on a line boundary, so
+    every range can be parsed on its own. Bytes covered by the `completed`
+    ranges (e.g. checkpoints from an earlier run) are left out, whatever
+    range size they were cut with.
+    """
+    path = path or RATINGS_FILE
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as ratings_file:
+        ratings_file.readline()
+        gaps = []
+        position = ratings_file.tell()
+        for start, end in sorted(completed):
+            if start > position:
+                gaps.append((position, start))
+            position = max(position, end)
+        if position < size:
+            gaps.append((position, size))
+
+        for start, gap_end in gaps:
+            while start < gap_end:
+                ratings_file.seek(min(start + range_bytes, gap_end))
+                if ratings_file.tell() < gap_end:
+                    ratings_file.readline()
+                end = ratings_file.tell()
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def read_ratings_range(start, end, chunk_rows, path=None):
+    """Yields the rows in bytes [start, end) of ratings.csv as DataFrames of at most `chunk_rows` rows."""
+    with open(path or RATINGS_FILE, 'rb') as ratings_file:
+        ratings_file.seek(start)
+        data = ratings_file.read(end - start)
+    if data.strip():
+        yield from pd.read_csv(io.BytesIO(data), header=None, names=list(RATINGS_DTYPES), dtype=RATINGS_DTYPES,
+                               chunksize=chunk_rows)
+
+
+def load_ratings_range(db_config, start, end, chunk_rows=None, path=None, sha256=None):
+    """
+    Process-pool worker: COPYs one byte range of ratings.csv over its own
+    connection in a single transaction and returns the number of rows loaded.
+    The range's movies and users must already exist. With the file's
+    `sha256`, the range is checkpointed in ingest_progress in the same
+    transaction.
+    """
+    chunk_rows = chunk_rows or chunk_rows_for_memory()
+    conn = psycopg2.connect(**db_config)
+    try:
+        total = 0
+        with conn.cursor() as cursor:
+            for chunk in read_ratings_range(start, end, chunk_rows, path):
+                total += copy_ratings_chunk(cursor, chunk)
+            if sha256:
+                mark_completed(cursor, path or RATINGS_FILE, sha256, 'bytes', start, end, total)
+        conn.commit()
+        return total
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def populate_users_and_ratings_checkpointed(range_bytes=RANGE_BYTES, max_memory_mb=MAX_MEMORY_MB, chunk_rows=None):
+    """
+    Streaming load that commits ratings.csv one newline-aligned byte range
+    (about `range_bytes`) at a time, together with the range's ingest_progress
+    row. A rerun after a failure skips the committed ranges and loads only
+    the rest. The placeholder-movie and user upserts use ON CONFLICT DO
+    NOTHING, so redoing a rolled-back range never duplicates anything.
+    """
+    chunk_rows = chunk_rows or chunk_rows_for_memory(max_memory_mb)
+    conn = None
+    cursor = None
+    stats = CopyStats()
+    try:
+        print(f"Hashing '{RATINGS_FILE}'...")
+        sha256 = file_sha256(RATINGS_FILE)
+
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        done = completed_ranges(cursor, RATINGS_FILE, sha256, 'bytes')
+        ranges = ratings_byte_ranges(RATINGS_FILE, range_bytes, completed=done)
+        if done:
+            print(f"Resuming: {len(done)} ranges were already loaded, {len(ranges)} remain.")
+
+        cursor.execute("SELECT id FROM movies")
+        known_movie_ids = numpy.sort(numpy.array([row[0] for row in cursor.fetchall()], dtype=numpy.int64))
+        seen_user_ids = numpy.empty(0, dtype=numpy.int64)
+
+        start_time = time.perf_counter()
+        total = 0
+        for number, (start, end) in enumerate(ranges, start=1):
+            loaded = 0
+            range_movie_ids, range_user_ids = known_movie_ids, seen_user_ids
+            for chunk in read_ratings_range(start, end, chunk_rows):
+                step = time.perf_counter()
+                range_movie_ids, added = insert_missing_movies(cursor, numpy.unique(chunk['movieId'].to_numpy()),
+                                                               range_movie_ids)
+                stats.record('movies', added, time.perf_counter() - step)
+
+                step = time.perf_counter()
+                new_user_ids = numpy.setdiff1d(numpy.unique(chunk['userId'].to_numpy()), range_user_ids,
+                                               assume_unique=True)
+                stats.record('users', insert_users(cursor, new_user_ids), time.perf_counter() - step)
+                range_user_ids = numpy.union1d(range_user_ids, new_user_ids)
+
+                step = time.perf_counter()
+                loaded += copy_ratings_chunk(cursor, chunk)
+                stats.record('ratings', len(chunk), time.perf_counter() - step)
+
+            mark_completed(cursor, RATINGS_FILE, sha256, 'bytes', start, end, loaded)
+            conn.commit()
+            known_movie_ids, seen_user_ids = range_movie_ids, range_user_ids
+            total += loaded
+            print(f"Committed range {number}/{len(ranges)} (bytes {start}-{end}); loaded {total} ratings...")
+
+        rebuild_rating_rollups(cursor)
+        conn.commit()
+        print(f"\nData population for users and ratings completed in {time.perf_counter() - start_time:.2f}s!")
+        stats.report()
+
+    except FileNotFoundError:
+        print(f"Error: The file '{RATINGS_FILE}' was not found.")
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        print("Committed ranges are kept; rerun to resume from the first uncommitted one.")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            if cursor is not None:
+                cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+
+class PartitionRouter:
+    """
+    Assigns ratings rows to the partitions of a partitioned `ratings` table.
+    Range partitions are matched on timestamp with NumPy. For hash partitions,
+    each new movie id is classified once with satisfies_hash_partition() and
+    then remembered.
+    """
+
+    def __init__(self, cursor):
+        self.strategy, partitions = schema_migrations.ratings_partitions(cursor)
+        self.tables = [name for name, _ in partitions]
+        self.bounds = [bound for _, bound in partitions]
+        self._movie_ids = numpy.empty(0, dtype=numpy.int64)
+        self._movie_partitions = numpy.empty(0, dtype=numpy.int64)
+
+    def _classify_movies(self, cursor, movie_ids):
+        new_ids = numpy.setdiff1d(movie_ids, self._movie_ids, assume_unique=True)
+        if not len(new_ids):
+            return
+        new_partitions = numpy.full(len(new_ids), -1, dtype=numpy.int64)
+        for number, (modulus, remainder) in enumerate(self.bounds):
+            cursor.execute(
+                "SELECT m FROM unnest(%s::int[]) AS m WHERE satisfies_hash_partition('ratings'::regclass, %s, %s, m)",
+                (new_ids.tolist(), modulus, remainder)
+            )
+            matched = numpy.array([row[0] for row in cursor.fetchall()], dtype=numpy.int64)
+            new_partitions[numpy.isin(new_ids, matched)] = number
+        movie_ids = numpy.concatenate([self._movie_ids, new_ids])
+        partitions = numpy.concatenate([self._movie_partitions, new_partitions])
+        order = numpy.argsort(movie_ids)
+        self._movie_ids, self._movie_partitions = movie_ids[order], partitions[order]
+
+    def route(self, cursor, chunk):
+        """Returns, for each partition in self.tables, the positions of the chunk rows that belong to it."""
+        if self.strategy == 'hash':
+            movie_ids = chunk['movieId'].to_numpy()
+            self._classify_movies(cursor, numpy.unique(movie_ids))
+            assigned = self._movie_partitions[numpy.searchsorted(self._movie_ids, movie_ids)]
+            return [numpy.flatnonzero(assigned == number) for number in range(len(self.tables))]
+
+        timestamps = chunk['timestamp'].to_numpy()
+        unassigned = numpy.ones(len(timestamps), dtype=bool)
+        positions = []
+        for bound in self.bounds:
+            if bound is None:
+                positions.append(None)
+                continue
+            low, high = bound
+            mask = unassigned.copy()
+            if low is not None:
+                mask &= timestamps >= low
+            if high is not None:
+                mask &= timestamps < high
+            unassigned &= ~mask
+            positions.append(numpy.flatnonzero(mask))
+        return [numpy.flatnonzero(unassigned) if position is None else position for position in positions]
+
+
+def _copy_partition(conn, table, rows, commit):
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        count = copy_ratings_chunk(cursor, rows, table=table)
+    if commit:
+        conn.commit()
+    return table, count, time.perf_counter() - start
+
+
+def populate_ratings_by_partition(max_memory_mb=MAX_MEMORY_MB, chunk_rows=None, commit_per_chunk=False):
+    """
+    Streaming load for a partitioned `ratings` table. Each partition is
+    written over its own connection, and the partitions of a chunk are COPYed
+    in parallel. New movies and users are committed before each chunk's
+    ratings so the partition connections can see them. Without
+    `commit_per_chunk`, every partition connection commits once at the end.
+    """
+    chunk_rows = chunk_rows or chunk_rows_for_memory(max_memory_mb)
+    conn = None
+    cursor = None
+    partition_conns = []
+    stats = CopyStats()
+    try:
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        router = PartitionRouter(cursor)
+        if router.strategy is None:
+            print("'ratings' is not partitioned; use the streaming loader instead.")
+            return
+        print(f"'ratings' has {len(router.tables)} {router.strategy} partitions; opening one connection per partition...")
+        partition_conns = [psycopg2.connect(**DB_CONFIG) for _ in router.tables]
+
+        cursor.execute("SELECT id FROM movies")
+        known_movie_ids = numpy.sort(numpy.array([row[0] for row in cursor.fetchall()], dtype=numpy.int64))
+        seen_user_ids = numpy.empty(0, dtype=numpy.int64)
+
+        print(f"Streaming '{RATINGS_FILE}' in chunks of {chunk_rows} rows...")
+        start = time.perf_counter()
+        total = 0
+        with ThreadPoolExecutor(max_workers=len(partition_conns)) as executor:
+            for chunk in pd.read_csv(RATINGS_FILE, dtype=RATINGS_DTYPES, chunksize=chunk_rows):
+                known_movie_ids, _ = insert_missing_movies(cursor, numpy.unique(chunk['movieId'].to_numpy()), known_movie_ids)
+                new_user_ids = numpy.setdiff1d(numpy.unique(chunk['userId'].to_numpy()), seen_user_ids, assume_unique=True)
+                insert_users(cursor, new_user_ids)
+                seen_user_ids = numpy.union1d(seen_user_ids, new_user_ids)
+                conn.commit()
+
+                futures = [
+                    executor.submit(_copy_partition, partition_conn, table, chunk.take(positions), commit_per_chunk)
+                    for partition_conn, table, positions in zip(partition_conns, router.tables, router.route(cursor, chunk))
+                    if len(positions)
+                ]
+                for future in futures:
+                    table, count, seconds = future.result()
+                    stats.record(table, count, seconds)
+                    total += count
+                print(f"Loaded {total} ratings...")
+
+        for partition_conn in partition_conns:
+            partition_conn.commit()
+        rebuild_rating_rollups(cursor)
+        conn.commit()
+        print(f"\nData population for users and ratings completed in {time.perf_counter() - start:.2f}s!")
+        stats.report()
+
+    except FileNotFoundError:
+        print(f"Error: The file '{RATINGS_FILE}' was not found.")
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        for partition_conn in partition_conns:
+            partition_conn.rollback()
+        if conn:
+            conn.rollback()
+    finally:
+        for partition_conn in partition_conns:
+            partition_conn.close()
+        if conn is not None:
+            if cursor is not None:
+                cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+
 if __name__ == "__main__":
-    populate_users_and_ratings()
+    parser = argparse.ArgumentParser(description="Load users and ratings from ratings.csv.")
+    parser.add_argument('--mode', choices=('stream', 'checkpointed', 'partitioned', 'upsert', 'bulk'), default='stream',
+                        help="'stream' loads bounded chunks with binary COPY; 'checkpointed' does the same but commits "
+                             "per byte range and resumes after a failure; 'partitioned' uses one connection per "
+                             "ratings partition; 'upsert' merges the file into existing ratings, writing only "
+                             "the changed ones; 'bulk' is the original single-batch loader.")
+    parser.add_argument('--range-mb', type=int, default=RANGE_BYTES // (1024 * 1024),
+                        help="Size of the committed byte ranges in checkpointed mode.")
+    parser.add_argument('--max-memory-mb', type=int, default=MAX_MEMORY_MB)
+    parser.add_argument('--chunk-rows', type=int, help="Rows per chunk; overrides --max-memory-mb.")
+    parser.add_argument('--commit-per-chunk', action='store_true')
+    args = parser.parse_args()
+    if args.mode == 'stream':
+        populate_users_and_ratings_streaming(args.max_memory_mb, args.chunk_rows, args.commit_per_chunk)
+    elif args.mode == 'checkpointed':
+        populate_users_and_ratings_checkpointed(args.range_mb * 1024 * 1024, args.max_memory_mb, args.chunk_rows)
+    elif args.mode == 'partitioned':
+        populate_ratings_by_partition(args.max_memory_mb, args.chunk_rows, args.commit_per_chunk)
+    elif args.mode == 'upsert':
+        upsert_users_and_ratings(args.max_memory_mb, args.chunk_rows)
+    else:
+        populate_users_and_ratings()
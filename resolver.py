@@ -0,0 +1,241 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+
+# search(): fraction of the query's trigrams a name must share to count as a
+# fuzzy match, and how many results are returned by default.
+SIMILARITY_THRESHOLD = 0.4
+SEARCH_LIMIT = 10
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# The resolver the loaders keep current, installed by query_database.get_resolver().
+_current = None
+
+
+def normalize(text):
+    """Search key for a name: case-folded, accents stripped, punctuation and whitespace runs collapsed to one space."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def trigrams(key):
+    """pg_trgm-style trigrams of a normalized key: every word padded with two spaces in front and one behind."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[start:start + 3] for start in range(len(padded) - 2))
+    return grams
+
+
+class _NameIndex:
+    """
+    Searchable id -> name column. Exact lookups go through `exact_key(name)`;
+    prefix search runs on the sorted normalized keys (a binary search gives
+    the same range a prefix trie would, in a flat list), and fuzzy search
+    scores keys by the share of the query's trigrams they contain. The
+    trigram index is only built on the first fuzzy search.
+    """
+
+    def __init__(self, exact_key):
+        self._exact_key = exact_key
+        self._names = {}
+        self._exact = defaultdict(set)
+        self._by_key = defaultdict(set)
+        self._keys = []
+        self._trigrams = None
+        self._trigram_counts = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def update(self, rows):
+        """Adds or renames entries from (id, name) rows; a None name removes the entry."""
+        rows = list(rows)
+        # Big batches skip the sorted insert per key and sort once at the end.
+        bulk = len(rows) > 100
+        for entry_id, name in rows:
+            self._remove(entry_id, keep_sorted=not bulk)
+            if name is not None:
+                self._add(entry_id, name, keep_sorted=not bulk)
+        if bulk:
+            self._keys = sorted(self._by_key)
+
+    def _add(self, entry_id, name, keep_sorted):
+        self._names[entry_id] = name
+        self._exact[self._exact_key(name)].add(entry_id)
+        key = normalize(name)
+        if key not in self._by_key:
+            if keep_sorted:
+                bisect.insort(self._keys, key)
+            if self._trigrams is not None:
+                self._index_trigrams(key)
+        self._by_key[key].add(entry_id)
+
+    def _remove(self, entry_id, keep_sorted):
+        name = self._names.pop(entry_id, None)
+        if name is None:
+            return
+        exact = self._exact_key(name)
+        self._exact[exact].discard(entry_id)
+        if not self._exact[exact]:
+            del self._exact[exact]
+        key = normalize(name)
+        self._by_key[key].discard(entry_id)
+        if not self._by_key[key]:
+            del self._by_key[key]
+            if keep_sorted:
+                del self._keys[bisect.bisect_left(self._keys, key)]
+            if self._trigrams is not None:
+                for gram in trigrams(key):
+                    self._trigrams[gram].discard(key)
+                del self._trigram_counts[key]
+
+    def _index_trigrams(self, key):
+        grams = trigrams(key)
+        for gram in grams:
+            self._trigrams[gram].add(key)
+        self._trigram_counts[key] = len(grams)
+
+    def ids(self, name):
+        return sorted(self._exact.get(self._exact_key(name), ()))
+
+    def name(self, entry_id):
+        return self._names.get(entry_id)
+
+    def _matches(self, keys):
+        return [(entry_id, self._names[entry_id]) for key in keys for entry_id in sorted(self._by_key[key])]
+
+    def prefix(self, key, limit):
+        """Entries whose normalized name starts with `key`, shortest first."""
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + '\uffff', lo=start)
+        keys = sorted(self._keys[start:end], key=lambda candidate: (len(candidate), candidate))
+        return self._matches(keys)[:limit]
+
+    def similar(self, key, limit, threshold):
+        """(id, name, score) of the entries sharing at least `threshold` of `key`'s trigrams, best first."""
+        grams = trigrams(key)
+        if not grams:
+            return []
+        if self._trigrams is None:
+            self._trigrams = defaultdict(set)
+            for indexed in self._by_key:
+                self._index_trigrams(indexed)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigrams.get(gram, ()))
+        scored = [(count / len(grams), candidate) for candidate, count in shared.items()
+                  if count / len(grams) >= threshold]
+        scored.sort(key=lambda item: (-item[0], self._trigram_counts[item[1]], item[1]))
+        results = []
+        for score, candidate in scored:
+            results.extend((entry_id, name, score) for entry_id, name in self._matches([candidate]))
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+    def search(self, text, limit, threshold):
+        """
+        Prefix matches of `text` first, then fuzzy matches to fill up to
+        `limit`, as (id, name, match, score) with match 'prefix' or 'fuzzy'.
+        """
+        key = normalize(text)
+        if not key:
+            return []
+        results = [(entry_id, name, 'prefix', 1.0) for entry_id, name in self.prefix(key, limit)]
+        if len(results) < limit:
+            seen = {entry_id for entry_id, *_ in results}
+            for entry_id, name, score in self.similar(key, limit + len(results), threshold):
+                if entry_id not in seen:
+                    results.append((entry_id, name, 'fuzzy', score))
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+class Resolver:
+    """
+    In-memory title -> movie id and name -> person id index with prefix and
+    typo-tolerant search. Titles match case-insensitively, like
+    LOWER(title) = LOWER(%s); people's names match exactly. Build it with
+    from_cursor() (or from rows) and keep it current with update_titles() /
+    update_people() instead of rebuilding. Thread-safe.
+    """
+
+    def __init__(self, titles=(), people=()):
+        self.titles = _NameIndex(str.lower)
+        self.people = _NameIndex(lambda name: name)
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+        self.update_titles(titles)
+        self.update_people(people)
+
+    @classmethod
+    def from_cursor(cls, cursor):
+        """Loads every movie title and person name through `cursor`."""
+        cursor.execute("SELECT id, title FROM movies WHERE title IS NOT NULL")
+        titles = cursor.fetchall()
+        cursor.execute("SELECT id, name FROM people")
+        return cls(titles, cursor.fetchall())
+
+    def age(self):
+        return time.monotonic() - self.built_at
+
+    def update_titles(self, rows):
+        """Adds or renames movies from (id, title) rows."""
+        with self._lock:
+            self.titles.update((int(movie_id), title) for movie_id, title in rows)
+
+    def update_people(self, rows):
+        """Adds or renames people from (id, name) rows."""
+        with self._lock:
+            self.people.update((int(person_id), name) for person_id, name in rows)
+
+    def movie_ids(self, title):
+        with self._lock:
+            return self.titles.ids(title)
+
+    def person_ids(self, name):
+        with self._lock:
+            return self.people.ids(name)
+
+    def title_of(self, movie_id):
+        with self._lock:
+            return self.titles.name(movie_id)
+
+    def search_titles(self, text, limit=SEARCH_LIMIT, threshold=SIMILARITY_THRESHOLD):
+        """(movie id, title, match, score) for titles starting with, or else resembling, `text`."""
+        with self._lock:
+            return self.titles.search(text, limit, threshold)
+
+    def search_people(self, text, limit=SEARCH_LIMIT, threshold=SIMILARITY_THRESHOLD):
+        """(person id, name, match, score) for names starting with, or else resembling, `text`."""
+        with self._lock:
+            return self.people.search(text, limit, threshold)
+
+
+def install(resolver):
+    """Makes `resolver` the one title_changes() and people_added() keep current."""
+    global _current
+    _current = resolver
+
+
+def current():
+    return _current
+
+
+def title_changes(rows):
+    """Called by update_movie_titles with the (id, title) rows it inserted or changed."""
+    if _current is not None:
+        _current.update_titles(rows)
+
+
+def people_added(rows):
+    """Called by the credits loader with the (id, name) rows of new people."""
+    if _current is not None:
+        _current.update_people(rows)
@@ -1,7 +1,10 @@
+import argparse
 import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+import schema_migrations
+
 DB_CONFIG = {
     'user': 'qaim.ali',
     'host': 'localhost',
@@ -41,30 +44,75 @@ def create_database():
         if conn is not None:
             conn.close()
 
-def execute_sql_from_file(filepath):
+def run_migrations(filepath, defer_indexes=False, rebuild_indexes=False, check_plans=False,
+                   partition_strategy=None, partitions=schema_migrations.RATINGS_PARTITION_COUNT,
+                   range_start=None, range_end=None):
+    """
+    Brings the database up to the latest schema version, optionally dropping the
+    managed indexes and foreign keys ahead of a bulk load (`defer_indexes`) or
+    recreating them afterwards (`rebuild_indexes`). With `partition_strategy`
+    ('hash' or 'range'), an unpartitioned ratings table is converted into
+    `partitions` partitions; range partitions split [range_start, range_end),
+    which defaults to the span of the ratings already loaded.
+    """
     create_database()
-    
+    schema_migrations.DB_CONFIG.update(DB_CONFIG)
+
     conn = None
     try:
         print(f"\nConnecting to database '{DB_CONFIG['database']}'...")
         conn = psycopg2.connect(**DB_CONFIG)
+
+        applied = schema_migrations.migrate(conn, filepath)
         cursor = conn.cursor()
+        print(f"Applied {len(applied)} migration(s); schema is at version "
+              f"{schema_migrations.applied_versions(cursor)[-1]}.")
 
-        with open(filepath, 'r') as sql_file:
-            sql_commands = sql_file.read()
-            print(f"Executing SQL commands from '{filepath}'...")
-            cursor.execute(sql_commands)
+        if partition_strategy:
+            current, _ = schema_migrations.ratings_partitions(cursor)
+            if current is None:
+                schema_migrations.partition_ratings(conn, partition_strategy, partitions, range_start, range_end)
+            else:
+                print(f"'ratings' is already partitioned by {current}.")
 
-        conn.commit()
-        print("\nAll tables created successfully!")
+        if defer_indexes:
+            print("\nDeferring managed indexes and foreign keys until after the bulk load...")
+            schema_migrations.drop_deferred_objects(cursor)
+            conn.commit()
+        if rebuild_indexes:
+            print("\nRebuilding managed indexes and foreign keys...")
+            schema_migrations.rebuild_deferred_objects(cursor)
+            conn.commit()
+        cursor.close()
 
-    except psycopg2.Error as e:
+        if check_plans:
+            print("\nChecking that the public query functions use an index...")
+            schema_migrations.check_index_usage()
+
+    except (psycopg2.Error, ValueError) as e:
         print(f"An error occurred: {e}")
     finally:
         if conn is not None:
-            cursor.close()
             conn.close()
             print("PostgreSQL connection is closed.")
 
 if __name__ == "__main__":
-    execute_sql_from_file(SCHEMA_FILE)
+    parser = argparse.ArgumentParser(description="Create the database and apply pending schema migrations.")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="Drop managed indexes, primary keys and foreign keys before a bulk load.")
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help="Recreate managed indexes, primary keys and foreign keys after a bulk load.")
+    parser.add_argument('--check-plans', action='store_true',
+                        help="EXPLAIN each public query function and report the indexes it uses.")
+    parser.add_argument('--partition-ratings', choices=('hash', 'range'),
+                        help="Partition ratings by hash of movie_id or by timestamp range (which drops the "
+                             "(user_id, movie_id) primary key).")
+    parser.add_argument('--partitions', type=int, default=schema_migrations.RATINGS_PARTITION_COUNT)
+    parser.add_argument('--range-start', type=int,
+                        help="First timestamp of the range partitions (default: the earliest loaded rating).")
+    parser.add_argument('--range-end', type=int,
+                        help="Timestamp the range partitions end before (default: just after the latest loaded "
+                             "rating). Earlier and later timestamps go to the first and last partition.")
+    args = parser.parse_args()
+    run_migrations(SCHEMA_FILE, args.defer_indexes, args.rebuild_indexes, args.check_plans,
+                   args.partition_ratings, args.partitions, args.range_start, args.range_end)
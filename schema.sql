@@ -6,8 +6,10 @@ CREATE TABLE movies (
 );
 
 -- Cast Table
+-- migrations/0006_add_people_dimension.sql replaces name/profile_path here, and
+-- name/profile_path/job/department in crew, with ids into people, jobs and departments.
 
-CREATE TABLE cast (
+CREATE TABLE "cast" (
     movie_id INT,
     cast_id INT,
     character_name VARCHAR(255),
@@ -41,6 +43,8 @@ CREATE TABLE users (
 );
 
 -- Ratings Table
+-- schema-creation.py --partition-ratings {hash,range} turns this into a
+-- partitioned table (by hash of movie_id or by timestamp range).
 
 CREATE TABLE ratings (
     user_id INT,
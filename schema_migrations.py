@@ -0,0 +1,359 @@
+import os
+import re
+import psycopg2
+
+DB_CONFIG = {
+    'user': 'qaim.ali',
+    'host': 'localhost',
+    'port': '5432',
+    'database': 'movie_db'
+}
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Secondary indexes owned by the migration runner. They can be dropped before
+# a bulk load and rebuilt afterwards with drop_deferred_objects() /
+# rebuild_deferred_objects().
+MANAGED_INDEXES = {
+    'movies_lower_title_idx': 'ON movies (LOWER(title))',
+    'cast_person_id_idx': 'ON "cast" (person_id)',
+    'cast_movie_id_idx': 'ON "cast" (movie_id, cast_order)',
+    'crew_job_person_idx': 'ON crew (job_id, person_id)',
+    'crew_movie_id_idx': 'ON crew (movie_id)',
+    'ratings_movie_id_idx': 'ON ratings (movie_id)',
+}
+
+# The managed indexes as migration 2 created them, on the base schema's
+# columns. Migrations that change indexed columns create their own indexes.
+BASE_SCHEMA_INDEXES = {
+    'movies_lower_title_idx': 'ON movies (LOWER(title))',
+    'cast_name_idx': 'ON "cast" (name)',
+    'cast_movie_id_idx': 'ON "cast" (movie_id, cast_order)',
+    'crew_job_name_idx': 'ON crew (job, name)',
+    'crew_movie_id_idx': 'ON crew (movie_id)',
+    'ratings_movie_id_idx': 'ON ratings (movie_id)',
+    'ratings_user_movie_idx': 'ON ratings (user_id, movie_id)',
+}
+
+# Foreign keys declared in schema.sql and the migrations, under PostgreSQL's
+# default names.
+MANAGED_FOREIGN_KEYS = {
+    'cast_movie_id_fkey': ('"cast"', 'FOREIGN KEY (movie_id) REFERENCES movies(id)'),
+    'cast_person_id_fkey': ('"cast"', 'FOREIGN KEY (person_id) REFERENCES people(id)'),
+    'crew_movie_id_fkey': ('crew', 'FOREIGN KEY (movie_id) REFERENCES movies(id)'),
+    'crew_person_id_fkey': ('crew', 'FOREIGN KEY (person_id) REFERENCES people(id)'),
+    'crew_job_id_fkey': ('crew', 'FOREIGN KEY (job_id) REFERENCES jobs(id)'),
+    'crew_department_id_fkey': ('crew', 'FOREIGN KEY (department_id) REFERENCES departments(id)'),
+    'ratings_user_id_fkey': ('ratings', 'FOREIGN KEY (user_id) REFERENCES users(id)'),
+    'ratings_movie_id_fkey': ('ratings', 'FOREIGN KEY (movie_id) REFERENCES movies(id)'),
+}
+
+# Primary keys added by the migrations that a bulk load may also defer. They
+# are dropped after the foreign keys and added back before them.
+MANAGED_PRIMARY_KEYS = {
+    'ratings_pkey': ('ratings', 'PRIMARY KEY (user_id, movie_id) INCLUDE (rating, timestamp)'),
+}
+
+# Public query functions and the arguments used to EXPLAIN them. Functions
+# that aggregate a whole (rollup) table by design are not expected to use an
+# index and are left out.
+PLAN_CHECKS = {
+    'get_most_active_users': (),
+    'get_cast_of_movie': ('Toy Story',),
+    'get_director_of_movie': ('Toy Story',),
+    'search_movies_by_actor': ('Tom Hanks',),
+    'find_movies_directed_by_actor': ('Tom Hanks',),
+    'get_similar_movies': (862,),
+    'get_user_by_id': (1,),
+    'get_specific_rating': (1, 110),
+    'update_user_email': (1, 'test.update@example.com'),
+    'delete_rating': (1, 110),
+    'get_cast_of_movies': (['Toy Story'],),
+    'get_directors_of_movies': (['Toy Story'],),
+    'search_movies_by_actors': (['Tom Hanks'],),
+    'get_users_by_ids': ([1, 2],),
+}
+
+# Default layout for partition_ratings(): hash of movie_id into this many partitions.
+RATINGS_PARTITION_STRATEGY = 'hash'
+RATINGS_PARTITION_COUNT = 8
+
+INDEX_NODE_TYPES = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}
+
+
+def _sql_file(path):
+    def apply(cursor):
+        with open(path, 'r') as sql_file:
+            cursor.execute(sql_file.read())
+    return apply
+
+
+def create_managed_indexes(cursor, indexes=None):
+    for name, definition in (indexes or MANAGED_INDEXES).items():
+        print(f"  - Creating index {name}...")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition}")
+
+
+def migrations(schema_file):
+    """
+    Ordered (version, description, apply) list. Version 1 is the base schema
+    from `schema_file`; later versions come from here and from the numbered
+    .sql files in MIGRATIONS_DIR (e.g. migrations/0003_add_people.sql).
+    """
+    steps = [
+        (1, 'base schema', _sql_file(schema_file)),
+        (2, 'managed indexes', lambda cursor: create_managed_indexes(cursor, BASE_SCHEMA_INDEXES)),
+    ]
+    if os.path.isdir(MIGRATIONS_DIR):
+        for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+            if filename.endswith('.sql'):
+                version, _, description = filename[:-len('.sql')].partition('_')
+                steps.append((int(version), description.replace('_', ' '), _sql_file(os.path.join(MIGRATIONS_DIR, filename))))
+    return sorted(steps, key=lambda step: step[0])
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    if not applied:
+        # Databases created before the runner existed already have the base schema.
+        cursor.execute("SELECT to_regclass('movies') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (1, 'base schema')")
+            applied.add(1)
+    return applied
+
+
+def applied_versions(cursor):
+    return sorted(_ensure_migrations_table(cursor))
+
+
+def _forget_ratings_keyed():
+    """Tells query_database to look up the ratings primary key again after a schema change."""
+    import query_database
+
+    query_database.forget_ratings_keyed()
+
+
+def migrate(conn, schema_file, target=None):
+    """
+    Applies every migration newer than the database's current version (up to
+    `target`), each in its own transaction, and returns the versions applied.
+    """
+    cursor = conn.cursor()
+    applied = _ensure_migrations_table(cursor)
+    conn.commit()
+
+    newly_applied = []
+    for version, description, apply in migrations(schema_file):
+        if version in applied or (target is not None and version > target):
+            continue
+        print(f"Applying migration {version}: {description}...")
+        try:
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        newly_applied.append(version)
+    cursor.close()
+    if newly_applied:
+        _forget_ratings_keyed()
+    return newly_applied
+
+
+def drop_deferred_objects(cursor):
+    """Drops the managed indexes, foreign keys and primary keys so a bulk load does not maintain them row by row."""
+    for name, (table, _) in MANAGED_FOREIGN_KEYS.items():
+        print(f"  - Dropping foreign key {name}...")
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+    for name, (table, _) in MANAGED_PRIMARY_KEYS.items():
+        print(f"  - Dropping primary key {name}...")
+        cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+    for name in MANAGED_INDEXES:
+        print(f"  - Dropping index {name}...")
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    _forget_ratings_keyed()
+
+
+def _add_missing_constraints(cursor, constraints, kind):
+    for name, (table, definition) in constraints.items():
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (name,))
+        if cursor.fetchone() is None:
+            print(f"  - Adding {kind} {name}...")
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+
+def rebuild_deferred_objects(cursor):
+    """Recreates any missing managed index, primary key or foreign key, then refreshes planner statistics."""
+    create_managed_indexes(cursor)
+    strategy, _ = ratings_partitions(cursor)
+    # Timestamp-range partitions cannot carry the ratings key; see partition_ratings().
+    primary_keys = {name: (table, definition) for name, (table, definition) in MANAGED_PRIMARY_KEYS.items()
+                    if not (table == 'ratings' and strategy == 'range')}
+    _add_missing_constraints(cursor, primary_keys, 'primary key')
+    _add_missing_constraints(cursor, MANAGED_FOREIGN_KEYS, 'foreign key')
+    cursor.execute("ANALYZE")
+    _forget_ratings_keyed()
+
+
+def _index_nodes(plan):
+    found = []
+    if plan.get('Node Type') in INDEX_NODE_TYPES:
+        found.append(plan.get('Index Name'))
+    for child in plan.get('Plans', []):
+        found.extend(_index_nodes(child))
+    return found
+
+
+def check_index_usage(disable_seqscan=True):
+    """
+    EXPLAINs every function in PLAN_CHECKS through query_database and reports
+    which indexes its plan uses. Returns {function name: [index names]}; an
+    empty list means the function would run without an index. By default
+    sequential scans are discouraged so the check is meaningful on small
+    databases too.
+    """
+    import query_database
+
+    results = {}
+    for function_name, args in PLAN_CHECKS.items():
+        with query_database.capture_plans(disable_seqscan=disable_seqscan) as plans:
+            getattr(query_database, function_name)(*args)
+        indexes = [index for _, plan in plans for index in _index_nodes(plan)]
+        results[function_name] = indexes
+        status = f"uses {', '.join(sorted(set(indexes)))}" if indexes else "NO INDEX USED"
+        print(f"  - {function_name}: {status}")
+    return results
+
+
+def _partition_bounds(strategy, partitions, range_start=None, range_end=None):
+    """
+    Returns the FOR VALUES clause of each partition. Range partitions split
+    [range_start, range_end) at evenly spaced timestamps; the first starts at
+    MINVALUE and the last ends at MAXVALUE, so timestamps outside the range
+    still have a partition. A range shorter than `partitions` gets one
+    partition per timestamp in it.
+    """
+    if partitions < 1:
+        raise ValueError("partitions must be at least 1")
+    if strategy == 'hash':
+        return [f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})" for remainder in range(partitions)]
+    span = range_end - range_start
+    if span < 1:
+        raise ValueError(f"range_end ({range_end}) must be greater than range_start ({range_start})")
+    partitions = min(partitions, span)
+    edges = (['MINVALUE'] + [str(range_start + span * number // partitions) for number in range(1, partitions)]
+             + ['MAXVALUE'])
+    return [f"FOR VALUES FROM ({low}) TO ({high})" for low, high in zip(edges, edges[1:])]
+
+
+def partition_ratings(conn, strategy=RATINGS_PARTITION_STRATEGY, partitions=RATINGS_PARTITION_COUNT,
+                      range_start=None, range_end=None):
+    """
+    Rebuilds `ratings` as a declaratively partitioned table, either by hash of
+    movie_id or by ranges of timestamp, and moves the existing rows into it.
+    For 'range', [range_start, range_end) is split into `partitions` ranges
+    (fewer if it holds fewer timestamps), the outer two open-ended; bounds
+    left out are taken from the ratings already loaded, so pass both before
+    loading into an empty table. The partitions are named ratings_p0,
+    ratings_p1, ... Managed ratings indexes and foreign keys are recreated on
+    the new parent, and so is the (user_id, movie_id) primary key for 'hash':
+    a key on a partitioned table must contain the partition column, so
+    'range' leaves ratings without one. Runs in a single transaction.
+    """
+    if strategy not in ('hash', 'range'):
+        raise ValueError("strategy must be 'hash' or 'range'")
+    cursor = conn.cursor()
+    try:
+        if strategy == 'range' and (range_start is None or range_end is None):
+            cursor.execute("SELECT MIN(timestamp), MAX(timestamp) + 1 FROM ratings")
+            low, high = cursor.fetchone()
+            if low is None:
+                raise ValueError("ratings is empty; pass range_start and range_end to partition it by timestamp")
+            range_start = range_start if range_start is not None else low
+            range_end = range_end if range_end is not None else high
+        key = 'HASH (movie_id)' if strategy == 'hash' else 'RANGE (timestamp)'
+        bounds = _partition_bounds(strategy, partitions, range_start, range_end)
+
+        print(f"Creating ratings partitioned by {key} with {len(bounds)} partitions...")
+        if len(bounds) < partitions:
+            print(f"  - [{range_start}, {range_end}) spans fewer than {partitions} timestamps; "
+                  f"using {len(bounds)} partitions.")
+        cursor.execute(f"CREATE TABLE ratings_partitioned (LIKE ratings INCLUDING DEFAULTS) PARTITION BY {key}")
+        for number, bound in enumerate(bounds):
+            cursor.execute(f"CREATE TABLE ratings_p{number} PARTITION OF ratings_partitioned {bound}")
+
+        print("Moving existing ratings into the partitions...")
+        cursor.execute("INSERT INTO ratings_partitioned SELECT * FROM ratings")
+        cursor.execute("DROP TABLE ratings")
+        cursor.execute("ALTER TABLE ratings_partitioned RENAME TO ratings")
+
+        for name, definition in MANAGED_INDEXES.items():
+            if definition.startswith('ON ratings '):
+                cursor.execute(f"CREATE INDEX {name} {definition}")
+        for name, (table, definition) in MANAGED_PRIMARY_KEYS.items():
+            if table != 'ratings':
+                continue
+            if strategy == 'hash':
+                cursor.execute(f"ALTER TABLE ratings ADD CONSTRAINT {name} {definition}")
+            else:
+                print(f"WARNING: {name} cannot be enforced on timestamp ranges. Rating upserts will delete and "
+                      f"reinsert instead of updating in place, and concurrent writers of a new rating can "
+                      f"store it twice; use hash partitions to keep the key.")
+        for name, (table, definition) in MANAGED_FOREIGN_KEYS.items():
+            if table == 'ratings':
+                cursor.execute(f"ALTER TABLE ratings ADD CONSTRAINT {name} {definition}")
+        conn.commit()
+        _forget_ratings_keyed()
+    except (psycopg2.Error, ValueError):
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+_HASH_BOUND_RE = re.compile(r"MODULUS (\d+), REMAINDER (\d+)", re.IGNORECASE)
+_RANGE_BOUND_RE = re.compile(r"FROM \('?(-?\d+|MINVALUE)'?\) TO \('?(-?\d+|MAXVALUE)'?\)")
+
+
+def ratings_partitions(cursor):
+    """
+    Describes how `ratings` is partitioned. Returns (strategy, partitions),
+    where strategy is None, 'hash' or 'range' and partitions is a list of
+    (table name, bound) pairs: (modulus, remainder) for hash partitions,
+    (low, high) for range partitions and None for the DEFAULT partition.
+    """
+    cursor.execute("""
+        SELECT p.partstrat FROM pg_partitioned_table p
+        WHERE p.partrelid = 'ratings'::regclass
+    """)
+    row = cursor.fetchone()
+    if row is None:
+        return None, []
+    strategy = {'h': 'hash', 'r': 'range'}.get(row[0], row[0])
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'ratings'::regclass ORDER BY c.relname
+    """)
+    partitions = []
+    for name, bound in cursor.fetchall():
+        if strategy == 'hash':
+            partitions.append((name, tuple(int(value) for value in _HASH_BOUND_RE.search(bound).groups())))
+            continue
+        match = _RANGE_BOUND_RE.search(bound)
+        if match is None:
+            partitions.append((name, None))
+            continue
+        low, high = match.groups()
+        partitions.append((name, (None if low == 'MINVALUE' else int(low), None if high == 'MAXVALUE' else int(high))))
+    return strategy, partitions
@@ -0,0 +1,365 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import psycopg2
+from scipy import sparse
+
+from copy_utils import copy_columns
+
+DB_CONFIG = {
+    'user': 'qaim.ali',
+    'host': 'localhost',
+    'port': '5432',
+    'database': 'movie_db'
+}
+
+# Neighbours stored per movie. Movies with fewer ratings than MIN_RATINGS get
+# no neighbours and are nobody's neighbour: their similarities are noise.
+NEIGHBORS = 20
+MIN_RATINGS = 5
+# Movies scored per block. A block is a dense BLOCK_ROWS x (number of movies)
+# float32 array, about 45 MB at full size.
+BLOCK_ROWS = 256
+WORKERS = os.cpu_count() or 1
+# An incremental refresh holds a (number of movies) x (changed movies)
+# similarity matrix; with more than this share of the movies changed it
+# rebuilds everything instead.
+INCREMENTAL_LIMIT = 0.01
+
+# Movies rated since their neighbours were computed, including movies that
+# lost all their ratings: every rating write gives the movie a new
+# movie_rating_stats.revision (migration 9).
+CHANGED_MOVIES_SQL = """
+    SELECT COALESCE(s.movie_id, n.movie_id)
+    FROM (SELECT * FROM movie_rating_stats WHERE num_ratings > 0) s
+    FULL JOIN movie_neighbors_state n ON n.movie_id = s.movie_id
+    WHERE s.revision IS DISTINCT FROM n.revision
+"""
+
+# The rating matrix, its transpose and k, set in each worker process.
+_worker_state = {}
+
+
+def export_ratings(cursor):
+    """(user_ids, movie_ids, ratings) arrays of the rated rows of ratings, exported with COPY TO."""
+    with tempfile.TemporaryFile('w+') as buffer:
+        cursor.copy_expert(
+            "COPY (SELECT user_id, movie_id, rating FROM ratings WHERE rating IS NOT NULL) TO STDOUT WITH (FORMAT csv)",
+            buffer)
+        buffer.seek(0)
+        df = pd.read_csv(buffer, header=None, names=['user_id', 'movie_id', 'rating'],
+                         dtype={'user_id': np.int32, 'movie_id': np.int32, 'rating': np.float32})
+    return df['user_id'].to_numpy(), df['movie_id'].to_numpy(), df['rating'].to_numpy()
+
+
+def rating_matrix(user_ids, movie_ids, ratings, min_ratings=MIN_RATINGS):
+    """
+    Sparse movie x user CSR matrix of the ratings with every row scaled to
+    unit length, so the product of two rows is the cosine similarity of the
+    movies. Rows of movies with fewer than `min_ratings` ratings are empty.
+    A user who rated a movie more than once counts with their last rating.
+    Returns (matrix, movie id of each row).
+    """
+    movies, rows = np.unique(movie_ids, return_inverse=True)
+    users, columns = np.unique(user_ids, return_inverse=True)
+    keys = rows.astype(np.int64) * len(users) + columns
+    _, last = np.unique(keys[::-1], return_index=True)
+    last = len(keys) - 1 - last
+    matrix = sparse.csr_matrix((np.asarray(ratings, dtype=np.float32)[last], (rows[last], columns[last])),
+                               shape=(len(movies), len(users)), dtype=np.float32)
+    counts = np.diff(matrix.indptr)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    scale = np.zeros(len(movies), dtype=np.float32)
+    keep = (counts >= min_ratings) & (norms > 0)
+    scale[keep] = 1 / norms[keep]
+    matrix = (sparse.diags(scale) @ matrix).tocsr()
+    matrix.eliminate_zeros()
+    return matrix, movies
+
+
+def similarities(matrix, transposed, rows):
+    """Dense similarities of movie `rows` to every movie, with each movie's similarity to itself zeroed."""
+    scores = (matrix[rows] @ transposed).toarray()
+    scores[np.arange(len(rows)), rows] = 0
+    return scores
+
+
+def top_k(scores, k):
+    """
+    Column indices and values of the k highest positive scores of each row,
+    best first (ties by lower index). Rows with fewer are padded with -1 / 0.
+    """
+    width = min(k, scores.shape[1])
+    top = np.argpartition(-scores, width - 1, axis=1)[:, :width]
+    values = np.take_along_axis(scores, top, axis=1)
+    order = np.lexsort((top, -values), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    top[values <= 0] = -1
+    values[values <= 0] = 0
+    if width < k:
+        top = np.pad(top, ((0, 0), (0, k - width)), constant_values=-1)
+        values = np.pad(values, ((0, 0), (0, k - width)))
+    return top, values
+
+
+def _init_worker(matrix, k):
+    _worker_state.update(matrix=matrix, transposed=matrix.T.tocsr(), k=k)
+
+
+def _neighbor_block(rows):
+    scores = similarities(_worker_state['matrix'], _worker_state['transposed'], rows)
+    return top_k(scores, _worker_state['k'])
+
+
+def compute_neighbors(matrix, rows=None, k=NEIGHBORS, workers=WORKERS, block_rows=BLOCK_ROWS):
+    """
+    Top-k neighbours of matrix `rows` (default: all) as (neighbor rows, with
+    -1 for none; similarities). The rows are scored `block_rows` at a time
+    with a sparse matrix product, the blocks spread over `workers` processes.
+    """
+    rows = np.arange(matrix.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+    neighbors = np.full((len(rows), k), -1, dtype=np.int64)
+    scores = np.zeros((len(rows), k), dtype=np.float32)
+    # Movies without a rating vector have no neighbours; skip them.
+    positions = np.flatnonzero(np.diff(matrix.indptr)[rows] > 0)
+    blocks = [positions[start:start + block_rows] for start in range(0, len(positions), block_rows)]
+    if not blocks:
+        return neighbors, scores
+
+    def store(results):
+        for block, (block_neighbors, block_scores) in zip(blocks, results):
+            neighbors[block] = block_neighbors
+            scores[block] = block_scores
+
+    if workers <= 1:
+        _init_worker(matrix, k)
+        store(_neighbor_block(rows[block]) for block in blocks)
+        _worker_state.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix, k)) as executor:
+            store(executor.map(_neighbor_block, [rows[block] for block in blocks]))
+    return neighbors, scores
+
+
+def _write_neighbors(cursor, movie_ids, rows, neighbors, scores):
+    """COPYs the neighbour lists of matrix `rows` into movie_neighbors and returns the number of rows written."""
+    found = neighbors >= 0
+    ranks = np.broadcast_to(np.arange(1, neighbors.shape[1] + 1), neighbors.shape)
+    owners = np.broadcast_to(movie_ids[rows][:, None], neighbors.shape)
+    return copy_columns(cursor, 'movie_neighbors', ['movie_id', 'rank', 'neighbor_id', 'similarity'],
+                        [owners[found], ranks[found], movie_ids[neighbors[found]], scores[found]])
+
+
+def _load_matrix(cursor, min_ratings):
+    print("Exporting ratings...")
+    start = time.perf_counter()
+    matrix, movie_ids = rating_matrix(*export_ratings(cursor), min_ratings=min_ratings)
+    print(f"Rating matrix: {matrix.shape[0]} movies x {matrix.shape[1]} users, {matrix.nnz} ratings "
+          f"({time.perf_counter() - start:.1f}s).")
+    return matrix, movie_ids
+
+
+def _rebuild(cursor, matrix, movie_ids, k, min_ratings, workers, block_rows):
+    start = time.perf_counter()
+    neighbors, scores = compute_neighbors(matrix, None, k, workers, block_rows)
+    print(f"Computed neighbours of {len(movie_ids)} movies in {time.perf_counter() - start:.1f}s.")
+    cursor.execute("TRUNCATE movie_neighbors, movie_neighbors_state")
+    written = _write_neighbors(cursor, movie_ids, np.arange(len(movie_ids)), neighbors, scores)
+    cursor.execute("""
+        INSERT INTO movie_neighbors_state (movie_id, num_ratings, rating_sum, revision, neighbors, min_ratings)
+        SELECT movie_id, num_ratings, rating_sum, revision, %s, %s FROM movie_rating_stats WHERE num_ratings > 0
+    """, (k, min_ratings))
+    return {'mode': 'full', 'movies': len(movie_ids), 'changed': len(movie_ids), 'recomputed': len(movie_ids),
+            'patched': 0, 'rows': written}
+
+
+def _stored_neighbors(cursor, movie_ids, k):
+    """
+    The current lists as (neighbor rows, similarities) arrays indexed by
+    matrix row; neighbours no longer in the matrix get row len(movie_ids).
+    """
+    cursor.execute("SELECT movie_id, rank, neighbor_id, similarity FROM movie_neighbors")
+    stored = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 4)
+    neighbors = np.full((len(movie_ids), k), -1, dtype=np.int64)
+    scores = np.zeros((len(movie_ids), k), dtype=np.float32)
+    owners = np.searchsorted(movie_ids, stored[:, 0].astype(np.int64))
+    present = (owners < len(movie_ids)) & (movie_ids[np.minimum(owners, len(movie_ids) - 1)] == stored[:, 0])
+    stored, owners = stored[present], owners[present]
+    targets = np.searchsorted(movie_ids, stored[:, 2].astype(np.int64))
+    missing = (targets >= len(movie_ids)) | (movie_ids[np.minimum(targets, len(movie_ids) - 1)] != stored[:, 2])
+    targets[missing] = len(movie_ids)
+    ranks = stored[:, 1].astype(np.int64) - 1
+    neighbors[owners, ranks] = targets
+    scores[owners, ranks] = stored[:, 3]
+    return neighbors, scores
+
+
+def _patch(old_neighbors, old_scores, changed, changed_rows, changed_scores, k):
+    """
+    Merges one unchanged movie's stored list, minus the changed movies, with
+    its new similarities to them. Returns the new list as (neighbor rows,
+    similarities), or None when movies outside the list could now rank in it.
+    """
+    kept = (old_neighbors >= 0) & ~changed[np.maximum(old_neighbors, 0)]
+    candidates = np.concatenate([old_neighbors[kept], changed_rows])
+    candidate_scores = np.concatenate([old_scores[kept], changed_scores])
+    order = np.lexsort((candidates, -candidate_scores))[:k]
+    neighbors, scores = candidates[order], candidate_scores[order]
+    full = old_neighbors[-1] >= 0
+    # A full list only knows its members: once a kept entry drops out or the
+    # new k-th similarity falls below the old one, unlisted movies may rank.
+    if full and (len(neighbors) < k or scores[-1] < old_scores[-1]):
+        return None
+    return neighbors, scores
+
+
+def _refresh(cursor, matrix, movie_ids, changed_ids, k, min_ratings, workers, block_rows):
+    neighbors, scores = _stored_neighbors(cursor, movie_ids, k)
+    # Flags matrix rows whose rating vector changed; the extra last slot
+    # stands for stored neighbours that are no longer in the matrix.
+    changed = np.zeros(len(movie_ids) + 1, dtype=bool)
+    changed[-1] = True
+    changed_rows = np.searchsorted(movie_ids, changed_ids)
+    changed_rows = changed_rows[(changed_rows < len(movie_ids))
+                                & (movie_ids[np.minimum(changed_rows, len(movie_ids) - 1)] == changed_ids)]
+    changed[changed_rows] = True
+
+    # Each changed movie's similarities to every movie, as a movie x changed
+    # matrix: row m holds m's new similarities to the changed movies.
+    products = (matrix @ matrix[changed_rows].T).tocoo()
+    other = products.row != changed_rows[products.col]
+    to_changed = sparse.csr_matrix((products.data[other], (products.row[other], products.col[other])),
+                                   shape=products.shape)
+
+    lists_changed = (changed[neighbors.clip(0)] & (neighbors >= 0)).any(axis=1)
+    touched = np.flatnonzero(lists_changed | (np.diff(to_changed.indptr) > 0))
+    patched, recompute = [], list(changed_rows)
+    for row in touched:
+        if changed[row]:
+            continue
+        start, end = to_changed.indptr[row], to_changed.indptr[row + 1]
+        result = _patch(neighbors[row], scores[row], changed, changed_rows[to_changed.indices[start:end]],
+                        to_changed.data[start:end], k)
+        if result is None:
+            recompute.append(row)
+            continue
+        new_neighbors = np.full(k, -1, dtype=np.int64)
+        new_scores = np.zeros(k, dtype=np.float32)
+        new_neighbors[:len(result[0])], new_scores[:len(result[1])] = result
+        # Lists the changed movies did not move in are left as they are.
+        if not (np.array_equal(new_neighbors, neighbors[row]) and np.array_equal(new_scores, scores[row])):
+            neighbors[row], scores[row] = new_neighbors, new_scores
+            patched.append(row)
+
+    recompute = np.array(sorted(recompute), dtype=np.int64)
+    neighbors[recompute], scores[recompute] = compute_neighbors(matrix, recompute, k, workers, block_rows)
+    rows = np.union1d(recompute, np.array(patched, dtype=np.int64))
+
+    cursor.execute("DELETE FROM movie_neighbors WHERE movie_id = ANY(%s::int[])",
+                   (sorted(set(movie_ids[rows].tolist()) | set(changed_ids.tolist())),))
+    written = _write_neighbors(cursor, movie_ids, rows, neighbors[rows], scores[rows])
+    cursor.execute("DELETE FROM movie_neighbors_state WHERE movie_id = ANY(%s::int[])", (changed_ids.tolist(),))
+    cursor.execute("""
+        INSERT INTO movie_neighbors_state (movie_id, num_ratings, rating_sum, revision, neighbors, min_ratings)
+        SELECT movie_id, num_ratings, rating_sum, revision, %s, %s FROM movie_rating_stats
+        WHERE movie_id = ANY(%s::int[]) AND num_ratings > 0
+    """, (k, min_ratings, changed_ids.tolist()))
+    return {'mode': 'incremental', 'movies': len(movie_ids), 'changed': len(changed_ids),
+            'recomputed': len(recompute), 'patched': len(patched), 'rows': written}
+
+
+def update_neighbors(cursor, incremental=False, k=NEIGHBORS, workers=WORKERS, block_rows=BLOCK_ROWS,
+                     min_ratings=MIN_RATINGS):
+    """
+    Computes the top-k most similar movies of every movie, by cosine
+    similarity of their rating vectors, into movie_neighbors, using
+    `cursor`'s transaction. The caller commits.
+
+    With `incremental`, only the movies rated since the last run (by
+    movie_rating_stats.revision) are recomputed, and every other list is
+    patched with its new similarities to them; a list that may have let in a
+    movie it does not know about is recomputed too, so the result matches a
+    full rebuild. Falls back to a full rebuild when nothing was built yet, the
+    stored lists were computed with another k or min_ratings, or more than
+    INCREMENTAL_LIMIT of the movies changed.
+    Returns a dict of counts.
+    """
+    if incremental:
+        cursor.execute("SELECT DISTINCT neighbors, min_ratings FROM movie_neighbors_state")
+        settings = cursor.fetchall()
+        if not settings:
+            print("No neighbours computed yet; doing a full build.")
+            incremental = False
+        elif settings != [(k, min_ratings)]:
+            print(f"Stored neighbours were computed with other settings {settings}; doing a full build.")
+            incremental = False
+
+    changed_ids = None
+    if incremental:
+        cursor.execute(CHANGED_MOVIES_SQL)
+        changed_ids = np.array(sorted(movie_id for movie_id, in cursor.fetchall()), dtype=np.int64)
+        if not len(changed_ids):
+            print("Neighbours are up to date.")
+            return {'mode': 'incremental', 'movies': 0, 'changed': 0, 'recomputed': 0, 'patched': 0, 'rows': 0}
+
+    matrix, movie_ids = _load_matrix(cursor, min_ratings)
+    start = time.perf_counter()
+    if changed_ids is not None and len(changed_ids) <= INCREMENTAL_LIMIT * len(movie_ids):
+        result = _refresh(cursor, matrix, movie_ids, changed_ids, k, min_ratings, workers, block_rows)
+    else:
+        if changed_ids is not None:
+            print(f"{len(changed_ids)} movies changed; doing a full build.")
+        result = _rebuild(cursor, matrix, movie_ids, k, min_ratings, workers, block_rows)
+    print(f"\nNeighbours {'refreshed' if result['mode'] == 'incremental' else 'built'}: "
+          f"{result['changed']} changed, {result['recomputed']} recomputed, {result['patched']} patched, "
+          f"{result['rows']} rows written in {time.perf_counter() - start:.1f}s.")
+    return result
+
+
+def build_neighbors(incremental=False, k=NEIGHBORS, workers=WORKERS, block_rows=BLOCK_ROWS,
+                    min_ratings=MIN_RATINGS):
+    """
+    Runs update_neighbors() on its own connection in one REPEATABLE READ
+    transaction, so the ratings and the revisions recorded in
+    movie_neighbors_state are from the same snapshot.
+    Returns a dict of counts, or None on failure.
+    """
+    conn = None
+    result = None
+    try:
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        conn.set_session(isolation_level='REPEATABLE READ')
+        cursor = conn.cursor()
+        result = update_neighbors(cursor, incremental, k, workers, block_rows, min_ratings)
+        conn.commit()
+
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        result = None
+        if conn:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the most similar movies of every movie from the ratings.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only recompute movies whose ratings changed since the last run.")
+    parser.add_argument('--k', type=int, default=NEIGHBORS, help="Neighbours stored per movie.")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Processes scoring blocks of movies.")
+    parser.add_argument('--block-rows', type=int, default=BLOCK_ROWS, help="Movies scored per block.")
+    parser.add_argument('--min-ratings', type=int, default=MIN_RATINGS,
+                        help="Ratings a movie needs to get, and be, a neighbour.")
+    args = parser.parse_args()
+    build_neighbors(args.incremental, args.k, args.workers, args.block_rows, args.min_ratings)
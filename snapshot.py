@@ -0,0 +1,341 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import psycopg2
+
+DB_CONFIG = {
+    'user': 'qaim.ali',
+    'host': 'localhost',
+    'port': '5432',
+    'database': 'movie_db'
+}
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+# Tables of schema.sql and the migrations written to a snapshot by default.
+SNAPSHOT_TABLES = ('movies', 'people', 'jobs', 'departments', 'cast', 'crew', 'users', 'ratings',
+                   'movie_rating_stats', 'user_rating_stats', 'movie_neighbors')
+# Fixed-width dtype of each PostgreSQL type; columns of any other type are
+# stored as dictionary-encoded text. NUMERIC becomes float64.
+TYPE_DTYPES = {
+    'smallint': 'int16',
+    'integer': 'int32',
+    'bigint': 'int64',
+    'real': 'float32',
+    'double precision': 'float64',
+    'numeric': 'float64',
+    'boolean': 'bool',
+}
+# Bytes of COPY output parsed at a time, bounding memory on big tables.
+CHUNK_BYTES = 64 * 1024 * 1024
+
+NULL_MARKER = '\\N'
+
+
+def _quoted(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position
+    """, (table,))
+    return cursor.fetchall()
+
+
+class _ColumnWriter:
+    """
+    Writes one column into <table>/<column>.npy. Numbers go straight into a
+    preallocated .npy file (NULL stored as 0, or NaN for floats, and flagged
+    in <column>.nulls.npy); text is stored as int32 codes into a sorted
+    dictionary, <column>.dict.npy, with -1 for NULL.
+    """
+
+    def __init__(self, directory, table, column, sql_type, rows):
+        self.column = column
+        self.sql_type = sql_type
+        self.dtype = TYPE_DTYPES.get(sql_type)
+        self.relative = f"{table}/{column}"
+        self.path = os.path.join(directory, self.relative)
+        self.values = np.lib.format.open_memmap(f"{self.path}.npy", mode='w+',
+                                                dtype=self.dtype or np.int32, shape=(rows,))
+        self.nulls = np.zeros(rows, dtype=bool)
+        self.lookup = {}
+
+    def write(self, start, values):
+        missing = values.isna().to_numpy()
+        end = start + len(values)
+        self.nulls[start:end] = missing
+        if self.dtype is None:
+            codes, uniques = pd.factorize(values)
+            mapping = np.array([self.lookup.setdefault(value, len(self.lookup)) for value in uniques],
+                               dtype=np.int32)
+            encoded = np.full(len(codes), -1, dtype=np.int32)
+            encoded[codes >= 0] = mapping[codes[codes >= 0]]
+            self.values[start:end] = encoded
+        elif self.dtype == 'bool':
+            self.values[start:end] = values.to_numpy(dtype=object) == 't'
+        else:
+            fill = np.nan if self.dtype.startswith('float') else 0
+            self.values[start:end] = values.fillna(fill).to_numpy().astype(self.dtype)
+
+    def close(self):
+        """Finishes the files and returns the column's manifest entry."""
+        entry = {'type': self.sql_type, 'file': f"{self.relative}.npy", 'nulls': None}
+        if self.dtype is None:
+            dictionary = np.array(list(self.lookup), dtype=str)
+            order = np.argsort(dictionary, kind='stable')
+            ranks = np.empty(len(order), dtype=np.int32)
+            ranks[order] = np.arange(len(order), dtype=np.int32)
+            present = self.values >= 0
+            self.values[present] = ranks[self.values[present]]
+            np.save(f"{self.path}.dict.npy", dictionary[order])
+            entry.update(dtype='int32', encoding='dictionary', dictionary=f"{self.relative}.dict.npy",
+                         distinct=len(order))
+        else:
+            entry.update(dtype=self.dtype, encoding='plain')
+            if self.nulls.any():
+                np.save(f"{self.path}.nulls.npy", self.nulls)
+                entry['nulls'] = f"{self.relative}.nulls.npy"
+        self.values.flush()
+        del self.values
+        return entry
+
+
+class _CsvChunks:
+    """
+    File-like target for COPY ... TO STDOUT (FORMAT csv). Whenever about
+    CHUNK_BYTES have arrived, the complete rows among them are parsed and
+    passed to `consume` as a DataFrame of strings, so a table is streamed
+    rather than held in memory or on disk as a whole. A newline ends a row
+    only outside quotes, i.e. after an even number of '"' since the last row
+    boundary (quotes inside a value are doubled).
+    """
+
+    def __init__(self, names, consume, chunk_bytes=CHUNK_BYTES):
+        self.names = names
+        self.consume = consume
+        self.chunk_bytes = chunk_bytes
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_bytes:
+            end = self._last_row_end()
+            if end:
+                self._parse(end)
+
+    def _last_row_end(self):
+        # The view is gone once this returns; the buffer can't shrink while one exists.
+        raw = np.frombuffer(self.buffer, dtype=np.uint8)
+        quotes = np.cumsum(raw == ord('"'))
+        ends = np.flatnonzero((raw == ord('\n')) & (quotes % 2 == 0))
+        return int(ends[-1]) + 1 if len(ends) else 0
+
+    def _parse(self, end):
+        chunk = pd.read_csv(io.BytesIO(bytes(self.buffer[:end])), header=None, names=self.names, dtype=object,
+                            na_values=[NULL_MARKER], keep_default_na=False)
+        del self.buffer[:end]
+        self.consume(chunk)
+
+    def close(self):
+        if self.buffer:
+            self._parse(len(self.buffer))
+
+
+def _export_table(cursor, directory, table):
+    columns = _table_columns(cursor, table)
+    if not columns:
+        print(f"  - Skipping {table}: no such table.")
+        return None
+    cursor.execute(f"SELECT COUNT(*) FROM {_quoted(table)}")
+    rows = cursor.fetchone()[0]
+    print(f"  - Exporting {table} ({rows} rows)...")
+    os.makedirs(os.path.join(directory, table), exist_ok=True)
+    names = [name for name, _ in columns]
+    select = ', '.join(_quoted(name) for name in names)
+    writers = [_ColumnWriter(directory, table, name, sql_type, rows) for name, sql_type in columns]
+    start = 0
+
+    def consume(chunk):
+        nonlocal start
+        for writer in writers:
+            values = chunk[writer.column]
+            if writer.dtype not in (None, 'bool'):
+                values = pd.to_numeric(values)
+            writer.write(start, values)
+        start += len(chunk)
+
+    chunks = _CsvChunks(names, consume)
+    cursor.copy_expert(f"COPY (SELECT {select} FROM {_quoted(table)}) TO STDOUT "
+                       f"WITH (FORMAT csv, NULL '{NULL_MARKER}')", chunks)
+    chunks.close()
+    if start != rows:
+        raise RuntimeError(f"{table}: COPY returned {start} rows, expected {rows}")
+    return {'rows': rows, 'columns': {writer.column: writer.close() for writer in writers}}
+
+
+def export_snapshot(directory, db_config=None, tables=SNAPSHOT_TABLES):
+    """
+    Dumps `tables` from PostgreSQL into `directory` as a columnar snapshot:
+    one .npy file per column (see _ColumnWriter) and a manifest.json listing
+    every table's row count and columns. All tables are read in one
+    REPEATABLE READ transaction, so they are consistent with each other.
+    The snapshot is built next to `directory` and then swapped in, so a
+    reader never sees a half-written one. Returns the manifest, or None on
+    failure.
+    """
+    db_config = db_config or DB_CONFIG
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    building = tempfile.mkdtemp(prefix='.snapshot_', dir=parent)
+    conn = None
+    try:
+        print(f"Connecting to database '{db_config['database']}'...")
+        conn = psycopg2.connect(**db_config)
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = conn.cursor()
+        schema_version = None
+        if _table_columns(cursor, 'schema_migrations'):
+            cursor.execute("SELECT MAX(version) FROM schema_migrations")
+            schema_version = cursor.fetchone()[0]
+
+        manifest = {'format': SNAPSHOT_FORMAT, 'database': db_config['database'], 'schema_version': schema_version,
+                    'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(), 'tables': {}}
+        for table in tables:
+            exported = _export_table(cursor, building, table)
+            if exported is not None:
+                manifest['tables'][table] = exported
+        conn.rollback()
+
+        with open(os.path.join(building, MANIFEST_FILE), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+        if os.path.exists(directory):
+            retired = f"{building}.old"
+            os.rename(directory, retired)
+            os.rename(building, directory)
+            shutil.rmtree(retired)
+        else:
+            os.rename(building, directory)
+        print(f"\nSnapshot of {len(manifest['tables'])} tables written to '{directory}'.")
+        return manifest
+
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        shutil.rmtree(building, ignore_errors=True)
+        return None
+    finally:
+        if conn is not None:
+            cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot written by export_snapshot(). Columns are
+    opened with np.load(mmap_mode='r'): nothing is read until it is used,
+    and processes opening the same snapshot share its pages in the OS page
+    cache.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE)) as manifest_file:
+            self.manifest = json.load(manifest_file)
+        if self.manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"'{directory}' has snapshot format {self.manifest.get('format')}, "
+                             f"expected {SNAPSHOT_FORMAT}")
+        self.tables = self.manifest['tables']
+
+    def _open(self, relative):
+        return np.load(os.path.join(self.directory, relative), mmap_mode='r')
+
+    def _entry(self, table, column):
+        return self.tables[table]['columns'][column]
+
+    def rows(self, table):
+        return self.tables[table]['rows']
+
+    def columns(self, table):
+        return list(self.tables[table]['columns'])
+
+    def raw(self, table, column):
+        """The stored array, memory-mapped: values, or dictionary codes for text columns."""
+        return self._open(self._entry(table, column)['file'])
+
+    def dictionary(self, table, column):
+        """Sorted distinct values of a text column (code i is dictionary[i]), or None for other columns."""
+        entry = self._entry(table, column)
+        return self._open(entry['dictionary']) if entry['encoding'] == 'dictionary' else None
+
+    def nulls(self, table, column):
+        """Boolean NULL mask of a column, or None when it has no NULLs."""
+        entry = self._entry(table, column)
+        if entry['encoding'] == 'dictionary':
+            codes = self.raw(table, column)
+            return codes < 0 if (codes < 0).any() else None
+        return self._open(entry['nulls']) if entry['nulls'] else None
+
+    def column(self, table, column):
+        """
+        A column as values: the memory-mapped array itself for numbers
+        without NULLs (and floats), float64 with NaN for NULLs in integers,
+        and an object array with None for NULL for text.
+        """
+        values = self.raw(table, column)
+        dictionary = self.dictionary(table, column)
+        if dictionary is not None:
+            decoded = np.empty(len(values), dtype=object)
+            present = values >= 0
+            decoded[present] = dictionary.astype(object)[values[present]]
+            return decoded
+        nulls = self.nulls(table, column)
+        if nulls is None or values.dtype.kind == 'f':
+            return values
+        if values.dtype.kind == 'b':
+            return np.where(nulls, None, values.astype(object))
+        return np.where(nulls, np.nan, values.astype(np.float64))
+
+    def table(self, table, columns=None):
+        """{column: column(table, column)} for `columns` (default: all)."""
+        return {column: self.column(table, column) for column in (columns or self.columns(table))}
+
+    def to_frame(self, table, columns=None):
+        """
+        A DataFrame of `table`. Text columns become pandas Categoricals over
+        the stored codes and dictionary, so they are not decoded row by row.
+        """
+        data = {}
+        for column in columns or self.columns(table):
+            dictionary = self.dictionary(table, column)
+            if dictionary is not None:
+                data[column] = pd.Categorical.from_codes(np.asarray(self.raw(table, column)),
+                                                         categories=pd.Index(dictionary.astype(object)))
+            else:
+                data[column] = self.column(table, column)
+        return pd.DataFrame(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write or inspect a memory-mappable columnar snapshot of the database.")
+    parser.add_argument('directory', help="Snapshot directory.")
+    parser.add_argument('--tables', nargs='+', default=list(SNAPSHOT_TABLES), help="Tables to export.")
+    parser.add_argument('--info', action='store_true', help="Print the tables of an existing snapshot instead.")
+    args = parser.parse_args()
+    if args.info:
+        snapshot = Snapshot(args.directory)
+        print(f"Snapshot of '{snapshot.manifest['database']}' (schema version {snapshot.manifest['schema_version']}), "
+              f"taken {snapshot.manifest['created_at']}:")
+        for name in snapshot.tables:
+            print(f"  {name}: {snapshot.rows(name)} rows, columns {', '.join(snapshot.columns(name))}")
+    else:
+        export_snapshot(args.directory, tables=args.tables)
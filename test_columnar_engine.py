@@ -0,0 +1,90 @@
+import unittest
+import pandas as pd
+
+from columnar_engine import ColumnarEngine
+
+MOVIES = [(1, 'Toy Story'), (2, 'Big'), (3, 'Larry Crowne'), (4, 'Unrated')]
+# (movie_id, name, character_name, cast_order)
+CAST = [(1, 'Tim Allen', 'Buzz Lightyear (voice)', 1), (1, 'Tom Hanks', 'Woody (voice)', 0),
+        (2, 'Tom Hanks', 'Josh Baskin', 0), (3, 'Tom Hanks', 'Larry Crowne', 0)]
+# (movie_id, name, department, job)
+CREW = [(1, 'John Lasseter', 'Directing', 'Director'), (1, 'Randy Newman', 'Sound', 'Original Music Composer'),
+        (3, 'Tom Hanks', 'Directing', 'Director'), (3, 'Tom Hanks', 'Writing', 'Screenplay')]
+USERS = [(1, 'Ann Lee', 'ann@example.com'), (2, 'Bo Chan', 'bo@example.com'), (3, 'Cy Diaz', 'cy@example.com')]
+# (user_id, movie_id, rating, timestamp)
+RATINGS = [(1, 1, 5.0, 10), (2, 1, 4.0, 11), (3, 1, 3.0, 12), (1, 2, 2.0, 13), (2, 2, 3.0, 14), (1, 3, 5.0, 15)]
+
+
+def _dimension(names):
+    return {name: number for number, name in enumerate(sorted(set(names)), start=1)}
+
+
+def build_engine():
+    """A ColumnarEngine over the small tables above, with credits keyed through the dimensions."""
+    people = _dimension([row[1] for row in CAST + CREW])
+    jobs = _dimension([row[3] for row in CREW])
+    departments = _dimension([row[2] for row in CREW])
+    cast = pd.DataFrame([(movie_id, number, character, f"credit{number}", 2, people[name], order)
+                         for number, (movie_id, name, character, order) in enumerate(CAST, start=1)],
+                        columns=['movie_id', 'cast_id', 'character_name', 'credit_id', 'gender', 'person_id',
+                                 'cast_order'])
+    crew = pd.DataFrame([(movie_id, f"crew{number}", departments[department], 2, jobs[job], people[name])
+                         for number, (movie_id, name, department, job) in enumerate(CREW, start=1)],
+                        columns=['movie_id', 'credit_id', 'department_id', 'gender', 'job_id', 'person_id'])
+    return ColumnarEngine.from_frames(
+        pd.DataFrame(MOVIES, columns=['id', 'title']),
+        pd.DataFrame([(number, name, None) for name, number in people.items()], columns=['id', 'name', 'profile_path']),
+        pd.DataFrame([(number, name) for name, number in jobs.items()], columns=['id', 'name']),
+        pd.DataFrame([(number, name) for name, number in departments.items()], columns=['id', 'name']),
+        cast, crew, pd.DataFrame(USERS, columns=['id', 'name', 'email']),
+        pd.DataFrame(RATINGS, columns=['user_id', 'movie_id', 'rating', 'timestamp']))
+
+
+class TestColumnarEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = build_engine()
+
+    def assert_frame(self, actual, rows, columns):
+        pd.testing.assert_frame_equal(actual.reset_index(drop=True), pd.DataFrame(rows, columns=columns),
+                                      check_dtype=False)
+
+    def test_rating_totals(self):
+        print("\nRunning test: Engine Rating Totals")
+        self.assert_frame(self.engine.get_top_rated_movies(min_ratings=1),
+                          [('Toy Story', 3, 4.0), ('Big', 2, 2.5)], ['title', 'num_ratings', 'avg_rating'])
+        self.assert_frame(self.engine.get_most_active_users(),
+                          [('Ann Lee', 'ann@example.com', 3), ('Bo Chan', 'bo@example.com', 2),
+                           ('Cy Diaz', 'cy@example.com', 1)], ['name', 'email', 'ratings_count'])
+        print("Test PASSED.")
+
+    def test_credits(self):
+        print("\nRunning test: Engine Credits")
+        self.assert_frame(self.engine.get_cast_of_movie('toy story'),
+                          [('Tom Hanks', 'Woody (voice)', 0), ('Tim Allen', 'Buzz Lightyear (voice)', 1)],
+                          ['name', 'character_name', 'cast_order'])
+        self.assert_frame(self.engine.get_director_of_movie('Toy Story'), [('John Lasseter', 'Director')],
+                          ['name', 'job'])
+        self.assert_frame(self.engine.search_movies_by_actor('Tom Hanks'),
+                          [('Big', 'Josh Baskin'), ('Larry Crowne', 'Larry Crowne'), ('Toy Story', 'Woody (voice)')],
+                          ['title', 'character_name'])
+        self.assert_frame(self.engine.find_movies_directed_by_actor('Tom Hanks'), [('Larry Crowne',)], ['title'])
+        self.assertTrue(self.engine.get_cast_of_movie('No Such Movie').empty)
+        print("Test PASSED.")
+
+    def test_writes_keep_rollups(self):
+        print("\nRunning test: Engine Writes")
+        self.engine.delete_rating(3, 1)
+        self.assertTrue(self.engine.get_specific_rating(3, 1).empty)
+        self.engine.insert_specific_rating(3, 2, 5.0, 20)
+        self.engine.insert_specific_rating(3, 99, 5.0, 21)
+        self.engine.update_user_email(2, 'bo@example.org')
+        self.assertTrue(self.engine.verify_rating_rollups().empty, "Rating rollups do not match the ratings.")
+        self.assert_frame(self.engine.get_top_rated_movies(min_ratings=1),
+                          [('Toy Story', 2, 4.5), ('Big', 3, 10 / 3)], ['title', 'num_ratings', 'avg_rating'])
+        self.assertEqual(self.engine.get_user_by_id(2)['email'].iloc[0], 'bo@example.org')
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
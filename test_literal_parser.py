@@ -0,0 +1,45 @@
+import ast
+import unittest
+
+from literal_parser import parse_literal
+
+
+class TestParseLiteral(unittest.TestCase):
+
+    def assert_parses_like_ast(self, text):
+        self.assertEqual(parse_literal(text), ast.literal_eval(text))
+
+    def test_single_quoted_strings(self):
+        print("\nRunning test: Single-Quoted Literals")
+        self.assert_parses_like_ast("[{'cast_id': 14, 'character': 'Woody (voice)', 'credit_id': '52fe4284c3a36847f8024f95', "
+                                    "'gender': 2, 'id': 31, 'name': 'Tom Hanks', 'order': 0, 'profile_path': None}]")
+        self.assert_parses_like_ast("[{'name': 'a', 'flag': True}, {'name': 'b', 'flag': False}]")
+        self.assert_parses_like_ast("[]")
+        print("Test PASSED.")
+
+    def test_double_quotes_and_escapes(self):
+        print("\nRunning test: Literals With Double Quotes And Escapes")
+        self.assert_parses_like_ast("""[{'character': "Dr. O'Brien", 'name': 'Jo "JJ" Smith'}]""")
+        self.assert_parses_like_ast(r"[{'character': 'It\'s me', 'name': 'Back\\slash'}]")
+        self.assert_parses_like_ast("[{'name': 'Ren\\xe9e', 'job': 'Director'}]")
+        print("Test PASSED.")
+
+    def test_words_inside_strings_are_kept(self):
+        print("\nRunning test: Constants Inside Strings")
+        self.assert_parses_like_ast("[{'character': 'None of the True False', 'name': None}]")
+        self.assert_parses_like_ast("""[{'character': "None's True", 'name': None}]""")
+        print("Test PASSED.")
+
+    def test_ast_fallback(self):
+        print("\nRunning test: Fallback To ast.literal_eval")
+        self.assert_parses_like_ast("[(1, 2), {'a': 1}]")
+        for bad in ("[{'name': 'Unclosed}]", "[{'name': }]", "not a literal"):
+            with self.assertRaises((ValueError, SyntaxError)):
+                parse_literal(bad)
+        with self.assertRaises(ValueError):
+            parse_literal(float('nan'))
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+
+import query_cache
+from query_cache import QueryCache, cache_key, tables_read, tables_written
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def test_tables_read_and_written(self):
+        print("\nRunning test: Tables Read And Written")
+        self.assertEqual(tables_read('SELECT * FROM movies m JOIN "cast" c ON c.movie_id = m.id'),
+                         frozenset({'movies', 'cast'}))
+        self.assertEqual(tables_written("UPDATE users SET email = %s WHERE id = %s"), frozenset({'users'}))
+        self.assertEqual(tables_written("DELETE FROM Ratings WHERE user_id = %s"), frozenset({'ratings'}))
+        self.assertEqual(tables_written("INSERT INTO ratings SELECT * FROM stage"), frozenset({'ratings'}))
+        print("Test PASSED.")
+
+    def test_cache_key_ignores_whitespace(self):
+        print("\nRunning test: Cache Keys")
+        self.assertEqual(cache_key("SELECT  1\n FROM movies", [1, [2, 3]]), cache_key("SELECT 1 FROM movies", (1, (2, 3))))
+        self.assertNotEqual(cache_key("SELECT 1 FROM movies", (1,)), cache_key("SELECT 1 FROM movies", (2,)))
+        print("Test PASSED.")
+
+    def test_lru_eviction(self):
+        print("\nRunning test: LRU Eviction")
+        cache = QueryCache(maxsize=2, ttl=None)
+        cache.put('a', 1, {'movies'})
+        cache.put('b', 2, {'movies'})
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, {'movies'})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (3, 1, 1, 2))
+        print("Test PASSED.")
+
+    def test_ttl_expiry(self):
+        print("\nRunning test: TTL Expiry")
+        cache = QueryCache(ttl=10.0)
+        with mock.patch.object(query_cache.time, 'monotonic', return_value=100.0):
+            cache.put('a', 1, {'movies'})
+        with mock.patch.object(query_cache.time, 'monotonic', return_value=109.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch.object(query_cache.time, 'monotonic', return_value=110.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual((cache.stats()['expirations'], cache.stats()['size']), (1, 0))
+        print("Test PASSED.")
+
+    def test_invalidate_tables(self):
+        print("\nRunning test: Table Invalidation")
+        cache = QueryCache(ttl=None)
+        cache.put('movies', 1, tables_read("SELECT * FROM movies"))
+        cache.put('joined', 2, tables_read("SELECT * FROM ratings r JOIN movies m ON m.id = r.movie_id"))
+        cache.put('users', 3, tables_read("SELECT * FROM users"))
+        self.assertEqual(cache.invalidate_tables(tables_written("DELETE FROM ratings WHERE user_id = %s")), 1)
+        self.assertEqual(cache.invalidate_tables({'Movies'}), 1)
+        self.assertEqual((cache.get('movies'), cache.get('joined'), cache.get('users')), (None, None, 3))
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
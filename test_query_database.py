@@ -1,25 +1,214 @@
+import hashlib
+import json
+import tempfile
 import unittest
+from unittest import mock
+import numpy as np
 import pandas as pd
 import os
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
+import query_database
+import ratings
+import resolver
+import schema_migrations
+import similar_movies
+import snapshot
+from columnar_engine import ColumnarEngine
+from copy_utils import copy_columns, copy_rows
+from credits import CAST_COLUMNS, CREW_COLUMNS
 from query_database import (
     get_top_rated_movies,
     get_most_active_users,
     get_cast_of_movie,
     get_director_of_movie,
+    get_similar_movies,
+    get_cast_of_movies,
+    get_directors_of_movies,
+    search_titles,
     search_movies_by_actor,
     find_movies_directed_by_actor,
     update_user_email,
     get_user_by_id,
     delete_rating,
     get_specific_rating,
-    insert_specific_rating
+    stream_ratings,
+    insert_specific_rating,
+    upsert_ratings,
+    verify_rating_rollups
 )
 
 EXPECTED_RESULTS_DIR = 'expected_results'
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+# QUERY_TEST_DATABASE=fixture runs the suite against a small database seeded
+# from the expected results (one per pytest-xdist worker) instead of the
+# full database in query_database.DB_CONFIG.
+TEST_DATABASE = os.environ.get('QUERY_TEST_DATABASE')
+# Movies named in the expected results get ids from here up; the filler
+# movies the top users rate are numbered from 1.
+NAMED_MOVIE_ID = 1000001
+FILLER_RATING = 3.0
+# The rating test_delete_rating deletes, seeded as one of user 1's.
+DELETED_RATING = (1, 110, 1.0, 1425941529)
+
+
+def _fixture_database_name():
+    worker = os.environ.get('PYTEST_XDIST_WORKER', 'main')
+    return f"{query_database.DB_CONFIG['database']}_test_{worker}"
+
+
+def _fixture_digest():
+    """Hash of the expected results, of this file, which seeds from them, and of the migrations."""
+    digest = hashlib.sha256()
+    migrations = [os.path.join(schema_migrations.MIGRATIONS_DIR, name)
+                  for name in sorted(os.listdir(schema_migrations.MIGRATIONS_DIR))]
+    for path in [os.path.join(EXPECTED_RESULTS_DIR, name) for name in sorted(os.listdir(EXPECTED_RESULTS_DIR))] + [
+            os.path.abspath(__file__), SCHEMA_FILE] + migrations:
+        with open(path, 'rb') as source:
+            digest.update(os.path.basename(path).encode())
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def _half_point_ratings(count, average):
+    """`count` ratings in half-point steps whose mean is as close to `average` as they allow."""
+    base, extra = divmod(round(average * count * 2), count)
+    values = np.full(count, base / 2)
+    values[:extra] += 0.5
+    return values
+
+
+def seed_fixture_database(conn, digest):
+    """
+    Fills a freshly migrated database with the rows the expected results
+    describe: the credits of the expected movies and people, and ratings
+    that give the top movies and users exactly their expected totals,
+    loaded with the managed indexes and foreign keys deferred. Each
+    top movie is rated by its own run of filler users, and each top user
+    rates a run of filler movies, so no (user, movie) pair repeats and no
+    filler ranks among the top. The similar movies are computed from those
+    ratings. Records `digest` in source_file_sync.
+    """
+    expected = {name: pd.read_csv(os.path.join(EXPECTED_RESULTS_DIR, f"expected_{name}.csv")).fillna('')
+                for name in ('top_movies', 'most_active_users', 'toy_story_cast', 'toy_story_director',
+                             'tom_hanks_movies', 'movies_directed_by_tom_hanks')}
+    top_movies, top_users = expected['top_movies'], expected['most_active_users']
+
+    titles = list(dict.fromkeys(list(top_movies['title']) + ['Toy Story'] + list(expected['tom_hanks_movies']['title'])
+                                + list(expected['movies_directed_by_tom_hanks']['title'])))
+    movie_ids = {title: NAMED_MOVIE_ID + position for position, title in enumerate(titles)}
+    filler_movies = int(top_users['ratings_count'].max())
+    filler_users = int(top_movies['num_ratings'].max())
+
+    cast = [('Toy Story', row.name, row.character_name, row.cast_order) for row in expected['toy_story_cast'].itertuples()]
+    cast += [(row.title, 'Tom Hanks', row.character_name, 0) for row in expected['tom_hanks_movies'].itertuples()
+             if (row.title, 'Tom Hanks', row.character_name) not in {credit[:3] for credit in cast}]
+    crew = [('Toy Story', row.name) for row in expected['toy_story_director'].itertuples()]
+    crew += [(title, 'Tom Hanks') for title in expected['movies_directed_by_tom_hanks']['title']]
+    person_ids = {name: number for number, name in
+                  enumerate(dict.fromkeys([credit[1] for credit in cast] + [credit[1] for credit in crew]), start=1)}
+
+    user_counts = top_users['ratings_count'].to_numpy()
+    rating_users = [np.repeat(np.arange(1, len(top_users) + 1), user_counts)]
+    rating_movies = [np.concatenate([np.arange(1, count + 1) for count in user_counts])]
+    rating_values = [np.full(int(user_counts.sum()), FILLER_RATING)]
+    for row in top_movies.itertuples():
+        rating_users.append(np.arange(len(top_users) + 1, len(top_users) + 1 + row.num_ratings))
+        rating_movies.append(np.full(row.num_ratings, movie_ids[row.title]))
+        rating_values.append(_half_point_ratings(row.num_ratings, row.avg_rating))
+    rating_users, rating_movies, rating_values = (np.concatenate(columns) for columns in
+                                                  (rating_users, rating_movies, rating_values))
+    user_id, movie_id, rating, timestamp = DELETED_RATING
+    rating_values[(rating_users == user_id) & (rating_movies == movie_id)] = rating
+
+    filler_user_ids = np.arange(len(top_users) + 1, len(top_users) + 1 + filler_users)
+    with conn.cursor() as cursor:
+        schema_migrations.drop_deferred_objects(cursor)
+        copy_columns(cursor, 'movies', ['id', 'title'],
+                     [np.arange(1, filler_movies + 1), np.char.add('Fixture movie ', np.arange(1, filler_movies + 1).astype(str))])
+        copy_rows(cursor, 'movies', ['id', 'title'], [(movie_ids[title], title) for title in titles])
+        copy_rows(cursor, '"users"', ['id', 'name', 'email'],
+                  [(number, row.name, row.email) for number, row in enumerate(top_users.itertuples(), start=1)])
+        copy_columns(cursor, '"users"', ['id', 'name', 'email'],
+                     [filler_user_ids, np.char.add('Fixture User ', filler_user_ids.astype(str)),
+                      np.char.add(np.char.add('fixture.user', filler_user_ids.astype(str)), '@example.com')])
+        copy_columns(cursor, 'ratings', ['user_id', 'movie_id', 'rating', 'timestamp'],
+                     [rating_users, rating_movies, rating_values, np.full(len(rating_users), timestamp)])
+        copy_rows(cursor, 'people', ['id', 'name', 'profile_path'], [(number, name, None) for name, number in person_ids.items()])
+        copy_rows(cursor, 'jobs', ['id', 'name'], [(1, 'Director')])
+        copy_rows(cursor, 'departments', ['id', 'name'], [(1, 'Directing')])
+        copy_rows(cursor, '"cast"', CAST_COLUMNS,
+                  [(movie_ids[title], number, character, f"fixture{number:06d}", 0, person_ids[name], order)
+                   for number, (title, name, character, order) in enumerate(cast, start=1)])
+        copy_rows(cursor, 'crew', CREW_COLUMNS,
+                  [(movie_ids[title], f"fixturecrew{number:06d}", 1, 0, 1, person_ids[name])
+                   for number, (title, name) in enumerate(crew, start=1)])
+        ratings.rebuild_rating_rollups(cursor)
+        schema_migrations.rebuild_deferred_objects(cursor)
+        similar_movies.update_neighbors(cursor, workers=1)
+        cursor.execute("INSERT INTO source_file_sync (source, sha256, row_count) VALUES (%s, %s, %s)",
+                       (EXPECTED_RESULTS_DIR, digest, len(rating_users)))
+    conn.commit()
+
+
+def fixture_database(db_config):
+    """
+    Config of this worker's fixture database. It is created and seeded when
+    missing or seeded from other expected results, and reused otherwise.
+    """
+    config = dict(db_config, database=_fixture_database_name())
+    digest = _fixture_digest()
+    try:
+        conn = psycopg2.connect(**config)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT sha256 FROM source_file_sync WHERE source = %s", (EXPECTED_RESULTS_DIR,))
+                row = cursor.fetchone()
+        finally:
+            conn.close()
+        if row is not None and row[0] == digest:
+            return config
+    except psycopg2.Error:
+        pass
+
+    print(f"Seeding fixture database '{config['database']}'...")
+    admin = psycopg2.connect(**dict(db_config, database='postgres'))
+    admin.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    with admin.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(config['database'])))
+        cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(config['database'])))
+    admin.close()
+    conn = psycopg2.connect(**config)
+    try:
+        schema_migrations.migrate(conn, SCHEMA_FILE)
+        seed_fixture_database(conn, digest)
+    finally:
+        conn.close()
+    return config
+
+
+def setUpModule():
+    """Points the suite at the fixture database if asked to, and starts query_database's test mode."""
+    if TEST_DATABASE == 'fixture':
+        query_database.close_pool()
+        query_database.DB_CONFIG.update(fixture_database(query_database.DB_CONFIG))
+        query_database.reset_resolver()
+    query_database.begin_test_mode()
+
+
+def tearDownModule():
+    query_database.end_test_mode()
+
 
 class TestDatabaseQueries(unittest.TestCase):
 
+    def tearDown(self):
+        """Every test's writes are rolled back, so tests need no cleanup and leave the database unchanged."""
+        query_database.rollback_test_changes()
+
     def assert_dataframes_equal(self, actual_df, expected_df):
         """Helper function to compare two DataFrames."""
         self.assertIsNotNone(actual_df, "Query returned None, expected a DataFrame.")
@@ -75,53 +264,292 @@ class TestDatabaseQueries(unittest.TestCase):
         self.assert_dataframes_equal(actual_results, expected_results)
         print("Test PASSED.")
 
+    def test_batch_lookups(self):
+        """Tests that the batch lookups return what the single-movie lookups do, per title and in order."""
+        print("\nRunning test: Batch Lookups")
+        titles = ['toy story', 'No Such Movie', 'Toy Story']
+        cast = get_cast_of_movies(titles)
+        self.assertEqual(list(cast['movie_title'].unique()), ['toy story', 'Toy Story'])
+        for title in ('toy story', 'Toy Story'):
+            self.assert_dataframes_equal(cast[cast['movie_title'] == title].drop(columns='movie_title'),
+                                         get_cast_of_movie('Toy Story'))
+        directors = get_directors_of_movies(titles)
+        self.assertEqual(list(directors['movie_title'].unique()), ['toy story', 'Toy Story'])
+        self.assert_dataframes_equal(directors[directors['movie_title'] == 'Toy Story'].drop(columns='movie_title'),
+                                     get_director_of_movie('Toy Story'))
+        print("Batch lookup verification PASSED.")
+
+    def test_search_titles(self):
+        """
+        Tests typeahead search by prefix and with a typo, and that a rename
+        passed to resolver.title_changes(), as update_movie_titles does,
+        is searchable and resolvable without rebuilding the resolver.
+        """
+        print("\nRunning test: Search Titles")
+        prefix = search_titles('toy sto')
+        self.assertIn(('Toy Story', 'prefix'), list(zip(prefix['title'], prefix['match'])))
+        typo = search_titles('toy stroy')
+        self.assertIn(('Toy Story', 'fuzzy'), list(zip(typo['title'], typo['match'])))
+
+        toy_story = int(prefix.loc[prefix['title'] == 'Toy Story', 'movie_id'].iloc[0])
+        try:
+            resolver.title_changes([(toy_story, 'Toy Story Renamed')])
+            renamed = search_titles('toy story ren')
+            self.assertEqual(renamed[renamed['match'] == 'prefix']['movie_id'].tolist(), [toy_story])
+            self.assertEqual(query_database.get_resolver().movie_ids('toy story renamed'), [toy_story])
+        finally:
+            query_database.reset_resolver()
+        print("Title search verification PASSED.")
+
+    def test_memory_backend_parity(self):
+        """
+        Tests that the memory backend, loaded from the same database, gives
+        the same results as PostgreSQL for every query with expected results.
+        """
+        print("\nRunning test: Memory Backend Parity")
+        if query_database.QUERY_BACKEND == 'memory':
+            self.skipTest("Compares the memory backend with PostgreSQL as the active backend.")
+        queries = [(get_top_rated_movies, ()), (get_most_active_users, ()), (get_cast_of_movie, ('Toy Story',)),
+                   (get_director_of_movie, ('Toy Story',)), (search_movies_by_actor, ('Tom Hanks',)),
+                   (find_movies_directed_by_actor, ('Tom Hanks',))]
+        expected = [function(*args) for function, args in queries]
+        query_database.set_backend('memory', ColumnarEngine.from_database(query_database.DB_CONFIG))
+        try:
+            for (function, args), postgres_results in zip(queries, expected):
+                with self.subTest(function.__name__):
+                    self.assert_dataframes_equal(function(*args), postgres_results)
+        finally:
+            query_database.set_backend('postgres')
+        print("Memory backend parity PASSED.")
+
     def test_update_user_email(self):
         """Tests an UPDATE operation by changing a user's email and verifying it."""
         print("\nRunning test: Update User Email")
         user_id_to_test = 1
         original_user_data = get_user_by_id(user_id_to_test)
         self.assertFalse(original_user_data.empty, "Could not fetch original user data.")
-        original_email = original_user_data['email'].iloc[0]
         new_email = 'test.update@example.com'
 
-        try:
-            update_user_email(user_id_to_test, new_email)
-            updated_user_data = get_user_by_id(user_id_to_test)
-            self.assertEqual(updated_user_data['email'].iloc[0], new_email)
-            print("Update verification PASSED.")
-        finally:
-            print("Cleaning up: reverting email change...")
-            update_user_email(user_id_to_test, original_email)
-            reverted_user_data = get_user_by_id(user_id_to_test)
-            self.assertEqual(reverted_user_data['email'].iloc[0], original_email)
-            print("Cleanup successful.")
+        update_user_email(user_id_to_test, new_email)
+        updated_user_data = get_user_by_id(user_id_to_test)
+        self.assertEqual(updated_user_data['email'].iloc[0], new_email)
+        print("Update verification PASSED.")
 
     def test_delete_rating(self):
         """
         Tests a DELETE operation by removing a specific rating.
-        This test is now self-contained and repeatable.
         """
         print("\nRunning test: Delete Rating")
-        user_id = 1
-        movie_id = 110
-        rating_to_test = (1.0, 1425941529)
+        user_id, movie_id, rating, timestamp = DELETED_RATING
 
         rating_before = get_specific_rating(user_id, movie_id)
         if rating_before.empty:
             print("Test setup: Inserting rating to be deleted...")
-            insert_specific_rating(user_id, movie_id, rating_to_test[0], rating_to_test[1])
+            insert_specific_rating(user_id, movie_id, rating, timestamp)
+
+        delete_rating(user_id, movie_id)
+        rating_after = get_specific_rating(user_id, movie_id)
+        self.assertTrue(rating_after.empty, "Rating was not deleted successfully.")
+        print("Delete verification PASSED.")
+
+    def test_upsert_ratings(self):
+        """
+        Tests the bulk upsert: a new rating is inserted, loading it again
+        changes nothing, a newer one replaces it, and the rollups follow.
+        """
+        print("\nRunning test: Upsert Ratings")
+        user_id, movie_id, rating, timestamp = DELETED_RATING
+        delete_rating(user_id, movie_id)
+
+        inserted = upsert_ratings([(user_id, movie_id, rating, timestamp)])
+        self.assertEqual((inserted['inserted'], inserted['updated']), (1, 0))
+        repeated = upsert_ratings([(user_id, movie_id, rating, timestamp)])
+        self.assertEqual((repeated['inserted'], repeated['updated'], repeated['unchanged']), (0, 0, 1))
+        updated = upsert_ratings([(user_id, movie_id, 4.5, timestamp + 1)])
+        self.assertEqual((updated['inserted'], updated['updated']), (0, 1))
+
+        rating_after = get_specific_rating(user_id, movie_id)
+        self.assertEqual(len(rating_after), 1)
+        self.assertEqual(float(rating_after['rating'].iloc[0]), 4.5)
+        self.assertTrue(verify_rating_rollups().empty, "Rating rollups do not match the ratings.")
+        print("Upsert verification PASSED.")
+
+    def test_insert_rating_without_primary_key(self):
+        """
+        Tests that a ratings table without its primary key, as partitioning
+        by timestamp range leaves it, still keeps one rating per user and
+        movie, and that the rollups follow.
+        """
+        print("\nRunning test: Insert Rating Without Primary Key")
+        if query_database.QUERY_BACKEND == 'memory':
+            self.skipTest("The memory backend has no ratings primary key.")
+        user_id, movie_id, rating, timestamp = DELETED_RATING
+        insert_specific_rating(user_id, movie_id, rating, timestamp)
+        query_database.run_commit_query("ALTER TABLE ratings DROP CONSTRAINT ratings_pkey")
+        query_database.forget_ratings_keyed()
+
+        insert_specific_rating(user_id, movie_id, rating, timestamp)
+        insert_specific_rating(user_id, movie_id, 4.5, timestamp + 1)
+        rating_after = get_specific_rating(user_id, movie_id)
+        self.assertEqual(len(rating_after), 1)
+        self.assertEqual(float(rating_after['rating'].iloc[0]), 4.5)
+        repeated = upsert_ratings([(user_id, movie_id, 4.5, timestamp + 1)])
+        self.assertEqual((repeated['inserted'], repeated['updated'], repeated['unchanged']), (0, 0, 1))
+        self.assertTrue(verify_rating_rollups().empty, "Rating rollups do not match the ratings.")
+        print("Keyless insert verification PASSED.")
+
+    def test_slow_query_log(self):
+        """
+        Tests that with a zero threshold every query reaches the slow-query
+        log, in memory and in the log file, with the query function that ran
+        it and its plan (not executed again for a write), and that the
+        per-statement stats count it.
+        """
+        print("\nRunning test: Slow Query Log")
+        if query_database.QUERY_BACKEND == 'memory':
+            self.skipTest("The memory backend does not run SQL.")
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'slow.jsonl')
+            query_database.enable_instrumentation(slow_query_ms=0, slow_log_path=log_path, explain_slow=True)
+            try:
+                get_user_by_id(1)
+                update_user_email(1, 'slow.user@example.com')
+                slow = query_database.slow_queries()
+                stats = query_database.query_stats()
+            finally:
+                query_database.disable_instrumentation()
+            with open(log_path) as log_file:
+                logged = [json.loads(line) for line in log_file]
 
+        self.assertEqual([(entry['caller'], entry['statement']) for entry in slow],
+                         [('get_user_by_id', 'get_user_by_id'), ('update_user_email', 'update_user_email')])
+        self.assertEqual(logged, json.loads(json.dumps(slow, default=str)))
+        self.assertIn('Actual Total Time', json.dumps(slow[0]['plan']))
+        self.assertNotIn('Actual Total Time', json.dumps(slow[1]['plan']))
+        self.assertEqual(get_user_by_id(1)['email'].iloc[0], 'slow.user@example.com')
+        calls = stats.set_index('statement')['calls']
+        self.assertEqual((calls['get_user_by_id'], calls['update_user_email']), (1, 1))
+        print("Slow query log verification PASSED.")
+
+    def test_query_cache(self):
+        """
+        Tests that the query cache serves a repeated read, and that writing a
+        table drops the cached reads of it so the next read sees the write.
+        """
+        print("\nRunning test: Query Cache")
+        if query_database.QUERY_BACKEND == 'memory':
+            self.skipTest("The memory backend does not go through the query cache.")
+        user_id, movie_id = DELETED_RATING[:2]
+        query_database.enable_query_cache()
         try:
+            get_user_by_id(user_id)
+            get_user_by_id(user_id)
+            stats = query_database.query_cache_stats()
+            self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+            update_user_email(user_id, 'cached.user@example.com')
+            self.assertEqual(get_user_by_id(user_id)['email'].iloc[0], 'cached.user@example.com')
+            self.assertFalse(get_specific_rating(user_id, movie_id).empty)
             delete_rating(user_id, movie_id)
-            rating_after = get_specific_rating(user_id, movie_id)
-            self.assertTrue(rating_after.empty, "Rating was not deleted successfully.")
-            print("Delete verification PASSED.")
+            self.assertTrue(get_specific_rating(user_id, movie_id).empty, "The cache served a deleted rating.")
+            stats = query_database.query_cache_stats()
+            self.assertEqual((stats['hits'], stats['misses']), (1, 4))
         finally:
-            print("Cleaning up: re-inserting deleted rating...")
-            insert_specific_rating(user_id, movie_id, rating_to_test[0], rating_to_test[1])
-            rating_reverted = get_specific_rating(user_id, movie_id)
-            self.assertFalse(rating_reverted.empty, "Cleanup failed: rating was not re-inserted.")
-            print("Cleanup successful.")
+            query_database.disable_query_cache()
+        print("Query cache verification PASSED.")
+
+    def test_similar_movies(self):
+        """
+        Tests that the movies similar to the most rated movie are the ones
+        with the highest cosine similarity of their ratings to its ratings.
+        """
+        print("\nRunning test: Similar Movies")
+        rated = pd.concat(stream_ratings()).dropna(subset=['rating'])
+        rated['rating'] = rated['rating'].astype(float)
+        counts = rated.groupby('movie_id').size()
+        rated = rated[rated['movie_id'].isin(counts[counts >= similar_movies.MIN_RATINGS].index)]
+        norms = np.sqrt((rated['rating'] ** 2).groupby(rated['movie_id']).sum())
+        movie_id = int(counts.idxmax())
+        pairs = rated.merge(rated[rated['movie_id'] == movie_id][['user_id', 'rating']], on='user_id',
+                            suffixes=('', '_other'))
+        products = (pairs['rating'] * pairs['rating_other']).groupby(pairs['movie_id']).sum().drop(movie_id)
+        expected = (products / (norms[products.index] * norms[movie_id])).sort_values(ascending=False)
+
+        similar = get_similar_movies(movie_id, k=10)
+        self.assertEqual(len(similar), min(10, int((expected > 0).sum())))
+        # The stored similarities are float32 sums over many thousands of ratings.
+        np.testing.assert_allclose(similar['similarity'], expected.iloc[:len(similar)], rtol=5e-3)
+        np.testing.assert_allclose(similar['similarity'], expected[similar['movie_id']], rtol=5e-3)
+        print("Similar movies verification PASSED.")
+
+    def test_snapshot_round_trip(self):
+        """
+        Tests that tables exported with snapshot.export_snapshot() read back
+        through Snapshot.to_frame() as they are in the database, NULLs,
+        empty strings and numbers included.
+        """
+        print("\nRunning test: Snapshot Round Trip")
+        if query_database.QUERY_BACKEND == 'memory':
+            self.skipTest("Snapshots are exported from PostgreSQL.")
+        tables = {'people': 'id', '"cast"': 'credit_id', 'movie_rating_stats': 'movie_id'}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot')
+            manifest = snapshot.export_snapshot(path, query_database.DB_CONFIG,
+                                                tables=[table.strip('"') for table in tables])
+            self.assertIsNotNone(manifest, "Snapshot export failed.")
+            exported = snapshot.Snapshot(path)
+            for table, key in tables.items():
+                expected = query_database.run_query(f"SELECT * FROM {table} ORDER BY {key}")
+                actual = exported.to_frame(table.strip('"')).sort_values(key).reset_index(drop=True)
+                self.assertEqual(exported.rows(table.strip('"')), len(expected))
+                for column in expected.columns:
+                    if isinstance(actual[column].dtype, pd.CategoricalDtype):
+                        for frame in (actual, expected):
+                            frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+                    elif expected[column].dtype == object:
+                        expected[column] = expected[column].astype(float)
+                pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+        print("Snapshot verification PASSED.")
+
+    def stored_neighbors(self):
+        return query_database.run_query("SELECT movie_id, rank, neighbor_id, similarity FROM movie_neighbors "
+                                        "ORDER BY movie_id, rank", name='stored_neighbors')
+
+    def test_incremental_neighbors(self):
+        """
+        Tests that an incremental neighbour refresh notices two users swapping
+        their ratings of a movie, which leaves its rating totals unchanged,
+        and ends with the lists a full rebuild computes.
+        """
+        print("\nRunning test: Incremental Neighbours")
+        if query_database.QUERY_BACKEND == 'memory':
+            self.skipTest("The memory backend computes neighbours on the fly.")
+        # The users with the most and the fewest ratings among those of the
+        # most rated movie, so some movie is rated by only one of them.
+        raters = query_database.run_query("""
+            SELECT r.movie_id, r.user_id, r.timestamp, u.num_ratings
+            FROM ratings r JOIN user_rating_stats u ON u.user_id = r.user_id
+            WHERE r.movie_id = (SELECT movie_id FROM movie_rating_stats ORDER BY num_ratings DESC, movie_id LIMIT 1)
+            ORDER BY u.num_ratings DESC, r.user_id
+        """, name='raters')
+        first, last = raters.iloc[0], raters.iloc[-1]
+        if first['num_ratings'] == last['num_ratings']:
+            self.skipTest("Every rater of the most rated movie rated as many movies.")
+        movie_id = int(first['movie_id'])
+        first_user, last_user = int(first['user_id']), int(last['user_id'])
+        timestamp = int(first['timestamp'])
+        upsert_ratings([(first_user, movie_id, 5.0, timestamp), (last_user, movie_id, 1.0, timestamp)])
+
+        with query_database.get_connection() as conn, conn.cursor() as cursor:
+            similar_movies.update_neighbors(cursor, workers=1)
+            upsert_ratings([(first_user, movie_id, 1.0, timestamp), (last_user, movie_id, 5.0, timestamp)])
+            with mock.patch.object(similar_movies, 'INCREMENTAL_LIMIT', 1.0):
+                refreshed = similar_movies.update_neighbors(cursor, incremental=True, workers=1)
+            self.assertEqual((refreshed['mode'], refreshed['changed']), ('incremental', 1))
+            incremental = self.stored_neighbors()
+            similar_movies.update_neighbors(cursor, workers=1)
+        pd.testing.assert_frame_equal(incremental, self.stored_neighbors(), check_dtype=False)
+        print("Incremental neighbours verification PASSED.")
 
 if __name__ == '__main__':
     unittest.main()
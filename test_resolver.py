@@ -0,0 +1,77 @@
+import unittest
+
+import resolver
+from resolver import Resolver, normalize, trigrams
+
+TITLES = [(1, 'Toy Story'), (2, 'Toy Story 2'), (3, 'Big'), (4, 'Amélie'), (5, 'big')]
+PEOPLE = [(10, 'Tom Hanks'), (11, 'Tim Allen'), (12, 'Tom Hanks')]
+
+
+class TestResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = Resolver(TITLES, PEOPLE)
+
+    def test_normalize_and_trigrams(self):
+        print("\nRunning test: Normalize And Trigrams")
+        self.assertEqual(normalize('  Amélie:  the--Movie '), 'amelie the movie')
+        self.assertEqual(trigrams('cat'), {'  c', ' ca', 'cat', 'at '})
+        self.assertEqual(trigrams(''), set())
+        print("Test PASSED.")
+
+    def test_exact_lookups(self):
+        print("\nRunning test: Resolver Exact Lookups")
+        self.assertEqual(self.resolver.movie_ids('TOY STORY'), [1])
+        self.assertEqual(self.resolver.movie_ids('Big'), [3, 5])
+        self.assertEqual(self.resolver.movie_ids('No Such Movie'), [])
+        self.assertEqual(self.resolver.person_ids('Tom Hanks'), [10, 12])
+        self.assertEqual(self.resolver.person_ids('tom hanks'), [])
+        self.assertEqual(self.resolver.title_of(4), 'Amélie')
+        print("Test PASSED.")
+
+    def test_prefix_then_fuzzy_search(self):
+        print("\nRunning test: Resolver Search")
+        self.assertEqual(self.resolver.search_titles('toy sto'),
+                         [(1, 'Toy Story', 'prefix', 1.0), (2, 'Toy Story 2', 'prefix', 1.0)])
+        self.assertEqual(self.resolver.search_titles('amelie')[0], (4, 'Amélie', 'prefix', 1.0))
+        typo = self.resolver.search_titles('toy stroy')
+        self.assertEqual([(movie_id, match) for movie_id, _, match, _ in typo][:2], [(1, 'fuzzy'), (2, 'fuzzy')])
+        self.assertTrue(all(score >= resolver.SIMILARITY_THRESHOLD for *_, score in typo))
+        self.assertEqual(len(self.resolver.search_titles('toy', limit=1)), 1)
+        self.assertEqual(self.resolver.search_titles('!!!'), [])
+        self.assertEqual([person_id for person_id, *_ in self.resolver.search_people('tim al')], [11])
+        print("Test PASSED.")
+
+    def test_updates_keep_indexes_current(self):
+        print("\nRunning test: Resolver Updates")
+        # Build the trigram index first so the updates have to maintain it.
+        self.resolver.search_titles('toy stroy')
+        self.resolver.update_titles([(1, 'Toy Story Renamed'), (6, 'Toy Soldiers'), (3, None)])
+        self.assertEqual(self.resolver.movie_ids('toy story renamed'), [1])
+        self.assertEqual(self.resolver.movie_ids('Toy Story'), [])
+        self.assertEqual(self.resolver.movie_ids('big'), [5])
+        self.assertEqual([movie_id for movie_id, _, match, _ in self.resolver.search_titles('toy so')
+                          if match == 'prefix'], [6])
+        self.assertIn(1, [movie_id for movie_id, _, match, _ in self.resolver.search_titles('toy story renamd')
+                          if match == 'fuzzy'])
+        # Enough rows for the bulk path, which sorts the keys once at the end.
+        self.resolver.update_people((person_id, f"Person {person_id}") for person_id in range(100, 250))
+        self.assertEqual([person_id for person_id, *_ in self.resolver.search_people('person 24')][:1], [240])
+        print("Test PASSED.")
+
+    def test_module_hooks_update_installed_resolver(self):
+        print("\nRunning test: Resolver Hooks")
+        previous = resolver.current()
+        try:
+            resolver.install(self.resolver)
+            resolver.title_changes([(7, 'Cars')])
+            resolver.people_added([(13, 'John Lasseter')])
+            self.assertEqual(self.resolver.movie_ids('cars'), [7])
+            self.assertEqual(self.resolver.person_ids('John Lasseter'), [13])
+        finally:
+            resolver.install(previous)
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from schema_migrations import _partition_bounds
+
+
+class TestPartitionBounds(unittest.TestCase):
+
+    def test_hash_bounds(self):
+        print("\nRunning test: Hash Partition Bounds")
+        self.assertEqual(_partition_bounds('hash', 2, None, None),
+                         ["FOR VALUES WITH (MODULUS 2, REMAINDER 0)", "FOR VALUES WITH (MODULUS 2, REMAINDER 1)"])
+        print("Test PASSED.")
+
+    def test_range_bounds(self):
+        print("\nRunning test: Range Partition Bounds")
+        self.assertEqual(_partition_bounds('range', 4, 100, 105),
+                         ["FOR VALUES FROM (MINVALUE) TO (101)", "FOR VALUES FROM (101) TO (102)",
+                          "FOR VALUES FROM (102) TO (103)", "FOR VALUES FROM (103) TO (MAXVALUE)"])
+        print("Test PASSED.")
+
+    def test_tiny_range_uses_fewer_partitions(self):
+        print("\nRunning test: Range Partition Bounds On A Tiny Span")
+        self.assertEqual(_partition_bounds('range', 8, 0, 1), ["FOR VALUES FROM (MINVALUE) TO (MAXVALUE)"])
+        self.assertEqual(_partition_bounds('range', 8, 0, 2),
+                         ["FOR VALUES FROM (MINVALUE) TO (1)", "FOR VALUES FROM (1) TO (MAXVALUE)"])
+        print("Test PASSED.")
+
+    def test_empty_range_is_rejected(self):
+        print("\nRunning test: Range Partition Bounds On An Empty Span")
+        with self.assertRaises(ValueError):
+            _partition_bounds('range', 8, 1, 1)
+        with self.assertRaises(ValueError):
+            _partition_bounds('range', 8, 2, 1)
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from similar_movies import compute_neighbors, rating_matrix, top_k
+
+# (user_id, movie_id, rating); user 1 rates movie 10 twice and the last rating counts.
+RATINGS = [(1, 10, 1.0), (1, 10, 5.0), (2, 10, 3.0), (3, 10, 4.0),
+           (1, 20, 4.0), (2, 20, 3.0), (3, 20, 5.0),
+           (1, 30, 1.0), (2, 30, 5.0), (4, 30, 2.0),
+           (3, 40, 2.0), (4, 40, 4.0), (5, 40, 1.0),
+           (5, 50, 3.0)]
+
+
+def brute_force(dense, k):
+    """Top-k cosine neighbours of every row of `dense`, computed directly."""
+    norms = np.linalg.norm(dense, axis=1)
+    results = []
+    for row in range(len(dense)):
+        scored = []
+        for other in range(len(dense)):
+            if other != row and norms[row] and norms[other]:
+                score = dense[row] @ dense[other] / (norms[row] * norms[other])
+                if score > 0:
+                    scored.append((-score, other))
+        results.append([(other, -score) for score, other in sorted(scored)[:k]])
+    return results
+
+
+class TestSimilarMovies(unittest.TestCase):
+
+    def setUp(self):
+        user_ids, movie_ids, ratings = (np.array(column) for column in zip(*RATINGS))
+        self.matrix, self.movie_ids = rating_matrix(user_ids, movie_ids, ratings, min_ratings=2)
+
+    def test_rating_matrix(self):
+        print("\nRunning test: Rating Matrix")
+        self.assertEqual(self.movie_ids.tolist(), [10, 20, 30, 40, 50])
+        self.assertEqual(self.matrix.shape, (5, 5))
+        norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=1)).ravel())
+        np.testing.assert_allclose(norms, [1, 1, 1, 1, 0], rtol=1e-6)
+        # The last of user 1's two ratings of movie 10 is the one kept.
+        row = self.matrix[0].toarray().ravel()
+        np.testing.assert_allclose(row / row[2], [5 / 4, 3 / 4, 1, 0, 0], rtol=1e-6)
+        print("Test PASSED.")
+
+    def test_neighbors_match_brute_force(self):
+        print("\nRunning test: Neighbors Match Brute Force")
+        k = 3
+        neighbors, scores = compute_neighbors(self.matrix, k=k, workers=1, block_rows=2)
+        expected = brute_force(self.matrix.toarray(), k)
+        for row, want in enumerate(expected):
+            found = [(int(other), float(score)) for other, score in zip(neighbors[row], scores[row]) if other >= 0]
+            self.assertEqual([other for other, _ in found], [other for other, _ in want])
+            np.testing.assert_allclose([score for _, score in found], [score for _, score in want], rtol=1e-5)
+        # Movie 50 has too few ratings for a vector, so it gets no neighbours.
+        self.assertEqual(neighbors[4].tolist(), [-1] * k)
+        subset, _ = compute_neighbors(self.matrix, rows=[3, 1], k=k, workers=1)
+        self.assertEqual(subset.tolist(), neighbors[[3, 1]].tolist())
+        print("Test PASSED.")
+
+    def test_top_k_orders_and_pads(self):
+        print("\nRunning test: Top K")
+        scores = np.array([[0.5, 0.9, 0.0, 0.5], [0.0, 0.0, 0.0, 0.0]], dtype=np.float32)
+        top, values = top_k(scores, 6)
+        self.assertEqual(top.tolist(), [[1, 0, 3, -1, -1, -1], [-1] * 6])
+        np.testing.assert_allclose(values[0], [0.9, 0.5, 0.5, 0, 0, 0])
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
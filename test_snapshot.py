@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from snapshot import MANIFEST_FILE, NULL_MARKER, SNAPSHOT_FORMAT, Snapshot, _ColumnWriter, _CsvChunks
+
+COLUMNS = [('id', 'integer'), ('title', 'text'), ('score', 'double precision'), ('votes', 'bigint'),
+           ('active', 'boolean')]
+# Two chunks of string values, as _export_table passes them to the writers.
+CHUNKS = [
+    pd.DataFrame({'id': ['1', '2', '3'], 'title': ['Toy Story', None, 'Big'], 'score': ['4.5', None, '2'],
+                  'votes': ['10', '20', None], 'active': ['t', 'f', None]}),
+    pd.DataFrame({'id': ['4', '5'], 'title': ['Big', 'Amélie'], 'score': ['3.25', '1'],
+                  'votes': ['40', '50'], 'active': ['t', 't']}),
+]
+
+
+def write_snapshot(directory):
+    """Writes CHUNKS as table 'items' of a snapshot in `directory`."""
+    os.makedirs(os.path.join(directory, 'items'))
+    rows = sum(len(chunk) for chunk in CHUNKS)
+    writers = [_ColumnWriter(directory, 'items', name, sql_type, rows) for name, sql_type in COLUMNS]
+    start = 0
+    for chunk in CHUNKS:
+        for writer in writers:
+            values = chunk[writer.column]
+            if writer.dtype not in (None, 'bool'):
+                values = pd.to_numeric(values)
+            writer.write(start, values)
+        start += len(chunk)
+    manifest = {'format': SNAPSHOT_FORMAT, 'tables': {
+        'items': {'rows': rows, 'columns': {writer.column: writer.close() for writer in writers}}}}
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()
+        write_snapshot(self.scratch.name)
+        self.snapshot = Snapshot(self.scratch.name)
+
+    def tearDown(self):
+        self.scratch.cleanup()
+
+    def test_columns_round_trip(self):
+        print("\nRunning test: Snapshot Columns Round Trip")
+        self.assertEqual(self.snapshot.rows('items'), 5)
+        self.assertEqual(self.snapshot.columns('items'), [name for name, _ in COLUMNS])
+        self.assertEqual(self.snapshot.raw('items', 'id').dtype, np.int32)
+        self.assertEqual(self.snapshot.column('items', 'id').tolist(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.snapshot.column('items', 'title').tolist(), ['Toy Story', None, 'Big', 'Big', 'Amélie'])
+        np.testing.assert_array_equal(self.snapshot.column('items', 'score'), [4.5, np.nan, 2, 3.25, 1])
+        np.testing.assert_array_equal(self.snapshot.column('items', 'votes'), [10, 20, np.nan, 40, 50])
+        self.assertEqual(self.snapshot.column('items', 'active').tolist(), [True, False, None, True, True])
+        self.assertIsNone(self.snapshot.nulls('items', 'id'))
+        self.assertEqual(self.snapshot.nulls('items', 'votes').tolist(), [False, False, True, False, False])
+        print("Test PASSED.")
+
+    def test_text_is_dictionary_encoded(self):
+        print("\nRunning test: Snapshot Dictionary Encoding")
+        self.assertEqual(self.snapshot.dictionary('items', 'title').tolist(), ['Amélie', 'Big', 'Toy Story'])
+        self.assertEqual(self.snapshot.raw('items', 'title').tolist(), [2, -1, 1, 1, 0])
+        self.assertIsNone(self.snapshot.dictionary('items', 'id'))
+        frame = self.snapshot.to_frame('items', ['id', 'title'])
+        self.assertIsInstance(frame['title'].dtype, pd.CategoricalDtype)
+        self.assertEqual(frame['title'].astype(object).where(frame['title'].notna(), None).tolist(),
+                         ['Toy Story', None, 'Big', 'Big', 'Amélie'])
+        print("Test PASSED.")
+
+    def test_unknown_format_is_rejected(self):
+        print("\nRunning test: Snapshot Format Check")
+        path = os.path.join(self.scratch.name, MANIFEST_FILE)
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        manifest['format'] = SNAPSHOT_FORMAT + 1
+        with open(path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        with self.assertRaises(ValueError):
+            Snapshot(self.scratch.name)
+        print("Test PASSED.")
+
+
+def copy_csv(rows):
+    """`rows` as COPY ... (FORMAT csv) would write them, with NULL_MARKER for None."""
+    def field(value):
+        return NULL_MARKER if value is None else '"' + value.replace('"', '""') + '"'
+    return ''.join(','.join(field(value) for value in row) + '\n' for row in rows).encode()
+
+
+class TestCsvChunks(unittest.TestCase):
+
+    def test_rows_are_not_split_across_chunks(self):
+        print("\nRunning test: CSV Chunks")
+        rows = [(str(number), f'line one\nline "{number}"' if number % 3 == 0 else f"plain {number}")
+                for number in range(40)]
+        rows.append(('40', None))
+        data = copy_csv(rows)
+        chunks = []
+        target = _CsvChunks(['id', 'text'], chunks.append, chunk_bytes=50)
+        # Newlines inside quoted values land in every position of the 7-byte writes.
+        for start in range(0, len(data), 7):
+            target.write(data[start:start + 7])
+        target.close()
+        self.assertGreater(len(chunks), 1)
+        frame = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(list(zip(frame['id'], frame['text'].where(frame['text'].notna(), None))), rows)
+        print("Test PASSED.")
+
+
+if __name__ == '__main__':
+    unittest.main()
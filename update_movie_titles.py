@@ -1,6 +1,11 @@
+import argparse
+import os
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+
+import resolver
+from copy_utils import copy_columns
+from credits import file_sha256
 
 DB_CONFIG = {
     'user': 'qaim.ali',
@@ -9,66 +14,116 @@ DB_CONFIG = {
     'database': 'movie_db'
 }
 
-METADATA_FILE = 'Users/qaim.ali/Downloads/movies/movies_metadata.csv' 
+METADATA_FILE = 'Users/qaim.ali/Downloads/movies/movies_metadata.csv'
+
+# Applies the staged titles in one statement: only rows whose title differs
+# are rewritten, and ids missing from movies are added. Returns one
+# (kind, id, title) row per changed or inserted movie.
+SYNC_TITLES_SQL = """
+    WITH changed AS (
+        UPDATE movies m SET title = t.title
+        FROM temp_titles t
+        WHERE m.id = t.id AND m.title IS DISTINCT FROM t.title
+        RETURNING m.id, m.title
+    ), inserted AS (
+        INSERT INTO movies (id, title)
+        SELECT t.id, t.title FROM temp_titles t
+        WHERE NOT EXISTS (SELECT 1 FROM movies m WHERE m.id = t.id)
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id, title
+    )
+    SELECT 'changed', id, title FROM changed
+    UNION ALL
+    SELECT 'inserted', id, title FROM inserted;
+"""
+
 
-conn = None
-try:
-    print(f"Reading movie metadata from '{METADATA_FILE}'...")
-    df = pd.read_csv(METADATA_FILE, low_memory=False)
-    
-    print("Cleaning and preparing data...")
+def read_titles(metadata_file):
+    """Valid, unique (id, title) pairs from movies_metadata.csv as a DataFrame."""
+    df = pd.read_csv(metadata_file, usecols=['id', 'title'], dtype={'id': str, 'title': str})
     df['id'] = pd.to_numeric(df['id'], errors='coerce')
     df.dropna(subset=['id', 'title'], inplace=True)
     df['id'] = df['id'].astype(int)
-    
     df.drop_duplicates(subset='id', keep='first', inplace=True)
-    
-    df = df[['id', 'title']]
-    
-    print(f"Found {len(df)} valid, unique movie titles to process.")
-
-    print(f"Connecting to database '{DB_CONFIG['database']}'...")
-    conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-
-    print("Preparing to update titles in the database...")
-    
-    cursor.execute("""
-        CREATE TEMP TABLE temp_titles (
-            id INT PRIMARY KEY,
-            title VARCHAR(255) NOT NULL
-        );
-    """)
-    print("Temporary table 'temp_titles' created.")
-
-    update_data = list(df.itertuples(index=False, name=None))
-    execute_values(
-        cursor,
-        "INSERT INTO temp_titles (id, title) VALUES %s",
-        update_data
-    )
-    print(f"Inserted {len(update_data)} records into the temporary table.")
+    return df
+
 
-    update_query = """
-        UPDATE movies
-        SET title = temp_titles.title
-        FROM temp_titles
-        WHERE movies.id = temp_titles.id;
+def sync_movie_titles(metadata_file=None, force=False):
     """
-    print("Executing final update from temporary table...")
-    cursor.execute(update_query)
-    
-    conn.commit()
-    print(f"\nSuccessfully updated {cursor.rowcount} movie titles!")
-
-except FileNotFoundError:
-    print(f"Error: The file '{METADATA_FILE}' was not found.")
-except Exception as e:
-    print(f"A critical error occurred: {e}")
-    if conn:
-        conn.rollback()
-finally:
-    if conn is not None:
-        cursor.close()
-        conn.close()
-        print("PostgreSQL connection is closed.")
+    Brings movies.title in line with `metadata_file` (default METADATA_FILE).
+    The titles are COPYed into a staging table, and only movies whose title
+    differs are updated; ids not yet in movies are inserted. The changed
+    titles are passed on to the in-process resolver, if one is loaded. The file's
+    SHA-256 is stored in source_file_sync, and a file that has not changed
+    since the last sync is skipped unless `force` is set.
+    Returns a dict with 'inserted', 'changed', 'unchanged' and 'skipped'.
+    """
+    metadata_file = metadata_file or METADATA_FILE
+    source = os.path.basename(metadata_file)
+    result = {'inserted': 0, 'changed': 0, 'unchanged': 0, 'skipped': False}
+    conn = None
+    try:
+        print(f"Hashing '{metadata_file}'...")
+        digest = file_sha256(metadata_file)
+
+        print(f"Connecting to database '{DB_CONFIG['database']}'...")
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT sha256 FROM source_file_sync WHERE source = %s", (source,))
+        row = cursor.fetchone()
+        if row is not None and row[0] == digest and not force:
+            print(f"'{source}' is unchanged since the last sync; skipping.")
+            result['skipped'] = True
+            return result
+
+        print(f"Reading movie metadata from '{metadata_file}'...")
+        df = read_titles(metadata_file)
+        print(f"Found {len(df)} valid, unique movie titles to process.")
+
+        cursor.execute("""
+            CREATE TEMP TABLE temp_titles (
+                id INT PRIMARY KEY,
+                title VARCHAR(255) NOT NULL
+            ) ON COMMIT DROP;
+        """)
+        copy_columns(cursor, 'temp_titles', ['id', 'title'], [df['id'].to_numpy(), df['title'].to_numpy()])
+        print(f"Copied {len(df)} records into the temporary table.")
+
+        print("Applying changed and new titles...")
+        cursor.execute(SYNC_TITLES_SQL)
+        synced = cursor.fetchall()
+        changed = sum(kind == 'changed' for kind, _, _ in synced)
+        inserted = len(synced) - changed
+        cursor.execute("""
+            INSERT INTO source_file_sync (source, sha256, row_count, synced_at) VALUES (%s, %s, %s, now())
+            ON CONFLICT (source) DO UPDATE
+            SET sha256 = EXCLUDED.sha256, row_count = EXCLUDED.row_count, synced_at = EXCLUDED.synced_at
+        """, (source, digest, len(df)))
+        conn.commit()
+        # Keeps an in-process title resolver (see resolver.py) current without a reload.
+        resolver.title_changes((movie_id, title) for _, movie_id, title in synced)
+
+        result.update(inserted=inserted, changed=changed, unchanged=len(df) - changed - inserted)
+        print(f"\nTitles synced: {inserted} inserted, {changed} changed, {result['unchanged']} unchanged.")
+
+    except FileNotFoundError:
+        print(f"Error: The file '{metadata_file}' was not found.")
+    except Exception as e:
+        print(f"A critical error occurred: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if conn is not None:
+            cursor.close()
+            conn.close()
+            print("PostgreSQL connection is closed.")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync movie titles from movies_metadata.csv.")
+    parser.add_argument('--file', default=METADATA_FILE, help="Path to movies_metadata.csv.")
+    parser.add_argument('--force', action='store_true', help="Sync even if the file is unchanged since the last run.")
+    args = parser.parse_args()
+    sync_movie_titles(args.file, force=args.force)